@@ -0,0 +1,72 @@
+"""Benchmark of the pure-Python bitboard minimax (`minimax_bb`) vs the Python
+minimax on the board (`minimax`) and the Rust one (`minimax_rs`, if the
+extension is built).
+
+- the first search: from the empty board, with empty caches (for `minimax_bb`
+  it solves every position, later searches are lookups)
+- a move: the mean time of a search in unfinished reachable positions
+"""
+import random
+import time
+
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.analysis import is_finished, reachable_positions, to_grid
+from tic_tac_toe.bitboard import VALUES, find_optimal_move_bb
+from tic_tac_toe.game import CROSS, TTTBoard, find_optimal_move
+
+N_POSITIONS = 300  # for the Python minimax, all of them take minutes
+
+
+def first_search(strategy) -> float:
+    """Seconds of a search from the empty board"""
+    grid = TTTBoard().grid
+    start = time.perf_counter()
+    strategy(grid, CROSS)
+    return time.perf_counter() - start
+
+
+def per_move(strategy, positions) -> float:
+    """Mean seconds of a search"""
+    start = time.perf_counter()
+    for grid, mark in positions:
+        strategy(grid, mark)
+    return (time.perf_counter() - start) / len(positions)
+
+
+def main() -> None:
+    random.seed(0)
+    positions = [
+        to_grid(position)
+        for position in reachable_positions()
+        if not is_finished(position)
+    ]
+    sample = random.sample(positions, N_POSITIONS)
+    engines = [("minimax_bb", find_optimal_move_bb), ("minimax", find_optimal_move)]
+    if HAS_RUST:
+        from tic_tac_toe import find_optimal_move_rs
+
+        engines.append(("minimax_rs", find_optimal_move_rs))
+    else:
+        print("The Rust extension isn't built, only Python engines")
+
+    VALUES[:] = bytes(len(VALUES))  # the first search of minimax_bb solves all
+    results = {}
+    for name, strategy in engines:
+        grids = sample if name == "minimax" else positions
+        results[name] = first_search(strategy), per_move(strategy, grids)
+        first, move = results[name]
+        print(
+            f"{name:>10}: first search {1000 * first:7.1f} ms, "
+            f"move {1e6 * move:8.1f} µs"
+        )
+
+    bb_first, bb_move = results.pop("minimax_bb")
+    for name, (first, move) in results.items():
+        print(
+            f"minimax_bb vs {name}: first search x{first / bb_first:.1f} faster, "
+            f"move x{move / bb_move:.1f} faster"
+        )
+
+
+if __name__ == "__main__":
+    main()
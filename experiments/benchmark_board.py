@@ -0,0 +1,81 @@
+"""Benchmark of Python board (TTTBoard) vs Rust board (TTTBoardRs).
+
+- per-move overhead: full games through GameConductor with fixed move sequences
+- per-search overhead: `find_optimal_move_rs(board.grid, mark)`, which converts
+  a grid on every call, vs `TTTBoardRs.find_optimal_move(mark)`
+"""
+import random
+import timeit
+
+from tic_tac_toe import TTTBoardRs, find_optimal_move_rs
+from tic_tac_toe.game import CROSS, GameConductor, TTTBoard, get_opposite_mark
+
+N_GAMES = 2_000
+N_SEARCHES = 200
+
+
+def random_games(n_games: int) -> list[list[tuple[int, int]]]:
+    """Move sequences of random games"""
+    random.seed(0)
+    games = []
+    for _ in range(n_games):
+        board = TTTBoard()
+        moves, mark = [], CROSS
+        while not board.is_game_over():
+            move = random.choice(
+                [
+                    (r, c)
+                    for r in range(3)
+                    for c in range(3)
+                    if board.is_move_legal((r, c))
+                ]
+            )
+            board.make_move(move, mark)
+            moves.append(move)
+            mark = get_opposite_mark(mark)
+        games.append(moves)
+    return games
+
+
+def play_games(board_factory, games) -> None:
+    for moves in games:
+        gc = GameConductor(board_factory)
+        handles = [gc.get_handle(CROSS), gc.get_handle()]
+        for n_move, move in enumerate(moves):
+            handles[n_move % 2](move)
+
+
+def search_positions(n_moves: int) -> list[tuple[TTTBoard, str]]:
+    """Positions after n random moves and mark to move"""
+    positions = []
+    for moves in random_games(N_SEARCHES):
+        board, mark = TTTBoard(), CROSS
+        for move in moves[:n_moves]:
+            board.make_move(move, mark)
+            mark = get_opposite_mark(mark)
+        positions.append((board, mark))
+    return positions
+
+
+if __name__ == "__main__":
+    games = random_games(N_GAMES)
+    n_moves = sum(map(len, games))
+    for name, factory in (("TTTBoard", TTTBoard), ("TTTBoardRs", TTTBoardRs)):
+        seconds = timeit.timeit(lambda: play_games(factory, games), number=1)
+        print(f"{name:>10}: {seconds / n_moves * 1e6:.2f} µs per move")
+
+    for n_moves in (0, 2, 4, 6):
+        positions = search_positions(n_moves)
+        rs_boards = [(TTTBoardRs(board.grid), mark) for board, mark in positions]
+        t_grid = timeit.timeit(
+            lambda: [find_optimal_move_rs(b.grid, mark) for b, mark in positions],
+            number=1,
+        )
+        t_board = timeit.timeit(
+            lambda: [b.find_optimal_move(mark) for b, mark in rs_boards], number=1
+        )
+        print(
+            f"search after {n_moves} moves: grid conversion "
+            f"{t_grid / len(positions) * 1e6:.1f} µs, "
+            f"Rust board {t_board / len(positions) * 1e6:.1f} µs per search"
+        )
@@ -0,0 +1,78 @@
+"""Benchmark of callback dispatch in `ConversationHandler` states.
+
+Before: one `CallbackQueryHandler` with regex per cell (checked in order),
+then `query.data` is parsed again.
+After: one handler per state and one dict lookup of a pre-parsed move.
+"""
+import timeit
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+from telegram.ext import CallbackQueryHandler
+from tic_tac_toe.bot_helpers import CELL_MOVES
+
+N_RUNS = 20_000
+
+
+async def dummy(update, context):
+    pass
+
+
+def old_parse_keyboard_move(data: str) -> tuple[int, int]:
+    """Parsing of cells before lookup table"""
+    if len(data) != 2:
+        raise ValueError("length of data from inlinekeyboard should be 2")
+    r, c = int(data[0]), int(data[1])
+    for dim in (r, c):
+        if not 0 <= dim <= 2:
+            raise ValueError(f"Some dimension in {r, c} not in range [0, 2]")
+    return r, c
+
+
+def make_update(data: str) -> Update:
+    user = User(id=1, first_name="user", is_bot=False)
+    message = Message(message_id=1, date=None, chat=Chat(id=1, type="private"))
+    query = CallbackQuery(
+        id="1", from_user=user, chat_instance="1", data=data, message=message
+    )
+    return Update(update_id=1, callback_query=query)
+
+
+# state CONTINUE_GAME_MULTIPLAYER before: 9 cells (parse move) + 2 buttons
+regex_handlers = [
+    *[
+        (CallbackQueryHandler(dummy, pattern="^" + f"{r}{c}" + "$"), True)
+        for r in range(3)
+        for c in range(3)
+    ],
+    (CallbackQueryHandler(dummy, pattern="^" + str(91) + "$"), False),
+    (CallbackQueryHandler(dummy, pattern="^" + str(92) + "$"), False),
+]
+routes = {**CELL_MOVES, "91": None, "92": None}
+router_handler = CallbackQueryHandler(dummy)
+
+
+def dispatch_regex(update: Update):
+    for handler, is_cell in regex_handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            if is_cell:
+                return old_parse_keyboard_move(update.callback_query.data)
+            return None
+
+
+def dispatch_router(update: Update):
+    if router_handler.check_update(update):
+        return routes.get(update.callback_query.data)
+
+
+if __name__ == "__main__":
+    updates = [make_update(data) for data in [*CELL_MOVES, "91", "92"]]
+    for update in updates:  # same routing
+        assert dispatch_regex(update) == dispatch_router(update)
+
+    for name, dispatch in (("regex", dispatch_regex), ("router", dispatch_router)):
+        seconds = timeit.timeit(
+            lambda: [dispatch(update) for update in updates], number=N_RUNS
+        )
+        per_update = seconds / (N_RUNS * len(updates)) * 1e6
+        print(f"{name:>6}: {per_update:.2f} µs per update")
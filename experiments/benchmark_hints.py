@@ -0,0 +1,69 @@
+"""Benchmark of a hint vs a normal move of a singleplayer game.
+
+- hint: results of 9 moves from the table (`hints.move_results`) and the cached
+  keyboard with them (`board_keyboard(grid, hints=True)`)
+- the same results by a search after every free cell (what a hint would cost
+  without the table)
+- move: a move of the player and of the bot (its search), and the keyboard
+"""
+import timeit
+
+from tic_tac_toe import find_optimal_move_rs
+from tic_tac_toe.analysis import is_finished, reachable_positions, to_grid
+from tic_tac_toe.bot_helpers import board_keyboard
+from tic_tac_toe.game import FREE_SPACE, TTTBoard, get_opposite_mark
+from tic_tac_toe.hints import move_results, results_table
+
+N_POSITIONS = 500
+
+
+def positions() -> list[tuple[list[list[str]], str]]:
+    """Unfinished positions with more than one free cell, and marks to move"""
+    result = []
+    for position in reachable_positions():
+        grid, mark = to_grid(position)
+        n_free = sum(cell == FREE_SPACE for row in grid for cell in row)
+        if not is_finished(position) and n_free > 1:
+            result.append((grid, mark))
+    return result[:: len(result) // N_POSITIONS][:N_POSITIONS]
+
+
+def hint(grid, mark) -> None:
+    move_results(grid)
+    board_keyboard(grid, hints=True)
+
+
+def search_per_cell(grid, mark) -> None:
+    for r in range(3):
+        for c in range(3):
+            if grid[r][c] == FREE_SPACE:
+                grid[r][c] = mark
+                find_optimal_move_rs(grid, get_opposite_mark(mark))
+                grid[r][c] = FREE_SPACE
+
+
+def move(grid, mark) -> None:
+    board = TTTBoard([row[:] for row in grid])
+    cell = next((r, c) for r in range(3) for c in range(3) if grid[r][c] == FREE_SPACE)
+    board.make_move(cell, mark)
+    if not board.is_game_over():
+        bot_mark = get_opposite_mark(mark)
+        board.make_move(find_optimal_move_rs(board.grid, bot_mark), bot_mark)
+    board_keyboard(board.grid)
+
+
+if __name__ == "__main__":
+    seconds = timeit.timeit(results_table, number=1)
+    print(f"table of hints: {seconds:.3f} s, once at startup")
+    samples = positions()
+    for grid, mark in samples:  # keyboards are built on first use
+        board_keyboard(grid, hints=True)
+    for name, func in (
+        ("hint", hint),
+        ("search per cell", search_per_cell),
+        ("move", move),
+    ):
+        seconds = timeit.timeit(
+            lambda: [func(grid, mark) for grid, mark in samples], number=1
+        )
+        print(f"{name:>15}: {seconds / len(samples) * 1e6:.1f} µs")
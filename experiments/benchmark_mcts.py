@@ -0,0 +1,75 @@
+"""Benchmark of Monte Carlo tree search (Python vs Rust).
+
+- playouts per second from the empty board
+- never loses with the default budget: a move in every reachable position is
+  checked against the solved game tree, and games against random and minimax
+- tree reuse: visits kept from the previous move during games
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tic_tac_toe.analysis import verify_strategy
+from tic_tac_toe.engines import get_strategy
+from tic_tac_toe.game import CROSS, ZERO, GameConductor, TTTBoard
+from tic_tac_toe.mcts import TREES
+
+N_GAMES = 50
+
+
+def playouts_per_second(engine: str, seconds: float = 1.0) -> float:
+    tree = TREES[engine](playouts=None, time_limit=seconds)
+    result = tree.search(TTTBoard().grid, CROSS)
+    return result.playouts / result.seconds
+
+
+def play_games(engine: str, opponent: str, n_games: int) -> tuple[int, int, int, float]:
+    """Wins, draws and losses of an engine (with a tree per game), mean reused
+    visits per search"""
+    strategy = get_strategy(opponent)
+    wins = draws = losses = reused = searches = 0
+    for n_game in range(n_games):
+        tree = TREES[engine]()
+        gc = GameConductor()
+        handle = gc.get_handle(CROSS if n_game % 2 else ZERO)
+        other = gc.get_handle(what_is_left=True)
+        while not gc.is_game_over:
+            grid = gc.game_board.grid
+            if handle.is_my_turn():
+                result = tree.search(grid, handle.mark)
+                handle(result.move)
+                reused += result.reused
+                searches += 1
+            else:
+                other(strategy(grid, other.mark))
+        if gc.result is None:
+            draws += 1
+        elif gc.result == handle.mark:
+            wins += 1
+        else:
+            losses += 1
+    return wins, draws, losses, reused / searches
+
+
+if __name__ == "__main__":
+    for engine in TREES:
+        print(f"{engine}: {playouts_per_second(engine):,.0f} playouts/s")
+
+    with ProcessPoolExecutor() as executor:
+        for engine in TREES:
+            report = verify_strategy(engine, executor)
+            print(
+                f"{engine}: {report.positions} positions, losses: {report.losses}, "
+                f"missed wins: {report.missed_wins} ({report.seconds:.2f} s)"
+            )
+            assert report.losses == 0, report.first_failure
+
+    for engine in TREES:
+        for opponent in ("random", "minimax_rs"):
+            start = time.perf_counter()
+            wins, draws, losses, reused = play_games(engine, opponent, N_GAMES)
+            print(
+                f"{engine} vs {opponent}: {wins} wins, {draws} draws, {losses} losses,"
+                f" reused visits/search: {reused:.0f}"
+                f" ({time.perf_counter() - start:.2f} s)"
+            )
+            assert losses == 0
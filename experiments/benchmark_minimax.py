@@ -8,13 +8,15 @@ import time
 from collections import defaultdict
 
 import numpy as np
-from tic_tac_toe import find_optimal_move_rs
+from tic_tac_toe import find_optimal_move_rs, simulate_games_rs
+from tic_tac_toe.engines import get_strategy, search_totals
 from tic_tac_toe.game import (
     CROSS,
     ZERO,
     GameConductor,
     Mark,
     find_optimal_move,
+    find_optimal_move_with_stats,
     random_available_move,
 )
 
@@ -165,3 +167,46 @@ print(f"diff in speed (times): {diff_times}")
 
 # При данных условиях реализация на Rust быстрее в 150 раз в самом начале,
 # потом разница уменьшается до десяти примерно
+
+
+# why the first move is slow: statistics of searches (process-wide counters)
+rs_with_stats = get_strategy("minimax_rs", stats=True)
+py_with_stats = get_strategy("minimax", stats=True)
+test_2_strategies(rs_with_stats, py_with_stats, n_games=5, first_mark=CROSS)
+test_2_strategies(rs_with_stats, py_with_stats, n_games=5, first_mark=ZERO)
+
+for engine in ("minimax_rs", "minimax"):
+    calls, totals = search_totals(engine)
+    print(
+        f"{engine}: {calls} searches, nodes/search: {totals.nodes / calls:.0f}, "
+        f"cutoffs/search: {totals.cutoffs / calls:.0f}, "
+        f"terminal/search: {totals.terminal_nodes / calls:.0f}, "
+        f"max depth: {totals.max_depth}, "
+        f"nodes/s: {totals.nodes / totals.seconds:,.0f}"
+    )
+
+_, first_move = find_optimal_move_with_stats(GameConductor().game_board.grid, CROSS)
+print(f"first move: {first_move}")
+
+
+# whole games in Rust: no Python between moves, games are played in threads
+t = time.perf_counter()
+test_2_strategies(find_optimal_move_rs, random_available_move, n_games=1000)
+print(f"games/s with moves from Python: {1000 / (time.perf_counter() - t):,.0f}")
+
+for strategy_x, strategy_o in [
+    ("random", "random"),
+    ("minimax", "random"),
+    ("random", "table"),
+    ("minimax", "table"),
+]:
+    x_wins, o_wins, draws, moves, seconds, _ = simulate_games_rs(
+        strategy_x, strategy_o, 2_000_000, seed=1
+    )
+    print(
+        f"{strategy_x} vs {strategy_o}: X {x_wins}, O {o_wins}, draws {draws}, "
+        f"{moves / 2_000_000:.2f} moves/game, {2_000_000 / seconds:,.0f} games/s"
+    )
+
+*_, moves = simulate_games_rs("minimax", "random", 5, seed=1, record_moves=True)
+print(f"recorded games:\n{np.frombuffer(moves, dtype=np.uint8).reshape(-1, 9)}")
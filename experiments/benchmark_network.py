@@ -0,0 +1,77 @@
+"""Benchmark of throughput of the bot by settings of the HTTP layer.
+
+The bot polls a local fake Bot API (`fake_api.FakeBotApi`) with a delay of
+every call like a real network. Every update is handled like a move: an answer
+and an edit of the board, one after another. Throughput is measured for sizes
+of the pool, with and without keep-alive, and for numbers of updates processed
+at once (`concurrent_updates`).
+"""
+import asyncio
+import time
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, MessageHandler
+from tic_tac_toe.fake_api import FakeBotApi, message_update
+from tic_tac_toe.network import NetworkSettings, application_builder
+
+N_UPDATES = 200
+LATENCY = 0.02
+
+
+async def throughput(settings: NetworkSettings) -> tuple[float, int, int]:
+    """Updates per second, connections opened and failed updates (a call waited
+    for a connection longer than `pool_timeout`)"""
+    api = FakeBotApi(latency=LATENCY)
+    await api.start()
+    done = asyncio.Event()
+    handled = failed = 0
+
+    async def move(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        nonlocal handled, failed
+        try:
+            message = await update.message.reply_text("board")
+            await message.edit_text("board after the move of the bot")
+        except TelegramError:
+            failed += 1
+        handled += 1
+        if handled == N_UPDATES:
+            done.set()
+
+    settings = settings._replace(base_url=api.base_url)
+    application = application_builder(api.token, settings).build()
+    application.add_handler(MessageHandler(None, move, block=False))
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        start = time.perf_counter()
+        for update_id in range(1, N_UPDATES + 1):
+            api.put_update(message_update(update_id, update_id, "move"))
+        await done.wait()
+        seconds = time.perf_counter() - start
+        await application.updater.stop()
+        await application.stop()
+    await api.stop()
+    return N_UPDATES / seconds, api.connections, failed
+
+
+async def main() -> None:
+    default = NetworkSettings()
+    for name, settings in (
+        ("pool 4", default._replace(pool_size=4, keepalive_connections=4)),
+        ("pool 16 (default)", default),
+        ("pool 16, no keep-alive", default._replace(keepalive_connections=0)),
+        ("pool 64", default._replace(pool_size=64, keepalive_connections=64)),
+        ("pool 256", default._replace(pool_size=256, keepalive_connections=256)),
+        ("one update at once", default._replace(concurrent_updates=1)),
+        ("256 updates at once", default._replace(concurrent_updates=256)),
+    ):
+        rate, connections, failed = await throughput(settings)
+        print(
+            f"{name:>24}: {rate:7.1f} updates/s, {connections} connections, "
+            f"{failed} failed"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
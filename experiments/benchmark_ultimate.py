@@ -0,0 +1,47 @@
+"""Benchmark of Ultimate tic tac toe engines.
+
+- move generation: random playouts on the Python bitboard (moves per second)
+- search: nodes per second of Python and Rust alpha-beta at a fixed depth,
+  and the depth reached in a time budget (as the bot thinks)
+"""
+import random
+import time
+
+from tic_tac_toe.ultimate import (
+    UltimateBoard,
+    search_ultimate,
+    search_ultimate_with_rust,
+)
+
+N_PLAYOUTS = 2_000
+DEPTH = 5
+TIME_BUDGET = 1.0
+
+
+def random_playouts(n_playouts: int) -> float:
+    """Moves per second of random games from the empty board"""
+    rng = random.Random(0)
+    board = UltimateBoard()
+    n_moves = 0
+    start = time.perf_counter()
+    for _ in range(n_playouts):
+        board.reset()
+        while moves := board.legal_moves():
+            board.play(*rng.choice(moves), board.side_to_move)
+        n_moves += board.n_moves
+    return n_moves / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"random playouts: {random_playouts(N_PLAYOUTS):,.0f} moves/s")
+
+    for name, search in [("py", search_ultimate), ("rs", search_ultimate_with_rust)]:
+        result = search(UltimateBoard(), time_limit=600, max_depth=DEPTH)
+        print(
+            f"{name} depth {DEPTH}: {result.nodes:,} nodes in {result.seconds:.3f} s "
+            f"({result.nodes / result.seconds:,.0f} nodes/s), move {result.move}"
+        )
+        result = search(UltimateBoard(), time_limit=TIME_BUDGET)
+        print(
+            f"{name} in {TIME_BUDGET} s: depth {result.depth}, {result.nodes:,} nodes"
+        )
@@ -1 +1,19 @@
-from .tic_tac_toe import find_optimal_move_rs  # noqa: F401
+# the Rust extension is optional: without it (not built, or on PyPy) engines
+# are Python ones, see engines.py and bitboard.py
+try:
+    from .tic_tac_toe import (  # noqa: F401
+        MCTSRs,
+        PositionDbRs,
+        TTTBoardRs,
+        canonical_rank_rs,
+        find_optimal_move_rs,
+        find_optimal_move_stats_rs,
+        rank_rs,
+        search_ultimate_rs,
+        simulate_games_rs,
+        unrank_rs,
+    )
+except ImportError:
+    HAS_RUST = False
+else:
+    HAS_RUST = True
@@ -0,0 +1,229 @@
+"""Exhaustive analysis of the game tree of 3x3 tic tac toe.
+
+It enumerates all 255,168 possible games, solves every reachable position and
+verifies that registered strategies never lose from any reachable position.
+Work is split across processes by the first move (enumeration) or by chunks
+of positions (verification).
+
+Positions are pairs of bitboards (crosses, zeros), cell (r, c) is bit 3 * r + c.
+
+Run: `python -m tic_tac_toe.analysis [--strategies minimax_rs mcts_rs mcts]`,
+the default is the fast engines, slow Python ones (minimax, mcts) are opt-in.
+"""
+
+import argparse
+import os
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from typing import Final, NamedTuple
+
+from tic_tac_toe.engines import STRATEGIES, get_strategy
+from tic_tac_toe.game import CROSS, FREE_SPACE, ZERO, Grid, Mark, Move
+from tic_tac_toe.ranking import Position, position_to_grid
+from tic_tac_toe.ultimate import FULL, IS_WIN
+
+DEFAULT_STRATEGIES: Final = tuple(
+    name
+    for name in ("minimax_rs", "minimax_bb", "random", "mcts_rs")
+    if name in STRATEGIES  # Rust engines are there if the extension is built
+)
+
+
+class GameTreeStats(NamedTuple):
+    """Number of games (paths from empty board to the end) by result"""
+
+    games: int = 0
+    cross_wins: int = 0
+    zero_wins: int = 0
+    draws: int = 0
+
+    def __add__(self, other: "GameTreeStats") -> "GameTreeStats":  # type: ignore
+        return GameTreeStats(*(a + b for a, b in zip(self, other)))
+
+
+class StrategyReport(NamedTuple):
+    """Result of verification of a strategy from all reachable positions.
+
+    Attributes:
+        name: name of the strategy
+        positions: number of checked positions
+        losses: positions where a move turns a draw or a win into a loss
+        missed_wins: positions where a move turns a win into a draw
+        seconds: wall time of verification
+        first_failure: first position (grid, mark) and move that lose
+    """
+
+    name: str
+    positions: int
+    losses: int
+    missed_wins: int
+    seconds: float
+    first_failure: tuple[Grid, Mark, Move] | None
+
+
+def free_cells(position: Position) -> Iterator[int]:
+    taken = position[0] | position[1]
+    return (cell for cell in range(9) if not taken >> cell & 1)
+
+
+def play(position: Position, cell: int) -> Position:
+    """Make a move for a side to move (crosses if numbers of marks are equal)"""
+    crosses, zeros = position
+    if crosses.bit_count() == zeros.bit_count():
+        return crosses | 1 << cell, zeros
+    return crosses, zeros | 1 << cell
+
+
+def count_games(position: Position = (0, 0)) -> GameTreeStats:
+    """Count all games that continue from position"""
+    crosses, zeros = position
+    if IS_WIN[crosses]:
+        return GameTreeStats(1, cross_wins=1)
+    if IS_WIN[zeros]:
+        return GameTreeStats(1, zero_wins=1)
+    if crosses | zeros == FULL:
+        return GameTreeStats(1, draws=1)
+    total = GameTreeStats()
+    for cell in free_cells(position):
+        total += count_games(play(position, cell))
+    return total
+
+
+@cache
+def solve(position: Position) -> int:
+    """Value of position for the side to move: 1 win, 0 draw, -1 loss"""
+    crosses, zeros = position
+    if IS_WIN[crosses] or IS_WIN[zeros]:  # previous player has won
+        return -1
+    if crosses | zeros == FULL:
+        return 0
+    return max(-solve(play(position, cell)) for cell in free_cells(position))
+
+
+def reachable_positions() -> list[Position]:
+    """All positions reachable from empty board, in order of the number of marks"""
+    layer = {(0, 0)}
+    positions = []
+    while layer:
+        positions.extend(sorted(layer))
+        layer = {
+            play(position, cell)
+            for position in layer
+            if not is_finished(position)
+            for cell in free_cells(position)
+        }
+    return positions
+
+
+def is_finished(position: Position) -> bool:
+    crosses, zeros = position
+    return IS_WIN[crosses] or IS_WIN[zeros] or crosses | zeros == FULL
+
+
+def to_grid(position: Position) -> tuple[Grid, Mark]:
+    """Convert position into grid and mark of the side to move"""
+    crosses, zeros = position
+    mark: Mark = CROSS if crosses.bit_count() == zeros.bit_count() else ZERO
+    return position_to_grid(position), mark
+
+
+def _verify_chunk(
+    name: str, positions: list[Position]
+) -> tuple[int, int, tuple[Grid, Mark, Move] | None]:
+    """Check moves of a strategy in positions. Returns losses, missed wins, failure"""
+    strategy = get_strategy(name)
+    losses = missed_wins = 0
+    first_failure = None
+    for position in positions:
+        grid, mark = to_grid(position)
+        move = strategy(grid, mark)
+        r, c = move
+        if not (0 <= r < 3 and 0 <= c < 3) or grid[r][c] != FREE_SPACE:
+            value_after = -1  # illegal move is as bad as a loss
+        else:
+            value_after = -solve(play(position, 3 * r + c))
+        value = solve(position)
+        if value_after < 0 <= value:
+            losses += 1
+            first_failure = first_failure or (to_grid(position)[0], mark, move)
+        elif value_after < value:
+            missed_wins += 1
+    return losses, missed_wins, first_failure
+
+
+def _chunks(items: list, n_chunks: int) -> Iterable[list]:
+    size = -(-len(items) // n_chunks)
+    return (items[i : i + size] for i in range(0, len(items), size))
+
+
+def verify_strategy(
+    name: str, executor: ProcessPoolExecutor | None = None
+) -> StrategyReport:
+    """Check a move of a strategy in every reachable unfinished position"""
+    start = time.perf_counter()
+    positions = [p for p in reachable_positions() if not is_finished(p)]
+    if executor is None:
+        results = [_verify_chunk(name, positions)]
+    else:
+        n_chunks = 4 * (os.cpu_count() or 1)
+        chunks = list(_chunks(positions, n_chunks))
+        results = list(executor.map(_verify_chunk, [name] * len(chunks), chunks))
+
+    failures = [failure for *_, failure in results if failure is not None]
+    return StrategyReport(
+        name=name,
+        positions=len(positions),
+        losses=sum(losses for losses, _, _ in results),
+        missed_wins=sum(missed for _, missed, _ in results),
+        seconds=time.perf_counter() - start,
+        first_failure=failures[0] if failures else None,
+    )
+
+
+def enumerate_games(executor: ProcessPoolExecutor | None = None) -> GameTreeStats:
+    """Count all games, subtrees of first moves are counted in parallel"""
+    first_moves = [play((0, 0), cell) for cell in range(9)]
+    if executor is None:
+        return sum(map(count_games, first_moves), GameTreeStats())
+    return sum(executor.map(count_games, first_moves), GameTreeStats())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--strategies",
+        nargs="+",
+        default=list(DEFAULT_STRATEGIES),
+        help="names of registered strategies to verify",
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(args.processes) as executor:
+        start = time.perf_counter()
+        stats = enumerate_games(executor)
+        print(
+            f"games: {stats.games}, X wins: {stats.cross_wins}, "
+            f"O wins: {stats.zero_wins}, draws: {stats.draws} "
+            f"({time.perf_counter() - start:.2f} s)"
+        )
+        positions = reachable_positions()
+        n_finished = sum(map(is_finished, positions))
+        print(f"reachable positions: {len(positions)}, finished: {n_finished}")
+
+        for name in args.strategies:
+            report = verify_strategy(name, executor)
+            print(
+                f"{name}: {report.positions} positions, losses: {report.losses}, "
+                f"missed wins: {report.missed_wins} ({report.seconds:.2f} s)"
+            )
+            if report.first_failure:
+                grid, mark, move = report.first_failure
+                board = "\n".join("".join(row) for row in grid)
+                print(f"first failure ({mark} to move, chose {move}):\n{board}")
+
+
+if __name__ == "__main__":
+    main()
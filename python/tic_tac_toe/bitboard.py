@@ -0,0 +1,71 @@
+"""Minimax on bitboards in pure Python, the engine when the Rust extension isn't
+built (e.g. on PyPy).
+
+`find_optimal_move` (game.py) is slow because of its board: every node checks
+marks, rescans the grid for a winner and the free cells. Here a position is
+two 9-bit masks, the side to move and the side that has just moved:
+
+- a win and free cells are lookups by mask (`IS_WIN`, `FREE_CELLS` of
+  ultimate.py), a move is `| BITS[cell]`, so a node allocates nothing but
+  small ints
+- values of positions are exact (-1, 0, 1 for the side to move) and kept in a
+  flat table by `own | other << 9` (256 KB), shared by X and O. There are only
+  5478 legal positions, the first search from the empty board fills all of
+  them, and later moves are 9 lookups
+
+Moves are the same as of the other minimax engines: the first cell in reading
+order with the best value.
+"""
+
+from typing import Final
+
+from tic_tac_toe.game import CROSS, ZERO, Grid, Mark, Move
+from tic_tac_toe.ranking import grid_to_position
+from tic_tac_toe.ultimate import FREE_CELLS, IS_WIN
+
+BITS: Final = tuple(1 << cell for cell in range(9))
+MOVES: Final = tuple(divmod(cell, 3) for cell in range(9))
+NO_MOVE: Final = (100, 100)  # like other engines on a full board
+
+# value + 2 of a position by own | other << 9, 0 if it isn't solved yet
+VALUES: Final = bytearray(1 << 18)
+
+
+def negamax(own: int, other: int) -> int:
+    """Value (-1 loss, 0 draw, 1 win) of a position for the side to move"""
+    key = own | other << 9
+    value = VALUES[key]
+    if value:
+        return value - 2
+    if IS_WIN[other]:
+        best = -1
+    else:
+        best = -1 if FREE_CELLS[own | other] else 0
+        for cell in FREE_CELLS[own | other]:
+            value = -negamax(other, own | BITS[cell])
+            if value > best:
+                best = value
+                if best == 1:
+                    break
+    VALUES[key] = best + 2
+    return best
+
+
+def find_optimal_move_bb(grid: Grid, mark: Mark) -> Move:
+    """Optimal move for mark (minimax on bitboards)
+
+    Raises:
+        ValueError: if mark is not X or O
+    """
+    if mark not in (CROSS, ZERO):
+        raise ValueError(f"{mark!r} can't make a move")
+    crosses, zeros = grid_to_position(grid)
+    own, other = (crosses, zeros) if mark == CROSS else (zeros, crosses)
+    best, move = -2, NO_MOVE
+    for cell in FREE_CELLS[own | other]:
+        value = -negamax(other, own | BITS[cell])
+        if value > best:
+            best, move = value, MOVES[cell]
+            if best == 1:
+                break
+    return move
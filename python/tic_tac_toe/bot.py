@@ -6,43 +6,83 @@ import asyncio
 import logging
 import os
 import random
-from typing import Collection
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from functools import partial
+from typing import Collection, Final, TypeAlias
 from warnings import filterwarnings
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import (
+    Bot,
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Update,
+)
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
+    filters,
 )
 from telegram.warnings import PTBUserWarning
 
-from tic_tac_toe import find_optimal_move_rs
+from tic_tac_toe import HAS_RUST
 from tic_tac_toe.bot_helpers import (
+    CELL_MOVES,
     GAME_RULES,
+    HINT_CALLBACK,
+    ULTIMATE_BACK,
+    ULTIMATE_BOARDS,
+    ULTIMATE_MOVES,
+    board_keyboard,
     get_full_user_name,
-    parse_keyboard_move,
+    parse_seconds,
+    render_board,
+    render_leaderboard,
     render_message_at_game_end,
+    render_spectator_message,
+    render_stats,
+    render_ultimate_message,
+    split_message,
     wide_message,
 )
-from tic_tac_toe.exceptions import (
-    InvalidMoveError,
-    NotEnoughPlayersError,
-)
+from tic_tac_toe.debounce import Debouncer
+from tic_tac_toe.engines import DEFAULT_ENGINE, get_strategy
+from tic_tac_toe.exceptions import InvalidMoveError, ProfilingError
 from tic_tac_toe.game import (
     CROSS,
+    FREE_SPACE,
     ZERO,
     GameConductor,
-    Grid,
+    GameConductorPool,
+    HandleForPlayer,
+    Mark,
+    Move,
+    TTTBoard,
     get_opposite_mark,
 )
-from tic_tac_toe.multiplayer import ChatId, MessageId, Multiplayer
-
-# get token using BotFather
-TOKEN = os.getenv("TIC_TAC_TOE_TOKEN_TG")  # I put it in zsh config
-assert TOKEN, "Token not found in env vars (TIC_TAC_TOE_TOKEN_TG)"
+from tic_tac_toe.hints import results_table
+from tic_tac_toe.logs import log_event, parse_sampling, setup_logging
+from tic_tac_toe.loop_monitor import LoopMonitor
+from tic_tac_toe.matchmaking import Matchmaker
+from tic_tac_toe.mcts import TREES
+from tic_tac_toe.metrics import REGISTRY, process_memory_bytes
+from tic_tac_toe.multiplayer import ChatId, GamePersonalized, MessageId, Multiplayer
+from tic_tac_toe.network import application_builder, load_settings
+from tic_tac_toe.profiling import Profiler
+from tic_tac_toe.ratings import Ratings, game_score
+from tic_tac_toe.reaper import IdleReaper
+from tic_tac_toe.replay import UpdateRecorder
+from tic_tac_toe.spectators import Spectators
+from tic_tac_toe.stats import StatsTable
+from tic_tac_toe.ultimate import UltimateBoard, search_ultimate_with_rust
+
+if HAS_RUST:
+    from tic_tac_toe import TTTBoardRs
 
 (
     CHOICE_GAME_TYPE,
@@ -50,24 +90,155 @@ assert TOKEN, "Token not found in env vars (TIC_TAC_TOE_TOKEN_TG)"
     CONTINUE_GAME_MULTIPLAYER,
     PLAY_AGAIN,
     MARK_CHOICE,
-) = range(5)
-START_AGAIN_CALLBACK, GOODBYE_CALLBACK = range(91, 93)
+    ULTIMATE_MARK_CHOICE,
+    CONTINUE_GAME_ULTIMATE,
+) = range(7)
+START_AGAIN_CALLBACK, GOODBYE_CALLBACK, REMATCH_CALLBACK = range(91, 94)
+
+PLAY_AGAIN_KEYBOARD: Final = [
+    [
+        InlineKeyboardButton(
+            "Yeah! I'm feeling lucky!!", callback_data=str(START_AGAIN_CALLBACK)
+        ),
+        InlineKeyboardButton(
+            "Nah... I am a big grumpy...", callback_data=str(GOODBYE_CALLBACK)
+        ),
+    ]
+]
+MARK_CHOICE_KEYBOARD: Final = [
+    [
+        InlineKeyboardButton(CROSS, callback_data="1"),
+        InlineKeyboardButton(ZERO, callback_data="2"),
+        InlineKeyboardButton("🤪", callback_data="3"),  # random
+    ]
+]
+# after a multiplayer game players can play again with each other (swapped marks)
+REMATCH_KEYBOARD: Final = [
+    [InlineKeyboardButton("Rematch!", callback_data=str(REMATCH_CALLBACK))],
+    *PLAY_AGAIN_KEYBOARD,
+]
+
+# matchmaking settings: how often to pair players and how long they can wait
+MATCHMAKING_TICK = float(os.getenv("TIC_TAC_TOE_MATCHMAKING_TICK", 0.5))
+MATCHMAKING_WAIT_TIMEOUT = float(os.getenv("TIC_TAC_TOE_MATCHMAKING_TIMEOUT", 300))
+# telegram user ids allowed to use admin commands (comma separated)
+ADMIN_IDS = frozenset(
+    int(user_id)
+    for user_id in os.getenv("TIC_TAC_TOE_ADMIN_IDS", "").split(",")
+    if user_id
+)
+# profiling sessions (by /profile command or SIGUSR1)
+PROFILE_DIR = os.getenv("TIC_TAC_TOE_PROFILE_DIR", "profiles")
+PROFILE_SECONDS = float(os.getenv("TIC_TAC_TOE_PROFILE_SECONDS", 30))
+MAX_PROFILE_SECONDS: Final = 600.0
+# keep boards of singleplayer games in Rust (TTTBoardRs) instead of Python,
+# if the extension is built
+USE_RUST_BOARD = HAS_RUST and os.getenv("TIC_TAC_TOE_RUST_BOARD", "0") == "1"
+# record statistics of bot searches into metrics (search_*{engine="minimax_rs"})
+SEARCH_STATS = os.getenv("TIC_TAC_TOE_SEARCH_STATS", "0") == "1"
+# engine of the singleplayer bot, minimax (210 IQ, in Rust or on bitboards in
+# Python without the extension) or MCTS (engines from mcts.TREES keep a search
+# tree for the whole game)
+BOT_ENGINE = os.getenv("TIC_TAC_TOE_BOT_ENGINE", DEFAULT_ENGINE)
+bot_strategy = get_strategy(BOT_ENGINE, stats=SEARCH_STATS and BOT_ENGINE not in TREES)
+# boards of finished singleplayer games are reused
+conductors = GameConductorPool(board_factory=TTTBoardRs if USE_RUST_BOARD else TTTBoard)
+ultimate_conductors = GameConductorPool(board_factory=UltimateBoard)
+# games without any activity for this number of seconds are dropped
+IDLE_GAME_TIMEOUT = float(os.getenv("TIC_TAC_TOE_IDLE_TIMEOUT", 900))
+# edits of spectators' messages per second (for all games together)
+SPECTATOR_RATE = float(os.getenv("TIC_TAC_TOE_SPECTATOR_RATE", 20))
+WATCH_LIST_SIZE: Final = 10
+# time budget of the bot's search in Ultimate tic tac toe
+ULTIMATE_THINK_SECONDS = float(os.getenv("TIC_TAC_TOE_ULTIMATE_THINK_SECONDS", 1))
+# the same button of a game pressed again within this time is a double tap
+DEBOUNCE_SECONDS = float(os.getenv("TIC_TAC_TOE_DEBOUNCE_SECONDS", 1.5))
+# ratings of players, written to SQLite every few seconds
+RATINGS_DB = os.getenv("TIC_TAC_TOE_RATINGS_DB", "ratings.sqlite3")
+RATINGS_FLUSH_SECONDS = float(os.getenv("TIC_TAC_TOE_RATINGS_FLUSH_SECONDS", 10))
+LEADERBOARD_SIZE: Final = 10
+# results of players for /stats, a snapshot is written every few minutes
+STATS_PATH = os.getenv("TIC_TAC_TOE_STATS_PATH", "stats.npz")
+STATS_SNAPSHOT_SECONDS = float(os.getenv("TIC_TAC_TOE_STATS_SNAPSHOT_SECONDS", 300))
+# health of the event loop (loop_monitor.py): lag above the threshold is logged,
+# asyncio debug mode finds slow steps of handlers, but slows the loop down
+LOOP_PROBE_SECONDS = float(os.getenv("TIC_TAC_TOE_LOOP_PROBE_SECONDS", 0.5))
+LOOP_LAG_THRESHOLD = float(os.getenv("TIC_TAC_TOE_LOOP_LAG_THRESHOLD", 0.1))
+ASYNCIO_DEBUG = os.getenv("TIC_TAC_TOE_ASYNCIO_DEBUG", "0") == "1"
+# anonymized incoming updates are appended here for replays (replay.py), if set
+RECORD_PATH = os.getenv("TIC_TAC_TOE_RECORD_PATH", "")
+# logs are written by a background thread, see logs.py. Sampling rates of events
+# (moves, handler latencies) are "event=rate,...", events without a rate are kept
+LOG_LEVEL = os.getenv("TIC_TAC_TOE_LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("TIC_TAC_TOE_LOG_JSON", "0") == "1"
+LOG_SAMPLING = parse_sampling(os.getenv("TIC_TAC_TOE_LOG_SAMPLING", "callback=0.1"))
 
 filterwarnings(
     action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning
 )
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+logger = logging.getLogger(__name__)
+
+Handler: TypeAlias = Callable[
+    [Update, ContextTypes.DEFAULT_TYPE], Awaitable[int | None]
+]
+
+ratings = Ratings(RATINGS_DB, RATINGS_FLUSH_SECONDS)
+user_stats = StatsTable(path=STATS_PATH, snapshot_interval=STATS_SNAPSHOT_SECONDS)
+# Initialize multiplayer class, players are paired with the closest rating
+multiplayer = Multiplayer(rating_of=ratings.rating)
+profiler = Profiler(PROFILE_DIR)
+# tracks activity in singleplayer and multiplayer games, see `reap_idle_games`
+reaper = IdleReaper(IDLE_GAME_TIMEOUT)
+spectators = Spectators(rate=SPECTATOR_RATE)
+# absorbs double taps in games, see `route_callbacks`
+debouncer = Debouncer(DEBOUNCE_SECONDS)
+loop_monitor = LoopMonitor(LOOP_PROBE_SECONDS, LOOP_LAG_THRESHOLD, ASYNCIO_DEBUG)
+recorder = UpdateRecorder(RECORD_PATH) if RECORD_PATH else None
+
+# user_data keys of an active singleplayer game
+SINGLEPLAYER_GAME_KEYS: Final = (
+    "GameConductor",
+    "handle_player",
+    "handle_bot",
+    "active_singleplayer_game",
+    "ultimate_board",  # selected sub-board in Ultimate
+    "mcts_tree",  # search tree of MCTS bot
 )
-# set higher logging level for httpx to avoid all GET and POST requests being logged
-logging.getLogger("httpx").setLevel(logging.WARNING)
 
-logger = logging.getLogger(__name__)
 
-# Initialize multiplayer class
-multiplayer = Multiplayer()
+def singleplayer_key(user_id: int) -> tuple[str, int]:
+    """Key of a singleplayer game for the reaper"""
+    return ("singleplayer", user_id)
+
+
+def multiplayer_key(game_id: int) -> tuple[str, int]:
+    """Key of a multiplayer game for the reaper, one for both players"""
+    return ("multiplayer", game_id)
+
+
+def singleplayer_update_key(update: Update) -> Hashable:
+    return singleplayer_key(update.effective_user.id)
+
+
+def multiplayer_tap_key(game_id: int, chat_id: ChatId) -> tuple[str, int, ChatId]:
+    """Key of a player in a multiplayer game for the debouncer. Taps are guarded
+    per player, not per game: both players may press "Rematch!" at once."""
+    return ("multiplayer", game_id, chat_id)
+
+
+def multiplayer_update_key(update: Update) -> Hashable | None:
+    """Player in a game who pressed a button, None if there is no game"""
+    chat_id = update.callback_query.message.chat_id
+    game = multiplayer.games.get(chat_id)
+    return None if game is None else multiplayer_tap_key(game.game_id, chat_id)
+
+
+def forget_multiplayer_game(game: GamePersonalized) -> None:
+    """Stop tracking a removed multiplayer game"""
+    reaper.forget(multiplayer_key(game.game_id))
+    for chat_id in (game.myself.chat_id, game.opponent.chat_id):
+        debouncer.forget(multiplayer_tap_key(game.game_id, chat_id))
 
 
 async def rules(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -76,12 +247,51 @@ async def rules(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await query.reply_text(text=GAME_RULES, parse_mode="MarkdownV2")
 
 
-def generate_keyboard(state: Grid) -> list[list[InlineKeyboardButton]]:
-    """Generate tic tac toe keyboard 3x3 using InlineKeyboardButton"""
-    return [
-        [InlineKeyboardButton(state[r][c], callback_data=f"{r}{c}") for c in range(3)]
+def generate_ultimate_keyboard(
+    board: UltimateBoard, selected: int | None = None
+) -> list[list[InlineKeyboardButton]]:
+    """Keyboard 3x3 of sub-boards or of cells of one sub-board.
+
+    Telegram allows only 8 buttons in a row, so 9x9 cells don't fit. If the next
+    sub-board is forced, cells are shown at once, otherwise a player chooses
+    a sub-board first (closed ones show their result).
+    """
+    sub = board.next_board if board.next_board is not None else selected
+    if sub is None:
+        labels = {None: "", FREE_SPACE: "#", CROSS: CROSS, ZERO: ZERO}
+        return [
+            [
+                InlineKeyboardButton(
+                    labels[board.board_state(3 * r + c)] or str(3 * r + c + 1),
+                    callback_data=f"ub{3 * r + c}",
+                )
+                for c in range(3)
+            ]
+            for r in range(3)
+        ]
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                board.select_cell((sub, 3 * r + c)),
+                callback_data=f"u{sub}{3 * r + c}",
+            )
+            for c in range(3)
+        ]
         for r in range(3)
     ]
+    if board.next_board is None:
+        keyboard.append(
+            [InlineKeyboardButton("Other boards", callback_data=ULTIMATE_BACK)]
+        )
+    return keyboard
+
+
+def release_conductor(gc: GameConductor) -> None:
+    """Return a conductor of a finished singleplayer game to its pool"""
+    if isinstance(gc.game_board, UltimateBoard):
+        ultimate_conductors.release(gc)
+    else:
+        conductors.release(gc)
 
 
 async def start_multichoice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -95,7 +305,8 @@ async def start_multichoice(update: Update, context: ContextTypes.DEFAULT_TYPE)
         [
             InlineKeyboardButton("Singleplayer", callback_data="1"),
             InlineKeyboardButton("Multiplayer", callback_data="2"),
-        ]
+        ],
+        [InlineKeyboardButton("Ultimate (vs bot)", callback_data="3")],
     ]
     if update.message:  # if update is message (/start), then send a new message
         make_message = update.message.reply_text
@@ -120,6 +331,11 @@ async def start_multichoice(update: Update, context: ContextTypes.DEFAULT_TYPE)
             text="You abandoned your old game with bot 🤖",
         )
         del context.user_data["active_singleplayer_game"]
+        reaper.forget(singleplayer_key(update.effective_user.id))
+        debouncer.forget(singleplayer_key(update.effective_user.id))
+        if "GameConductor" in context.user_data:
+            release_conductor(context.user_data.pop("GameConductor"))
+        context.user_data.pop("mcts_tree", None)
 
     # clean up old game in multiplayer
     # first check if player is in the queue
@@ -131,11 +347,19 @@ async def start_multichoice(update: Update, context: ContextTypes.DEFAULT_TYPE)
             chat_id=message.chat_id,
             message_id=player_last_game_info["message_id"],
         )
+    # finished game that was kept for a rematch
+    elif message.chat_id in multiplayer.games and multiplayer.is_game_over(
+        message.chat_id
+    ):
+        await close_finished_game(context.bot, message.chat_id)
     # and if this player has an active game
     elif message.chat_id in multiplayer.games:
         game = multiplayer.get_game(message.chat_id)
         # and report to user that current game is dropped
         multiplayer.remove_game(message.chat_id)
+        forget_multiplayer_game(game)
+        publish_to_spectators(game, text="This game was abandoned")
+        spectators.drop_game(game.game_id)
         await context.bot.edit_message_text(
             text=f"Your old game with {game.opponent.user_name} has been abandoned.",
             chat_id=game.myself.chat_id,
@@ -167,65 +391,55 @@ async def start_singleplayer(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
 
-    keyboard = [
-        [
-            InlineKeyboardButton(CROSS, callback_data="1"),
-            InlineKeyboardButton(ZERO, callback_data="2"),
-            InlineKeyboardButton("🤪", callback_data="3"),  # random
-        ]
-    ]
     await query.edit_message_text(
         wide_message("Which mark do you choose?"),
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=InlineKeyboardMarkup(MARK_CHOICE_KEYBOARD),
     )
 
     user = context.user_data["user_name"]
     context.user_data["game"] = f"{user}-bot"
     context.user_data["active_singleplayer_game"] = True
-    # logger.info(f"Player {user} want to start singleplayer game")
+    reaper.touch(singleplayer_key(update.effective_user.id))
 
     return MARK_CHOICE
 
 
-async def mark_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def mark_choice(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, mark: Mark | None
+) -> int:
     """Process mark choice from user in singleplayer game
     and show InlineKeyboard to start a game.
     If player is O, then player waits till a bot makes a move and updates keyboard.
+    If mark is None, player gets a random one.
     """
     query = update.callback_query
     await query.answer()
 
-    mark_choice = query.data
-    if mark_choice == "1":  # сомнительно, но окэй, better to use Enum maybe
-        mark = CROSS
-    elif mark_choice == "2":
-        mark = ZERO
-    elif mark_choice == "3":
+    if mark is None:
         mark = random.choice([CROSS, ZERO])
-    else:  # unexpected error
-        raise ValueError(f"Mark isn't identified: {mark_choice}") from None
 
-    gc = GameConductor()
+    gc = conductors.acquire()
     context.user_data["GameConductor"] = gc
     handle = gc.get_handle(mark)
     context.user_data["handle_player"] = handle
     context.user_data["handle_bot"] = gc.get_handle(what_is_left=True)
 
-    keyboard = generate_keyboard(gc.game_board.grid)
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = board_keyboard(gc.game_board.grid)
 
     my_mark = handle.mark
     if context.user_data["handle_player"].is_my_turn():
         text = rf"*It is your turn*\. Your mark: {my_mark}\."
     else:
         text = "Waiting for a bot to make a move"
-    await query.edit_message_text(
+    edit = query.edit_message_text(
         text=wide_message(text, escape=True),
         parse_mode="MarkdownV2",
         reply_markup=reply_markup,
     )
-    if not handle.is_my_turn():
-        await bot_turn(update, context)
+    if handle.is_my_turn():
+        await edit
+    else:
+        await bot_turn(update, context, edit)
 
     logger_message = (
         f"singleplayer game {context.user_data['game']} has begun, keyboard rendered"
@@ -234,98 +448,145 @@ async def mark_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return CONTINUE_GAME_SINGLEPLAYER
 
 
-async def game_singleplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def game_singleplayer(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, move: Move
+) -> int | None:
     """Main processing of the singleplayer game.
 
     After player's choice we give execution control to bot_turn async function.
     If game is ended after player's or bot's turn, then print results and ask about
-    next game.
+    next game. The button is answered together with the first edit, and the bot
+    thinks while the board with the player's move is sent.
     """
     query = update.callback_query
 
-    move = parse_keyboard_move(query.data)
-    # CONFUSED: как работать с логами? Надо все писать или менять уровень для
-    # обычных действий? или не писать рутинные действия?
-    # logger.info(f"player chose move {move}")
+    reaper.touch(singleplayer_key(update.effective_user.id))
 
     handle = context.user_data["handle_player"]
+    game_name = context.user_data["game"]
 
     try:
         handle(move)
     except InvalidMoveError as f:
         await query.answer(text=f"Illegal move: {str(f)}", show_alert=True)
-        # logger.info("player tried to make illegal move")
+        log_event(logger, "illegal_move", game=game_name, move=move)
         return CONTINUE_GAME_SINGLEPLAYER
+    debouncer.accept(singleplayer_update_key(update), query.data)
+    log_event(logger, "move", game=game_name, move=move, mark=handle.mark)
 
     gc: GameConductor = context.user_data["GameConductor"]
-    keyboard = generate_keyboard(gc.game_board.grid)
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
-        reply_markup=reply_markup, text=wide_message("Opponent's turn")
-    )
-    # logger.info(f"Player made move {move}, message rendered")
-    await query.answer()
-
     if gc.is_game_over:
         del context.user_data["active_singleplayer_game"]
-        return await end_singleplayer(update, context)
-    return await bot_turn(update, context)
+        return await end_singleplayer(update, context, query.answer())
 
+    reply_markup = board_keyboard(gc.game_board.grid)
+    edit = query.edit_message_text(
+        reply_markup=reply_markup, text=wide_message("Opponent's turn")
+    )
+    return await bot_turn(update, context, query.answer(), edit)
 
-async def bot_turn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Bot makes a move in a singleplayer game."""
-    query = update.callback_query
-    gc = context.user_data["GameConductor"]
-    board = gc.game_board
+
+async def think(context: ContextTypes.DEFAULT_TYPE) -> tuple[Move, float]:
+    """Search for a move of the bot in a thread, so calls to Telegram are sent
+    meanwhile. Returns the move and milliseconds of the search."""
+    board = context.user_data["GameConductor"].game_board
     handle = context.user_data["handle_bot"]
 
     # move = random_available_move(board.grid) # 10 IQ bot
     # move = find_optimal_move(board.grid, handle.mark)  # 210 IQ bot
-    move = find_optimal_move_rs(board.grid, handle.mark)  # 210 IQ, but in Rust
+    start = time.perf_counter()
+    if BOT_ENGINE in TREES:  # the tree of previous moves is reused
+        tree = context.user_data.setdefault("mcts_tree", TREES[BOT_ENGINE]())
+        result = await asyncio.to_thread(tree.search, board.grid, handle.mark)
+        move = result.move
+        REGISTRY.counter("mcts_playouts", engine=BOT_ENGINE).inc(result.playouts)
+        REGISTRY.counter("mcts_reused", engine=BOT_ENGINE).inc(result.reused)
+    elif SEARCH_STATS:  # metrics aren't thread-safe, the search is recorded here
+        move = bot_strategy(board.grid, handle.mark)
+    elif HAS_RUST and isinstance(board, TTTBoardRs):
+        # no conversion of the grid
+        move = await asyncio.to_thread(board.find_optimal_move, handle.mark)
+    else:
+        move = await asyncio.to_thread(bot_strategy, board.grid, handle.mark)
+    seconds = time.perf_counter() - start
 
-    # logger.info(f"bot chose move {move}")
+    # thinking simulation, the search is a part of it
+    sec_sleep = random.randint(2, 5) / 10
+    await asyncio.sleep(sec_sleep - seconds)
+    return move, round(1000 * seconds, 1)
 
-    assert board.is_move_legal(move), f"Bot move {move} is illegal"
 
-    # thinking simulation
-    sec_sleep = random.randint(2, 5) / 10
-    await asyncio.sleep(sec_sleep)
+async def bot_turn(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, *calls: Awaitable
+) -> int | None:
+    """Bot makes a move in a singleplayer game.
+
+    The bot thinks while `calls` to Telegram (the board before its move) are
+    sent. The player can drop the game (/start) while the bot thinks, then the
+    move is not made and the state of the conversation is left as it is.
+    """
+    query = update.callback_query
+    board = context.user_data["GameConductor"].game_board
+    handle = context.user_data["handle_bot"]
+    (move, think_ms), *_ = await asyncio.gather(think(context), *calls)
 
+    if not handle.is_valid():  # the conductor was released
+        log_event(logger, "stale_bot_move", game=context.user_data.get("game"))
+        return None
+    assert board.is_move_legal(move), f"Bot move {move} is illegal"
     handle(move)
-    # logger.info(f"bot made move {move}")
+    log_event(
+        logger,
+        "bot_move",
+        game=context.user_data["game"],
+        move=move,
+        engine=BOT_ENGINE,
+        think_ms=think_ms,
+    )
 
     gc: GameConductor = context.user_data["GameConductor"]
     if gc.is_game_over:
         del context.user_data["active_singleplayer_game"]
         return await end_singleplayer(update, context)
 
-    keyboard = generate_keyboard(gc.game_board.grid)
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = board_keyboard(gc.game_board.grid)
     await query.edit_message_text(
         reply_markup=reply_markup,
         text=wide_message(r"*Your turn*", escape=True),
         parse_mode="MarkdownV2",
     )
-    # logger.info(f"bot made move {move}, message rendered")
     return CONTINUE_GAME_SINGLEPLAYER
 
 
-async def end_singleplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Send a result and ask a player about next game."""
+async def end_singleplayer(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, *calls: Awaitable
+) -> int:
+    """Send a result (with other `calls` to Telegram at once) and ask a player
+    about next game."""
 
     game_name = context.user_data["game"]
-    # logger.info(f"{game_name} has ended")
     query = update.callback_query
 
     gc: GameConductor = context.user_data["GameConductor"]
     handle = context.user_data["handle_player"]
-    winner = gc.game_board.get_winner()
+    _, winner = render_board(gc.game_board)
+    score = game_score(winner, handle.mark)
+    user_id = update.effective_user.id
+    ratings.record_bot_game(
+        user_id, BOT_ENGINE, score, context.user_data.get("user_name")
+    )
+    user_stats.record(user_id, score, moves=9 - gc.game_board.n_empty_cells())
     mark_username_dict = {handle.mark: "Myself", get_opposite_mark(handle.mark): "Bot"}
     text = render_message_at_game_end(gc.game_board, handle.mark, mark_username_dict)
-    await query.answer()
-    await query.edit_message_text(text=text)
+    await asyncio.gather(query.edit_message_text(text=text), *calls)
 
     del context.user_data["bot_message"]  # since we don't touch this message any more
+    # release the finished game
+    for key in SINGLEPLAYER_GAME_KEYS:
+        context.user_data.pop(key, None)
+    release_conductor(gc)
+    reaper.forget(singleplayer_key(update.effective_user.id))
+    debouncer.forget(singleplayer_key(update.effective_user.id))
 
     if winner:
         winner = f"{mark_username_dict[winner]} ({winner})"
@@ -342,95 +603,266 @@ async def end_singleplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return PLAY_AGAIN
 
 
+async def start_ultimate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Start Ultimate tic tac toe with bot, ask about mark choice."""
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        wide_message("Ultimate. Which mark do you choose?"),
+        reply_markup=InlineKeyboardMarkup(MARK_CHOICE_KEYBOARD),
+    )
+
+    user = context.user_data["user_name"]
+    context.user_data["game"] = f"{user}-bot (ultimate)"
+    context.user_data["active_singleplayer_game"] = True
+    reaper.touch(singleplayer_key(update.effective_user.id))
+    return ULTIMATE_MARK_CHOICE
+
+
+async def show_ultimate_board(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str
+) -> None:
+    """Edit the game message with the board and a keyboard for the player."""
+    board: UltimateBoard = context.user_data["GameConductor"].game_board
+    keyboard = generate_ultimate_keyboard(
+        board, context.user_data.get("ultimate_board")
+    )
+    await update.callback_query.edit_message_text(
+        render_ultimate_message(board, text),
+        parse_mode="MarkdownV2",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+
+def ultimate_turn_text(board: UltimateBoard, mark: Mark) -> str:
+    if board.next_board is None:
+        return f"Your turn ({mark}). Choose any open board"
+    return f"Your turn ({mark}). Play in board {board.next_board + 1}"
+
+
+async def mark_choice_ultimate(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, mark: Mark | None
+) -> int | None:
+    """Start Ultimate game with the chosen mark (random if None)."""
+    await update.callback_query.answer()
+    if mark is None:
+        mark = random.choice([CROSS, ZERO])
+
+    gc = ultimate_conductors.acquire()
+    context.user_data["GameConductor"] = gc
+    handle = gc.get_handle(mark)
+    context.user_data["handle_player"] = handle
+    context.user_data["handle_bot"] = gc.get_handle(what_is_left=True)
+    context.user_data["ultimate_board"] = None
+    logger.info(f"ultimate game {context.user_data['game']} has begun")
+
+    if not handle.is_my_turn():
+        await show_ultimate_board(update, context, "Bot is thinking")
+        return await bot_turn_ultimate(update, context)
+    await show_ultimate_board(update, context, ultimate_turn_text(gc.game_board, mark))
+    return CONTINUE_GAME_ULTIMATE
+
+
+async def select_ultimate_board(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, sub_board: int | None
+) -> int:
+    """Show cells of a sub-board (or all sub-boards if None) to the player."""
+    query = update.callback_query
+    gc: GameConductor = context.user_data["GameConductor"]
+    board: UltimateBoard = gc.game_board
+    if sub_board is not None and board.board_state(sub_board) is not None:
+        await query.answer(text=f"Board {sub_board + 1} is closed", show_alert=True)
+        return CONTINUE_GAME_ULTIMATE
+    await query.answer()
+    context.user_data["ultimate_board"] = sub_board
+    handle = context.user_data["handle_player"]
+    await show_ultimate_board(update, context, ultimate_turn_text(board, handle.mark))
+    return CONTINUE_GAME_ULTIMATE
+
+
+async def game_ultimate(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, move: Move
+) -> int | None:
+    """Player's move in Ultimate, then bot's move."""
+    query = update.callback_query
+    reaper.touch(singleplayer_key(update.effective_user.id))
+    handle = context.user_data["handle_player"]
+    try:
+        handle(move)
+    except InvalidMoveError as f:
+        await query.answer(text=f"Illegal move: {str(f)}", show_alert=True)
+        return CONTINUE_GAME_ULTIMATE
+    debouncer.accept(singleplayer_update_key(update), query.data)
+    await query.answer()
+    context.user_data["ultimate_board"] = None
+
+    gc: GameConductor = context.user_data["GameConductor"]
+    if gc.is_game_over:
+        return await end_ultimate(update, context)
+    await show_ultimate_board(update, context, "Bot is thinking")
+    return await bot_turn_ultimate(update, context)
+
+
+async def bot_turn_ultimate(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int | None:
+    """Bot searches for ULTIMATE_THINK_SECONDS in a thread (Rust, without GIL).
+
+    As in bot_turn, a game dropped during the search gets no move.
+    """
+    gc: GameConductor = context.user_data["GameConductor"]
+    board: UltimateBoard = gc.game_board
+    handle = context.user_data["handle_bot"]
+    result = await asyncio.to_thread(
+        search_ultimate_with_rust, board, ULTIMATE_THINK_SECONDS
+    )
+    REGISTRY.counter("search_calls", engine="ultimate_rs").inc()
+    REGISTRY.counter("search_nodes", engine="ultimate_rs").inc(result.nodes)
+    if not handle.is_valid():
+        log_event(logger, "stale_bot_move", game=context.user_data.get("game"))
+        return None
+    handle(result.move)
+
+    if gc.is_game_over:
+        return await end_ultimate(update, context)
+    handle = context.user_data["handle_player"]
+    await show_ultimate_board(update, context, ultimate_turn_text(board, handle.mark))
+    return CONTINUE_GAME_ULTIMATE
+
+
+async def end_ultimate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Show the final board and ask about next game."""
+    gc: GameConductor = context.user_data["GameConductor"]
+    winner = gc.result
+    score = game_score(winner, context.user_data["handle_player"].mark)
+    user_id = update.effective_user.id
+    ratings.record_bot_game(
+        user_id, "ultimate_rs", score, context.user_data.get("user_name")
+    )
+    user_stats.record(user_id, score, moves=gc.game_board.n_moves)
+    if winner is None:
+        text = "It's a draw!"
+    elif winner == context.user_data["handle_player"].mark:
+        text = "You won! \N{Smiling Face with Sunglasses}"
+    else:
+        text = "You lost... \N{Melting Face}"
+    await update.callback_query.edit_message_text(
+        render_ultimate_message(gc.game_board, text), parse_mode="MarkdownV2"
+    )
+    logger.info(f"ultimate game {context.user_data['game']} has ended: {winner}")
+
+    del context.user_data["bot_message"]
+    for key in SINGLEPLAYER_GAME_KEYS:
+        context.user_data.pop(key, None)
+    release_conductor(gc)
+    reaper.forget(singleplayer_key(update.effective_user.id))
+    debouncer.forget(singleplayer_key(update.effective_user.id))
+
+    await wanna_play_again(update, context)
+    return PLAY_AGAIN
+
+
 async def start_multiplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Start multiplayer game by registering a player and if there were a player
-    in the queue, register a pair of players and start a game.
+    """Start multiplayer game by putting a player in the queue.
 
-    I thought a bit and believe that this implementation doesn't suffer
-    from race conditions (non-zero probability of misjudgement).
+    Pairing is done by the matchmaker in the background (see `notify_pair`).
     """
 
     query = update.callback_query
     await query.answer()
     user_name = context.user_data["user_name"]
 
-    # logger.info(f"Player {user_name} has joined")
     chat_id = query.message.chat_id
-    game = None
-
     message_id = context.user_data["bot_message"].message_id
 
+    # edit the message before joining the queue,
+    # otherwise this edit might overwrite the board sent by the matchmaker
+    await context.bot.edit_message_text(
+        chat_id=chat_id,
+        message_id=message_id,
+        text=wide_message("Waiting for anyone to join"),
+    )
+
     # we check in /start command that player doesn't play in multiplayer right now
     # so every exception must be a developer's error
     multiplayer.register_player(
-        chat_id=chat_id, message_id=message_id, user_name=user_name
+        chat_id=chat_id,
+        message_id=message_id,
+        user_name=user_name,
+        user_id=update.effective_user.id,
     )
 
-    try:
-        multiplayer.register_pair()
-        game = multiplayer.get_game(chat_id)
-        game_name = f"{game.opponent.user_name} vs {game.myself.user_name}"
-        logger_message = f"Multiplayer game {game_name} is registered"
-        logger.info(logger_message)
-
-        keyboard = generate_keyboard(game.game_conductor.game_board.grid)
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await context.bot.edit_message_text(
+    logger_message = f"{user_name} is waiting for opponent to join"
+    logger.info(logger_message)
+    return CONTINUE_GAME_MULTIPLAYER
+
+
+async def notify_pair(bot: Bot, game: GamePersonalized, rematch: bool = False) -> None:
+    """Show the board to both players of a new game (game of the first player)."""
+    game_name = f"{game.myself.user_name} vs {game.opponent.user_name}"
+    logger_message = f"Multiplayer game {game_name} is registered"
+    if rematch:
+        logger_message = f"Multiplayer game {game_name} is rematched"
+    logger.info(logger_message)
+    reaper.touch(multiplayer_key(game.game_id))
+
+    publish_to_spectators(game)
+
+    reply_markup = board_keyboard(game.game_conductor.game_board.grid)
+    joined = "accepted the rematch" if rematch else "has joined"
+    await asyncio.gather(
+        bot.edit_message_text(
             text=wide_message(
-                rf"*Make a move*\. Your opponent {game.myself.user_name} has joined\. "
-                rf"Your mark: {game.opponent.mark}\.",
+                rf"*Make a move*\. "
+                rf"Your opponent {game.opponent.user_name} {joined}\. "
+                rf"Your mark: {game.myself.mark}\.",
                 escape=True,
             ),
-            chat_id=game.opponent.chat_id,
-            message_id=game.opponent.message_id,
+            chat_id=game.myself.chat_id,
+            message_id=game.myself.message_id,
             reply_markup=reply_markup,
             parse_mode="MarkdownV2",
-        )
-        await context.bot.edit_message_text(
+        ),
+        bot.edit_message_text(
             text=wide_message(
-                f"Wait for an opponent's move ({game.opponent.mark}). "
-                f"Your opponent {game.opponent.user_name}. "
-                f"Your mark: {game.myself.mark}."
+                f"Wait for an opponent's move ({game.myself.mark}). "
+                f"Your opponent {game.myself.user_name}. "
+                f"Your mark: {game.opponent.mark}."
             ),
-            chat_id=game.myself.chat_id,
-            message_id=game.myself.message_id,
+            chat_id=game.opponent.chat_id,
+            message_id=game.opponent.message_id,
             reply_markup=reply_markup,
-        )
-        # logger_message += "Keyboards are rendered for players"
-        # logger.info(logger_message)
-
-    except NotEnoughPlayersError:
-        # If not enough players, print a message
-        # otherwise you would immediately see a board and wait for an opponent
-        await context.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=message_id,
-            text=wide_message("Waiting for anyone to join"),
-        )
+        ),
+    )
 
-        logger_message = f"{user_name} is waiting for opponent to join"
-        logger.info(logger_message)
-        return CONTINUE_GAME_MULTIPLAYER
 
-    return CONTINUE_GAME_MULTIPLAYER
+async def notify_evicted(bot: Bot, player: dict) -> None:
+    """Tell a player that nobody joined and offer to start again."""
+    logger.info(f"{player.get('user_name')} has left the queue by timeout")
+    await bot.edit_message_text(
+        chat_id=player["chat_id"],
+        message_id=player["message_id"],
+        text="Nobody has joined, sorry. Do you want to start again?",
+        reply_markup=InlineKeyboardMarkup(PLAY_AGAIN_KEYBOARD),
+    )
 
 
-async def game_multiplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def game_multiplayer(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, move: Move
+) -> int:
     """Process a move in a multiplayer game.
 
     If a move is valid, then update game state for two players.
     If this move ends the game, then send (edit) result to players and ask
-    about next game
+    about next game. The button is answered together with edits of both
+    players' messages.
     """
 
     query = update.callback_query
-
-    move = parse_keyboard_move(query.data)
-    # logger.info(f"player chose move {move}")
     chat_id = query.message.chat_id
 
     game = multiplayer.get_game(chat_id)
-    # game_name = f"{game.myself.user_name} {game.opponent.user_name}"
+    reaper.touch(multiplayer_key(game.game_id))
 
     gc = game.game_conductor
     handle = game.myself.handle
@@ -439,23 +871,40 @@ async def game_multiplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         handle(move)
     except InvalidMoveError as f:
         await query.answer(text=f"Illegal move: {str(f)}", show_alert=True)
-        # logger.info(f"{game_name}: player tried to make illegal move")
+        log_event(logger, "illegal_move", game=game.game_id, chat=chat_id, move=move)
         return CONTINUE_GAME_MULTIPLAYER
-    await query.answer()
-
-    # logger.info(f"Player made move {move}")
+    debouncer.accept(multiplayer_tap_key(game.game_id, chat_id), query.data)
+    publish_to_spectators(game)  # doesn't wait for spectators
+    log_event(
+        logger,
+        "move",
+        game=game.game_id,
+        chat=chat_id,
+        move=move,
+        mark=game.myself.mark,
+    )
 
-    keyboard = generate_keyboard(gc.game_board.grid)
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = board_keyboard(gc.game_board.grid)
 
     if gc.is_game_over:
+        score = game_score(gc.result, game.myself.mark)
+        ratings.record_game(
+            game.myself.player_id,
+            game.opponent.player_id,
+            score,
+            names=(game.myself.user_name, game.opponent.user_name),
+        )
+        moves = 9 - gc.game_board.n_empty_cells()
+        user_stats.record(game.myself.player_id, score, moves)
+        user_stats.record(game.opponent.player_id, 1 - score, moves)
         # make last edit to message with game result for two players
-        await end_multiplayer(context, game.myself.chat_id, game.myself.message_id)
-        await end_multiplayer(context, game.opponent.chat_id, game.opponent.message_id)
-        multiplayer.remove_game(chat_id)
-
-        # logger_message = game_name + ": Game is ended, and removed"
-        # logger.info(logger_message)
+        await asyncio.gather(
+            query.answer(),
+            end_multiplayer(context, game.myself.chat_id, game.myself.message_id),
+            end_multiplayer(context, game.opponent.chat_id, game.opponent.message_id),
+        )
+        # the game is kept for a rematch until a player leaves or it is reaped
+        reaper.touch(multiplayer_key(game.game_id))
 
         # send a new message for two players
         await wanna_play_again(
@@ -465,25 +914,181 @@ async def game_multiplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         )
         return CONTINUE_GAME_MULTIPLAYER
 
+    await asyncio.gather(
+        query.answer(),
+        query.edit_message_text(
+            text=wide_message(
+                f"Waiting for opponent. Opponent: {game.opponent.user_name}"
+            ),
+            reply_markup=reply_markup,
+        ),
+        context.bot.edit_message_text(
+            chat_id=game.opponent.chat_id,
+            message_id=game.opponent.message_id,
+            text=wide_message(
+                rf"*Your turn \({game.opponent.mark}\)*\. "
+                rf"Opponent: {game.myself.user_name}",
+                escape=True,
+            ),
+            parse_mode="MarkdownV2",
+            reply_markup=reply_markup,
+        ),
+    )
+    return CONTINUE_GAME_MULTIPLAYER
+
+
+async def show_hint(
+    query: CallbackQuery, gc: GameConductor, handle: HandleForPlayer, kind: str
+) -> None:
+    """Replace the keyboard of the player with results of moves (a table lookup)"""
+    if gc.is_game_over or not handle.is_my_turn():
+        await query.answer(text="Hints are shown on your turn")
+        return
+    await query.answer()
+    await query.edit_message_reply_markup(board_keyboard(gc.game_board.grid, True))
+    REGISTRY.counter("hints", kind=kind).inc()
+
+
+async def hint_singleplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    gc = context.user_data["GameConductor"]
+    handle = context.user_data["handle_player"]
+    await show_hint(update.callback_query, gc, handle, "singleplayer")
+    return CONTINUE_GAME_SINGLEPLAYER
+
+
+async def hint_multiplayer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    if query.message.chat_id not in multiplayer.games:
+        await query.answer()
+        return CONTINUE_GAME_MULTIPLAYER
+    game = multiplayer.get_game(query.message.chat_id)
+    await show_hint(query, game.game_conductor, game.myself.handle, "multiplayer")
+    return CONTINUE_GAME_MULTIPLAYER
+
+
+async def rematch_multiplayer(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    """Player wants a rematch. Game starts again when the opponent wants it too."""
+    query = update.callback_query
+    await query.answer()
+    chat_id = query.message.chat_id
+
+    if chat_id not in multiplayer.games:
+        await query.edit_message_text("Your opponent has left. Type /start to play")
+        return CONTINUE_GAME_MULTIPLAYER
+    if not multiplayer.is_game_over(chat_id):  # rematch has already started
+        return CONTINUE_GAME_MULTIPLAYER
+
+    # edit the message before the request, so it doesn't overwrite the board
     await query.edit_message_text(
-        text=wide_message(f"Waiting for opponent. Opponent: {game.opponent.user_name}"),
-        reply_markup=reply_markup,
+        wide_message("Waiting for your opponent to accept the rematch")
     )
+    game = multiplayer.request_rematch(chat_id, query.message.message_id)
+    if game is not None:
+        await notify_pair(context.bot, game, rematch=True)
+    return CONTINUE_GAME_MULTIPLAYER
 
-    await context.bot.edit_message_text(
-        chat_id=game.opponent.chat_id,
-        message_id=game.opponent.message_id,
-        text=wide_message(
-            rf"*Your turn \({game.opponent.mark}\)*\. "
-            rf"Opponent: {game.myself.user_name}",
-            escape=True,
-        ),
-        parse_mode="MarkdownV2",
-        reply_markup=reply_markup,
+
+def publish_to_spectators(game: GamePersonalized, text: str | None = None) -> None:
+    """Show the board (or a text) to spectators of the game. Rendered once."""
+    if not spectators.watchers(game.game_id):
+        return
+    if text is None:
+        gc = game.game_conductor
+        text = render_spectator_message(
+            gc.game_board,
+            {
+                game.myself.mark: game.myself.user_name,
+                game.opponent.mark: game.opponent.user_name,
+            },
+            gc.current_move,
+        )
+    spectators.publish(game.game_id, text)
+
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/watch [game_id]`: list live games or watch one of them."""
+    chat_id = update.message.chat_id
+    if not context.args:
+        games = multiplayer.live_games(limit=WATCH_LIST_SIZE)
+        if not games:
+            await update.message.reply_text("There are no games right now")
+            return
+        lines = [
+            f"/watch {game.game_id}: "
+            + " vs ".join(player.user_name for player in game.chat_dict.values())
+            for game in games
+        ]
+        await update.message.reply_text("\n".join(lines))
+        return
+
+    try:
+        game_id = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("Usage: /watch [game_id]")
+        return
+    game = multiplayer.get_game_by_id(game_id)
+    if game is None or game.game_conductor.is_game_over:
+        await update.message.reply_text("This game is not going on now")
+        return
+    if chat_id in game.chat_dict:
+        await update.message.reply_text("You can't watch your own game")
+        return
+
+    game_pers = multiplayer.get_game(next(iter(game.chat_dict)))
+    gc = game_pers.game_conductor
+    message = await update.message.reply_text(
+        render_spectator_message(
+            gc.game_board,
+            {player.mark: player.user_name for player in game.chat_dict.values()},
+            gc.current_move,
+        )
+    )
+    spectators.watch(game_id, chat_id, message.message_id)
+
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/top`: leaderboard and the rating of the player."""
+    user_id = update.effective_user.id
+    await update.message.reply_text(
+        render_leaderboard(
+            ratings.top(LEADERBOARD_SIZE),
+            ratings.players.get(user_id),
+            ratings.rank(user_id),
+            len(ratings),
+        )
     )
-    # logger.info(f"Player made move {move}, messages rendered")
 
-    return CONTINUE_GAME_MULTIPLAYER
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/stats`: results of the player in all games."""
+    await update.message.reply_text(
+        render_stats(user_stats.get(update.effective_user.id))
+    )
+
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/unwatch`: stop watching a game."""
+    if spectators.unwatch(update.message.chat_id) is None:
+        await update.message.reply_text("You don't watch any game")
+    else:
+        await update.message.reply_text("You stopped watching the game")
+
+
+async def close_finished_game(bot: Bot, chat_id: ChatId) -> None:
+    """Remove a game kept for a rematch and tell the opponent if they wait for it."""
+    game = multiplayer.get_game(chat_id)
+    opponent_message_id = multiplayer.get_rematch_request(game.opponent.chat_id)
+    multiplayer.remove_game(chat_id)
+    forget_multiplayer_game(game)
+    spectators.drop_game(game.game_id)
+    if opponent_message_id is not None:
+        await bot.edit_message_text(
+            text=f"{game.myself.user_name} has left. Type /start to play",
+            chat_id=game.opponent.chat_id,
+            message_id=opponent_message_id,
+        )
 
 
 async def end_multiplayer(
@@ -507,7 +1112,7 @@ async def end_multiplayer(
         text=text, chat_id=chat_id, message_id=message_id
     )
 
-    winner = gc.game_board.get_winner() or "Дружба"
+    winner = render_board(gc.game_board)[1] or "Дружба"
     logger_message = (
         f"multiplayer game {game_name} has ended, message rendered. winner: {winner}"
     )
@@ -526,16 +1131,7 @@ async def wanna_play_again(
             if None, then make a reply in current conversation (singlplayer)
             if not None, then send messages to these chat ids (multiplayer)
     """
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "Yeah! I'm feeling lucky!!", callback_data=str(START_AGAIN_CALLBACK)
-            ),
-            InlineKeyboardButton(
-                "Nah... I am a big grumpy...", callback_data=str(GOODBYE_CALLBACK)
-            ),
-        ]
-    ]
+    keyboard = PLAY_AGAIN_KEYBOARD
     text = "Do you want to play again?"
     if not chats_multiplayer:  # singleplayer
         query = update.callback_query
@@ -552,7 +1148,7 @@ async def wanna_play_again(
         message = await context.bot.send_message(
             chat_id=chat_id,
             text=text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=InlineKeyboardMarkup(REMATCH_KEYBOARD),
         )
 
 
@@ -567,14 +1163,243 @@ async def goodbye_sir(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         message_id=message.message_id,
         text="It was nice playing with you. Type /start if you want to play again",
     )
+    if message.chat_id in multiplayer.games and multiplayer.is_game_over(
+        message.chat_id
+    ):
+        await close_finished_game(context.bot, message.chat_id)
     del context.user_data["bot_message"]  # release memory (or it is done automatically)
     return ConversationHandler.END
 
 
-def main() -> None:
-    """Run the bot"""
-    application = Application.builder().token(TOKEN).build()
+async def reap_idle_games(application: Application, keys: list[tuple]) -> None:
+    """Drop idle games: edit their messages and release all state."""
+    edits = []
+    for kind, *key in keys:
+        if kind == "singleplayer":
+            (user_id,) = key
+            user_data = application.user_data.get(user_id)
+            if not user_data or "active_singleplayer_game" not in user_data:
+                continue  # game is already finished or dropped
+            bot_message = user_data.pop("bot_message")
+            if "GameConductor" in user_data:
+                release_conductor(user_data["GameConductor"])
+            for data_key in SINGLEPLAYER_GAME_KEYS:
+                user_data.pop(data_key, None)
+            edits.append((bot_message.chat_id, bot_message.message_id))
+        else:
+            (game_id,) = key
+            game = multiplayer.get_game_by_id(game_id)
+            if game is None:
+                continue  # game is already dropped
+            chat_id = next(iter(game.chat_dict))
+            if game.game_conductor.is_game_over:  # nobody wanted a rematch
+                edits.extend(
+                    (player, message_id)
+                    for player in game.chat_dict
+                    if (message_id := multiplayer.get_rematch_request(player))
+                )
+            else:
+                edits.extend(
+                    (player.chat_id, player.message_id)
+                    for player in game.chat_dict.values()
+                )
+                publish_to_spectators(
+                    multiplayer.get_game(chat_id),
+                    text="This game was dropped due to inactivity",
+                )
+            for player in game.chat_dict:
+                debouncer.forget(multiplayer_tap_key(game_id, player))
+            multiplayer.remove_game(chat_id)
+            spectators.drop_game(game_id)
+        REGISTRY.counter("reaped_games", kind=kind).inc()
+
+    results = await asyncio.gather(
+        *[
+            application.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text="This game was dropped due to inactivity. Type /start to play",
+            )
+            for chat_id, message_id in edits
+        ],
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):  # e.g. message was deleted by user
+            logger.warning(f"can't edit message of idle game: {result}")
+
+
+async def start_matchmaking(application: Application) -> None:
+    """Start background matchmaking when the application is initialized."""
+    matchmaker = Matchmaker(
+        multiplayer,
+        on_pair=partial(notify_pair, application.bot),
+        on_evict=partial(notify_evicted, application.bot),
+        tick=MATCHMAKING_TICK,
+        wait_timeout=MATCHMAKING_WAIT_TIMEOUT,
+    )
+    matchmaker.start()
+    application.bot_data["matchmaker"] = matchmaker
+
+
+async def start_background_tasks(application: Application) -> None:
+    """Start matchmaking and reaping of idle games."""
+    start = time.perf_counter()
+    results_table()  # hints are lookups from the first tap
+    logger.info(f"table of hints is built in {time.perf_counter() - start:.2f} s")
+    logger.info(f"ratings of {ratings.load()} players are loaded")
+    ratings.start()
+    logger.info(f"statistics of {user_stats.load()} players are loaded")
+    user_stats.start()
+    await start_matchmaking(application)
+    reaper.on_reap = partial(reap_idle_games, application)
+    reaper.start()
+    spectators.send_edit = partial(edit_spectator_message, application.bot)
+    spectators.start()
+    loop_monitor.start()
+    if recorder is not None:
+        recorder.start()
+    profiler.install_signal_handler(PROFILE_SECONDS)
+    REGISTRY.gauge(
+        "live_games",
+        lambda: sum(
+            "active_singleplayer_game" in d for d in application.user_data.values()
+        ),
+        kind="singleplayer",
+    )
+    REGISTRY.gauge(
+        "live_games",
+        lambda: sum(
+            not game.game_conductor.is_game_over for game in multiplayer.games.values()
+        )
+        // 2,
+        kind="multiplayer",
+    )
+    REGISTRY.gauge("players_waiting", lambda: len(multiplayer.players_queue))
+    REGISTRY.gauge("pooled_conductors", lambda: len(conductors), kind="singleplayer")
+    REGISTRY.gauge(
+        "pooled_conductors", lambda: len(multiplayer.conductors), kind="multiplayer"
+    )
+    REGISTRY.gauge("process_memory_bytes", process_memory_bytes)
+    REGISTRY.gauge("callbacks_in_flight", lambda: len(debouncer))
+
+
+async def edit_spectator_message(
+    bot: Bot, chat_id: ChatId, message_id: MessageId, text: str
+) -> None:
+    await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+
+
+async def stop_background_tasks(application: Application) -> None:
+    """Stop background tasks on shutdown."""
+    await application.bot_data["matchmaker"].stop()
+    await reaper.stop()
+    await spectators.stop()
+    await ratings.stop()
+    await user_stats.stop()
+    await loop_monitor.stop()
+    if recorder is not None:
+        await recorder.stop()
+
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command `/metrics`: current values of all metrics."""
+    for text in split_message(REGISTRY.render() or "No metrics yet"):
+        await update.message.reply_text(text)
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command `/profile [seconds]`: profile the bot and reply with files."""
+    try:
+        seconds = parse_seconds(context.args, PROFILE_SECONDS, MAX_PROFILE_SECONDS)
+    except ValueError:
+        await update.message.reply_text(
+            f"Usage: /profile [seconds], from 0 to {MAX_PROFILE_SECONDS:g}"
+        )
+        return
+    if profiler.is_active:
+        await update.message.reply_text("Profiling session is already running")
+        return
+
+    await update.message.reply_text(f"Profiling for {seconds:g} s...")
+    try:
+        result = await profiler.profile(seconds)
+    except ProfilingError as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_text(
+        f"Done, {result.n_samples} stack samples.\n"
+        f"pstats: {result.pstats}\n"
+        f"flamegraph: {result.collapsed}\n"
+        f"allocations: {result.tracemalloc}"
+    )
+
+
+def route_callbacks(
+    routes: dict[str, Handler],
+    game_key: Callable[[Update], Hashable | None] | None = None,
+) -> CallbackQueryHandler:
+    """One handler for all buttons in a state, which dispatches by callback data.
+
+    It replaces a chain of regex handlers: data is decoded with a single dict
+    lookup, and moves come to handlers already parsed (see `CELL_MOVES`).
+    Unknown data is acknowledged and the state stays the same.
+
+    With `game_key`, taps of a game go through the debouncer: a tap while the
+    previous one is processed, or a repeat of the last move (handlers `accept`
+    moves they make), is only acknowledged.
+    """
+
+    async def router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int | None:
+        query = update.callback_query
+        handler = routes.get(query.data)
+        if handler is None:
+            await query.answer()
+            return None
+        key = None if game_key is None else game_key(update)
+        if key is not None and not debouncer.enter(key, query.data):
+            await query.answer()
+            return None
+        name = getattr(handler, "func", handler).__name__
+        start = time.perf_counter()
+        try:
+            with loop_monitor.track(name):
+                return await handler(update, context)
+        finally:
+            if key is not None:
+                debouncer.leave(key)
+            log_event(
+                logger,
+                "callback",
+                handler=name,
+                data=query.data,
+                chat=query.message.chat_id if query.message else None,
+                latency_ms=round(1000 * (time.perf_counter() - start), 1),
+            )
+
+    return CallbackQueryHandler(router, block=False)
+
+
+async def absorb_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Button pressed while the previous update of the conversation is processed.
+
+    ConversationHandler drops such updates (state WAITING), this only stops the
+    loading animation of the button.
+    """
+    REGISTRY.counter("callbacks_absorbed", reason="pending").inc()
+    await update.callback_query.answer()
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Keep an incoming update for replays, before any other handler"""
+    assert recorder is not None
+    recorder.record(update.to_dict())
+
 
+def add_handlers(application: Application) -> None:
+    """Register handlers of the bot in the application"""
+    if recorder is not None:
+        application.add_handler(TypeHandler(Update, record_update), group=-1)
     # block is False so we don't get blocked while sending a message
     conv_handler = ConversationHandler(
         entry_points=[
@@ -583,53 +1408,87 @@ def main() -> None:
         ],
         states={
             CHOICE_GAME_TYPE: [
-                CallbackQueryHandler(
-                    start_singleplayer, pattern="^" + str(1) + "$", block=False
-                ),
-                CallbackQueryHandler(
-                    start_multiplayer, pattern="^" + str(2) + "$", block=False
+                route_callbacks(
+                    {
+                        "1": start_singleplayer,
+                        "2": start_multiplayer,
+                        "3": start_ultimate,
+                    }
                 ),
             ],
             MARK_CHOICE: [
-                CallbackQueryHandler(
-                    mark_choice, pattern="^" + str(i) + "$", block=False
-                )
-                for i in (1, 2, 3)
+                route_callbacks(
+                    {
+                        "1": partial(mark_choice, mark=CROSS),
+                        "2": partial(mark_choice, mark=ZERO),
+                        "3": partial(mark_choice, mark=None),  # random
+                    }
+                ),
+            ],
+            ULTIMATE_MARK_CHOICE: [
+                route_callbacks(
+                    {
+                        "1": partial(mark_choice_ultimate, mark=CROSS),
+                        "2": partial(mark_choice_ultimate, mark=ZERO),
+                        "3": partial(mark_choice_ultimate, mark=None),
+                    }
+                ),
+            ],
+            CONTINUE_GAME_ULTIMATE: [
+                route_callbacks(
+                    {
+                        **{
+                            data: partial(game_ultimate, move=move)
+                            for data, move in ULTIMATE_MOVES.items()
+                        },
+                        **{
+                            data: partial(select_ultimate_board, sub_board=sub_board)
+                            for data, sub_board in ULTIMATE_BOARDS.items()
+                        },
+                        ULTIMATE_BACK: partial(select_ultimate_board, sub_board=None),
+                    },
+                    game_key=singleplayer_update_key,
+                ),
             ],
             CONTINUE_GAME_SINGLEPLAYER: [
-                CallbackQueryHandler(
-                    game_singleplayer, pattern="^" + f"{r}{c}" + "$", block=False
-                )
-                for r in range(3)
-                for c in range(3)
+                route_callbacks(
+                    {
+                        **{
+                            data: partial(game_singleplayer, move=move)
+                            for data, move in CELL_MOVES.items()
+                        },
+                        HINT_CALLBACK: hint_singleplayer,
+                    },
+                    game_key=singleplayer_update_key,
+                ),
             ],
             CONTINUE_GAME_MULTIPLAYER: [
-                *[
-                    CallbackQueryHandler(
-                        game_multiplayer, pattern="^" + f"{r}{c}" + "$", block=False
-                    )
-                    for r in range(3)
-                    for c in range(3)
-                ],
-                CallbackQueryHandler(  # options in case of game over
-                    start_multichoice,
-                    pattern="^" + str(START_AGAIN_CALLBACK) + "$",
-                    block=False,
-                ),
-                CallbackQueryHandler(
-                    goodbye_sir, pattern="^" + str(GOODBYE_CALLBACK) + "$", block=False
+                route_callbacks(
+                    {
+                        **{
+                            data: partial(game_multiplayer, move=move)
+                            for data, move in CELL_MOVES.items()
+                        },
+                        HINT_CALLBACK: hint_multiplayer,
+                        # options in case of game over
+                        str(REMATCH_CALLBACK): rematch_multiplayer,
+                        str(START_AGAIN_CALLBACK): start_multichoice,
+                        str(GOODBYE_CALLBACK): goodbye_sir,
+                    },
+                    game_key=multiplayer_update_key,
                 ),
             ],
             PLAY_AGAIN: [
-                CallbackQueryHandler(
-                    start_multichoice,
-                    pattern="^" + str(START_AGAIN_CALLBACK) + "$",
-                    block=False,
-                ),
-                CallbackQueryHandler(
-                    goodbye_sir, pattern="^" + str(GOODBYE_CALLBACK) + "$", block=False
+                route_callbacks(
+                    {
+                        str(START_AGAIN_CALLBACK): start_multichoice,
+                        str(GOODBYE_CALLBACK): goodbye_sir,
+                    }
                 ),
             ],
+            ConversationHandler.WAITING: [
+                CallbackQueryHandler(absorb_callback, block=False),
+            ],
         },
         fallbacks=[
             # you might start over at any moment, dropping a current game
@@ -643,9 +1502,51 @@ def main() -> None:
 
     # Add ConversationHandler to application that will be used for handling updates
     application.add_handler(conv_handler)
+    # spectators, independent of the conversation
+    application.add_handler(CommandHandler("watch", watch_command, block=False))
+    application.add_handler(CommandHandler("unwatch", unwatch_command, block=False))
+    application.add_handler(CommandHandler("top", top_command, block=False))
+    application.add_handler(CommandHandler("stats", stats_command, block=False))
+    # admin commands, nobody can use them if TIC_TAC_TOE_ADMIN_IDS is empty
+    application.add_handler(
+        CommandHandler(
+            "profile",
+            profile_command,
+            filters=filters.User(user_id=ADMIN_IDS),
+            block=False,
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            "metrics",
+            metrics_command,
+            filters=filters.User(user_id=ADMIN_IDS),
+            block=False,
+        )
+    )
+
+
+def main() -> None:
+    """Run the bot"""
+    # get token using BotFather
+    token = os.getenv("TIC_TAC_TOE_TOKEN_TG")  # I put it in zsh config
+    assert token, "Token not found in env vars (TIC_TAC_TOE_TOKEN_TG)"
+    log_listener = setup_logging(
+        level=logging.getLevelName(LOG_LEVEL), as_json=LOG_JSON, sampling=LOG_SAMPLING
+    )
+    application = (
+        application_builder(token, load_settings())
+        .post_init(start_background_tasks)
+        .post_shutdown(stop_background_tasks)
+        .build()
+    )
+    add_handlers(application)
 
     # Run the bot until the user presses Ctrl-C
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    try:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        log_listener.stop()  # writes what is left in the queue
 
 
 if __name__ == "__main__":
@@ -5,12 +5,18 @@ And some text for user.
 """
 
 import inspect
+import math
 from typing import Final
 
-from telegram import User
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, User
 from telegram.helpers import escape_markdown
 
-from tic_tac_toe.game import Mark, TTTBoard, get_opposite_mark
+from tic_tac_toe.game import CROSS, ZERO, Grid, Mark, Move, TTTBoard
+from tic_tac_toe.hints import DRAW, LOSS, WIN, move_results
+from tic_tac_toe.ranking import N_RANKS, rank
+from tic_tac_toe.ratings import PlayerRating
+from tic_tac_toe.stats import UserStats
+from tic_tac_toe.ultimate import UltimateBoard
 
 GAME_RULES: Final = inspect.cleandoc(
     r"""
@@ -20,18 +26,57 @@ GAME_RULES: Final = inspect.cleandoc(
 )
 
 
+MESSAGE_WIDTH: Final = 60
+MAX_MESSAGE_LENGTH: Final = 4096  # limit of Telegram
+
+# right padding for every message length, escaped for MarkdownV2 or not
+_PADDING: Final = {
+    escape: [
+        " " + (escape_markdown("_" * n, version=2) if escape else "_" * n)
+        for n in range(MESSAGE_WIDTH + 1)
+    ]
+    for escape in (False, True)
+}
+
+
 def wide_message(msg: str, escape: bool = False) -> str:
     """Add right padding with underscore so InlineKeyboard extends across full width"""
-    max_width = 60
-    add_symbols = max_width - len(msg)
+    add_symbols = MESSAGE_WIDTH - len(msg)
     if add_symbols <= 0:
         return msg
+    return msg + _PADDING[escape][add_symbols]
 
-    underscores = "_" * add_symbols
-    if escape:
-        underscores = escape_markdown(underscores, version=2)
 
-    return msg + " " + underscores
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """Split long text into messages by lines (longer lines are cut)"""
+    messages: list[str] = []
+    current = ""
+    for line in text.splitlines():
+        while len(line) > limit:
+            messages.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            messages.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+def parse_seconds(args: list[str], default: float, maximum: float) -> float:
+    """Duration from arguments of a command, clamped to `maximum`.
+
+    Raises:
+        ValueError: if it is not a positive number or there are extra arguments
+    """
+    if not args:
+        return min(default, maximum)
+    seconds = float(args[0])
+    if len(args) > 1 or not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"Wrong duration: {' '.join(args)}")
+    return min(seconds, maximum)
 
 
 def get_full_user_name(user: User) -> str:
@@ -44,18 +89,111 @@ def get_full_user_name(user: User) -> str:
     return user_name
 
 
-def parse_keyboard_move(data: str) -> tuple[int, int]:
-    if len(data) != 2:
-        raise ValueError(
-            f"length of data from inlinekeyboard should be 2, but it is {len(data)}"
-        )
-    elif not isinstance(data, str):
-        raise ValueError(f"Data has type {type(data)}, but str is required")
-    r, c = int(data[0]), int(data[1])
-    for dim in (r, c):
-        if not 0 <= dim <= 2:
-            raise ValueError(f"Some dimension in {r, c} not in range [0, 2]")
-    return r, c
+# callback data of a cell is "rc" (row and column), moves are parsed once
+CELL_MOVES: Final[dict[str, Move]] = {
+    f"{r}{c}": (r, c) for r in range(3) for c in range(3)
+}
+
+
+# Ultimate: cell of a sub-board is "u<board><cell>", sub-board choice "ub<board>"
+ULTIMATE_MOVES: Final[dict[str, Move]] = {
+    f"u{board}{cell}": (board, cell) for board in range(9) for cell in range(9)
+}
+ULTIMATE_BOARDS: Final[dict[str, int]] = {f"ub{board}": board for board in range(9)}
+ULTIMATE_BACK: Final = "u-"  # back to the choice of a sub-board
+
+
+HINT_CALLBACK: Final = "h"
+HINT_LABELS: Final = {
+    WIN: "\N{Large Green Circle}",
+    DRAW: "\N{Large Yellow Circle}",
+    LOSS: "\N{Large Red Circle}",
+}
+_HINT_ROW: Final = [
+    InlineKeyboardButton("Hint \N{Electric Light Bulb}", callback_data=HINT_CALLBACK)
+]
+# keyboards of boards by rank of the grid: 2 * rank without hints, + 1 with them
+_KEYBOARDS: list[InlineKeyboardMarkup | None] = [None] * (2 * N_RANKS)
+
+
+def _build_keyboard(grid: Grid, results: bytes | None) -> InlineKeyboardMarkup:
+    labels = [
+        [
+            HINT_LABELS.get(results[3 * r + c], grid[r][c]) if results else grid[r][c]
+            for c in range(3)
+        ]
+        for r in range(3)
+    ]
+    keyboard = [
+        [InlineKeyboardButton(labels[r][c], callback_data=f"{r}{c}") for c in range(3)]
+        for r in range(3)
+    ]
+    if results is None:
+        keyboard.append(_HINT_ROW)
+    return InlineKeyboardMarkup(keyboard)
+
+
+def board_keyboard(grid: Grid, hints: bool = False) -> InlineKeyboardMarkup:
+    """Keyboard 3x3 of a board with a hint button, or with results of moves of the
+    side to move in free cells (see `hints.py`) instead of the button.
+
+    Keyboards are immutable and built once per board, boards with wrong numbers
+    of marks are built every time and have no hints.
+    """
+    key = _rank_or_none(grid)
+    if key is None:
+        return _build_keyboard(grid, None)
+    key = 2 * key + hints
+    keyboard = _KEYBOARDS[key]
+    if keyboard is None:
+        results = move_results(grid) if hints else None
+        keyboard = _KEYBOARDS[key] = _build_keyboard(grid, results)
+    return keyboard
+
+
+def parse_keyboard_move(data: str) -> Move:
+    """Get move from callback data of inline keyboard"""
+    try:
+        return CELL_MOVES[data]
+    except (KeyError, TypeError):
+        raise ValueError(f"Data {data!r} is not a cell of inline keyboard") from None
+
+
+# board text and winner by rank of the grid, and final messages without a winner
+# name by rank and mark (X first), rendered on first use
+_BOARDS: list[tuple[str, Mark | None] | None] = [None] * N_RANKS
+_END_MESSAGES: list[str | None] = [None] * (2 * N_RANKS)
+
+_WON_TEMPLATE: Final = "You won!\n{grid}\n\N{Smiling Face with Sunglasses}"
+_LOST_TEMPLATE: Final = "You lost...\n{grid}\n\N{Melting Face}"
+_DRAW_TEMPLATE: Final = (
+    "It's a draw!\n{grid}\n\N{Face with Finger Covering Closed Lips}"
+    # это кот Леопольд
+    "\nWinner in this game: Дружба \N{Smiling Cat Face with Heart-Shaped Eyes}."
+    "\nThanks for playing"
+)
+
+
+def _rank_or_none(grid: Grid) -> int | None:
+    try:
+        return rank(grid)
+    except ValueError:
+        return None
+
+
+def render_board(game_board: TTTBoard) -> tuple[str, Mark | None]:
+    """Get rendered board (same as str) and winner. Memoized by rank of the grid,
+    boards with wrong numbers of marks are rendered every time."""
+    return _render_ranked(game_board, _rank_or_none(game_board.grid))
+
+
+def _render_ranked(game_board: TTTBoard, key: int | None) -> tuple[str, Mark | None]:
+    if key is None:
+        return str(game_board), game_board.get_winner()
+    rendered = _BOARDS[key]
+    if rendered is None:
+        rendered = _BOARDS[key] = (str(game_board), game_board.get_winner())
+    return rendered
 
 
 def render_message_at_game_end(
@@ -65,36 +203,80 @@ def render_message_at_game_end(
 ) -> str:
     """Get final message with results after the game to replace InlineKeyboard.
 
+    Everything except user name is rendered once per board and mark.
+
     Parameters:
-        gc: GameConductor
+        game_board: board of the finished game
         mark: mark of the player
         username_mark: dictionary with mark and user name to congratulate personally!
     """
-    winner = game_board.get_winner()
-    if winner:
-        if winner == mark:
-            first_line = "You won!"
-            emoji = "\N{Smiling Face with Sunglasses}"
-            winner_username = username_mark[mark]
+    position = _rank_or_none(game_board.grid)
+    rendered_grid, winner = _render_ranked(game_board, position)
+    key = None if position is None else 2 * position + (mark != CROSS)
+    message = None if key is None else _END_MESSAGES[key]
+    if message is None:
+        if winner is None:
+            message = _DRAW_TEMPLATE.format(grid=rendered_grid)
         else:
-            first_line = "You lost..."
-            emoji = "\N{Melting Face}"
-            winner_username = username_mark[get_opposite_mark(mark)]
-        winner = f"{winner_username} ({winner})"  # username + mark
+            template = _WON_TEMPLATE if winner == mark else _LOST_TEMPLATE
+            message = template.format(grid=rendered_grid) + "\nWinner in this game: "
+        if key is not None:
+            _END_MESSAGES[key] = message
+
+    if winner is None:
+        return message
+    return f"{message}{username_mark[winner]} ({winner}).\nThanks for playing"
+
+
+def render_spectator_message(
+    game_board: TTTBoard, username_mark: dict[Mark, str], next_mark: Mark
+) -> str:
+    """Board with names of players and state of the game for spectators"""
+    rendered_grid, winner = render_board(game_board)
+    if winner is not None:
+        state = f"Winner: {username_mark[winner]} ({winner})"
+    elif game_board.is_game_over():
+        state = "It's a draw!"
     else:
-        winner = (
-            "Дружба \N{Smiling Cat Face with Heart-Shaped Eyes}"  # это кот Леопольд
-        )
-        emoji = "\N{Face with Finger Covering Closed Lips}"
-        first_line = "It's a draw!"
-
-    rendered_grid = str(game_board)
-    text = (
-        first_line
-        + "\n"
-        + rendered_grid
-        + "\n"
-        + emoji
-        + f"\nWinner in this game: {winner}.\nThanks for playing"
+        state = f"Next move: {username_mark[next_mark]} ({next_mark})"
+    return (
+        f"{username_mark[CROSS]} ({CROSS}) vs {username_mark[ZERO]} ({ZERO})\n"
+        f"{rendered_grid}\n{state}"
+    )
+
+
+def render_ultimate_message(board: UltimateBoard, text: str) -> str:
+    """Text and the whole board in a monospace block (MarkdownV2)"""
+    text = wide_message(escape_markdown(text, version=2), escape=True)
+    return f"{text}\n```\n{board}\n```"
+
+
+def render_leaderboard(
+    top: list[tuple[int, PlayerRating]],
+    me: PlayerRating | None,
+    my_rank: int | None,
+    n_players: int,
+) -> str:
+    """Top players by rating and the place of the player who asked"""
+    if not top:
+        return "Nobody has a rating yet. Finish a game to get one"
+    lines = [
+        f"{place}. {info.name or 'Anonymous'}: {info.rating:.0f} ({info.games} games)"
+        for place, (_, info) in enumerate(top, 1)
+    ]
+    if me is None or my_rank is None:
+        lines.append("\nFinish a game to get a rating")
+    else:
+        lines.append(f"\nYour rating: {me.rating:.0f}, place {my_rank} of {n_players}")
+    return "\n".join(lines)
+
+
+def render_stats(stats: UserStats | None) -> str:
+    """Record of the player for /stats"""
+    if stats is None or not stats.games:
+        return "You haven't finished any game yet"
+    return (
+        f"Games: {stats.games}\n"
+        f"Wins: {stats.wins}, draws: {stats.draws}, losses: {stats.losses}\n"
+        f"Average length: {stats.average_length:.1f} moves"
     )
-    return text
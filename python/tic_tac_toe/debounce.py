@@ -0,0 +1,82 @@
+"""Absorbing of button mashing in games.
+
+Users double-tap cells. A tap that arrives while the previous one of the same
+game is being processed, or that repeats the last accepted move of the game
+within a short window, can only be an illegal move (the cell is taken) or a
+no-op. Such taps are acknowledged without an alert and never reach the engine
+or edits of messages.
+
+Only moves are debounced: handlers call `accept` after a move is made, so a
+rejected move (e.g. out of turn) can be tapped again, and navigation buttons
+can be pressed any number of times.
+
+Absorbed taps are counted in `callbacks_absorbed{reason="in_flight"}` and
+`callbacks_absorbed{reason="repeat"}`.
+"""
+
+import time
+from collections.abc import Callable, Hashable
+
+from tic_tac_toe.metrics import REGISTRY
+
+
+class Debouncer:
+    """In-flight guard and debouncing of repeated buttons per game.
+
+    Attributes:
+        window: seconds during which the same button of a game is absorbed
+    """
+
+    def __init__(
+        self, window: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.window = window
+        self._clock = clock
+        self._in_flight: set[Hashable] = set()
+        # last accepted move and time by game, ordered by time
+        self._last: dict[Hashable, tuple[str, float]] = {}
+        self._absorbed_in_flight = REGISTRY.counter(
+            "callbacks_absorbed", reason="in_flight"
+        )
+        self._absorbed_repeat = REGISTRY.counter("callbacks_absorbed", reason="repeat")
+
+    def __len__(self) -> int:
+        """Number of games with a tap being processed"""
+        return len(self._in_flight)
+
+    def enter(self, key: Hashable, data: str) -> bool:
+        """Start processing of a tap, False if it should be absorbed.
+
+        Every tap that has entered must be followed by `leave`.
+        """
+        if key in self._in_flight:
+            self._absorbed_in_flight.inc()
+            return False
+        self._expire(self._clock())
+        last = self._last.get(key)
+        if last is not None and last[0] == data:
+            self._absorbed_repeat.inc()
+            return False
+        self._in_flight.add(key)
+        return True
+
+    def accept(self, key: Hashable, data: str) -> None:
+        """The move of the tap is made, its repeats within the window are absorbed"""
+        self._last.pop(key, None)  # keep the order by time
+        self._last[key] = (data, self._clock())
+
+    def leave(self, key: Hashable) -> None:
+        self._in_flight.discard(key)
+
+    def forget(self, key: Hashable) -> None:
+        """Game is over, the next game with the same key starts clean"""
+        self._last.pop(key, None)
+
+    def _expire(self, now: float) -> None:
+        """Drop buttons older than the window (the oldest are first)"""
+        last = self._last
+        while last:
+            key = next(iter(last))
+            if now - last[key][1] < self.window:
+                break
+            del last[key]
@@ -0,0 +1,142 @@
+"""Registry of bot strategies (engines) by name.
+
+Every strategy gets a grid and a mark of the player to move and returns a move.
+Tools like game tree analysis and benchmarks find strategies here, so a new
+engine needs only to be registered.
+
+Rust engines are registered only if the extension is built, `DEFAULT_ENGINE`
+is the fastest available minimax (the bitboard one in Python otherwise).
+
+Search engines may also have an instrumented variant that returns statistics
+of the search. `get_strategy(name, stats=True)` returns a strategy that records
+them into process-wide counters `search_*{engine="name"}` of the metrics
+registry, while the plain strategy doesn't count anything.
+"""
+
+from collections.abc import Callable
+from functools import partial
+from typing import Final, Protocol, overload
+
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.bitboard import find_optimal_move_bb
+from tic_tac_toe.game import (
+    Grid,
+    Mark,
+    Move,
+    SearchStats,
+    find_optimal_move,
+    find_optimal_move_with_stats,
+    random_available_move,
+)
+from tic_tac_toe.mcts import mcts_move, mcts_rs_move
+from tic_tac_toe.metrics import REGISTRY
+
+if HAS_RUST:
+    from tic_tac_toe import find_optimal_move_rs, find_optimal_move_stats_rs
+
+
+class Strategy(Protocol):
+    def __call__(self, grid: Grid, mark: Mark) -> Move:
+        ...
+
+
+class StatsStrategy(Protocol):
+    def __call__(self, grid: Grid, mark: Mark) -> tuple[Move, SearchStats]:
+        ...
+
+
+STRATEGIES: dict[str, Strategy] = {}
+STATS_STRATEGIES: dict[str, StatsStrategy] = {}
+
+
+@overload
+def register_strategy(name: str) -> Callable[[Strategy], Strategy]:
+    ...
+
+
+@overload
+def register_strategy(name: str, strategy: Strategy) -> Strategy:
+    ...
+
+
+def register_strategy(name, strategy=None):
+    """Register strategy by name. Can be used as a decorator."""
+
+    def register(strategy: Strategy) -> Strategy:
+        if name in STRATEGIES:
+            raise ValueError(f"Strategy {name} is already registered")
+        STRATEGIES[name] = strategy
+        return strategy
+
+    if strategy is None:
+        return register
+    return register(strategy)
+
+
+def register_stats_strategy(name: str, strategy: StatsStrategy) -> None:
+    """Register instrumented variant of a registered strategy"""
+    if name not in STRATEGIES:
+        raise ValueError(f"Strategy {name} is not registered")
+    STATS_STRATEGIES[name] = strategy
+
+
+def get_strategy(name: str, stats: bool = False) -> Strategy:
+    """Strategy by name. With `stats` every search is recorded into metrics."""
+    try:
+        strategy = STRATEGIES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown strategy {name}, available: {', '.join(STRATEGIES)}"
+        ) from None
+    if not stats:
+        return strategy
+    if name not in STATS_STRATEGIES:
+        raise ValueError(f"Strategy {name} doesn't support statistics")
+    return partial(_recorded, name, STATS_STRATEGIES[name])
+
+
+def _recorded(name: str, strategy: StatsStrategy, grid: Grid, mark: Mark) -> Move:
+    move, stats = strategy(grid, mark)
+    record_search(name, stats)
+    return move
+
+
+def record_search(engine: str, stats: SearchStats) -> None:
+    """Add statistics of one search to process-wide counters"""
+    REGISTRY.counter("search_calls", engine=engine).inc()
+    for field in ("nodes", "cutoffs", "terminal_nodes", "seconds"):
+        REGISTRY.counter(f"search_{field}", engine=engine).inc(getattr(stats, field))
+    max_depth = REGISTRY.gauge("search_max_depth", engine=engine)
+    max_depth.set(max(max_depth.value, stats.max_depth))
+
+
+def search_totals(engine: str) -> tuple[int, SearchStats]:
+    """Number of recorded searches and their summed statistics (max of depth)"""
+    calls = REGISTRY.counter("search_calls", engine=engine).value
+    totals = SearchStats(
+        *(
+            int(REGISTRY.counter(f"search_{field}", engine=engine).value)
+            for field in ("nodes", "cutoffs", "terminal_nodes")
+        ),
+        max_depth=int(REGISTRY.gauge("search_max_depth", engine=engine).value),
+        seconds=REGISTRY.counter("search_seconds", engine=engine).value,
+    )
+    return int(calls), totals
+
+
+def find_optimal_move_rs_with_stats(grid: Grid, mark: Mark) -> tuple[Move, SearchStats]:
+    move, stats = find_optimal_move_stats_rs(grid, mark)
+    return move, SearchStats(*stats)
+
+
+register_strategy("random", random_available_move)
+register_strategy("minimax", find_optimal_move)
+register_strategy("minimax_bb", find_optimal_move_bb)
+register_strategy("mcts", mcts_move)
+register_stats_strategy("minimax", find_optimal_move_with_stats)
+if HAS_RUST:
+    register_strategy("minimax_rs", find_optimal_move_rs)
+    register_strategy("mcts_rs", mcts_rs_move)
+    register_stats_strategy("minimax_rs", find_optimal_move_rs_with_stats)
+
+DEFAULT_ENGINE: Final = "minimax_rs" if HAS_RUST else "minimax_bb"
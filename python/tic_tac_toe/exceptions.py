@@ -27,3 +27,11 @@ class NotEnoughPlayersError(MultiplayerError):
 
 class WaitRoomError(MultiplayerError):
     "You are already in the queue"
+
+
+class ProfilingError(TicTacToeException):
+    "Profiling session can't be started"
+
+
+class PositionDbError(TicTacToeException):
+    "Database of solved positions is corrupted or doesn't fit"
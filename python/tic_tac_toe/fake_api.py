@@ -0,0 +1,203 @@
+"""Local fake of the Telegram Bot API for benchmarks and tests of the bot.
+
+It is an HTTP/1.1 server with keep-alive on asyncio streams that answers like
+the Bot API: messages for `sendMessage` and edits, a bot for `getMe`, updates
+put with `put_update` for `getUpdates` (long polling), `True` for the rest.
+Every call can be delayed by `latency` seconds to look like a real network.
+Calls and connections are counted and every call is logged, so a test can
+check what the bot sent and how many connections it opened.
+
+    api = FakeBotApi(latency=0.05)
+    await api.start()
+    builder = application_builder(api.token, settings._replace(base_url=api.base_url))
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Any, NamedTuple
+from urllib.parse import parse_qsl
+
+FAKE_BOT: dict[str, Any] = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Fake",
+    "username": "fake_tic_tac_toe_bot",
+}
+
+
+def user(user_id: int) -> dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": "user"}
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict[str, Any]:
+    """Update with a message of a user in the private chat, commands are marked"""
+    message: dict[str, Any] = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        length = len(text.split()[0])
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": length}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(
+    update_id: int, user_id: int, data: str, message_id: int = 1
+) -> dict[str, Any]:
+    """Update with a press of a button under a message of the bot"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": FAKE_BOT,
+                "text": "board",
+            },
+        },
+    }
+
+
+class Call(NamedTuple):
+    """Call of a method of the API, parameters are decoded from JSON"""
+
+    time: float
+    method: str
+    params: dict[str, Any]
+
+
+def decode_params(body: bytes) -> dict[str, Any]:
+    """Parameters of a form, as PTB sends them (values are JSON but strings)"""
+    params: dict[str, Any] = {}
+    for name, value in parse_qsl(body.decode(), keep_blank_values=True):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class FakeBotApi:
+    """Fake Bot API server, see the module docstring.
+
+    Attributes:
+        latency: seconds every call (but `getUpdates`) waits before the answer
+        calls: number of calls by method
+        connections: number of opened connections
+        log: all calls in order
+    """
+
+    def __init__(self, latency: float = 0.0, token: str = "123:fake") -> None:
+        if latency < 0:
+            raise ValueError("latency should be non-negative")
+        self.latency = latency
+        self.token = token
+        self.calls: Counter[str] = Counter()
+        self.connections = 0
+        self.log: list[Call] = []
+        self._updates: list[dict[str, Any]] = []
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._server: asyncio.Server | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    @property
+    def base_url(self) -> str:
+        assert self._server is not None, "server isn't started"
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/bot"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        self._new_updates.set()  # long polls return
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    def put_update(self, update: dict[str, Any]) -> None:
+        """Update for `getUpdates`, `update_id` should grow"""
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                path = request_line.split()[1].decode()
+                method = path.rsplit("/", 1)[-1]
+                result = await self._call(method, decode_params(body))
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload)
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _call(self, method: str, params: dict[str, Any]) -> Any:
+        self.calls[method] += 1
+        self.log.append(Call(time.perf_counter(), method, params))
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            return FAKE_BOT
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            if "inline_message_id" in params:
+                return True
+            return {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": FAKE_BOT,
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def _get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        offset = int(params.get("offset", 0))
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(
+                    self._new_updates.wait(), float(params.get("timeout", 0))
+                )
+            except TimeoutError:
+                pass
+        return self._updates[: int(params.get("limit", 100))]
@@ -4,8 +4,10 @@ Definition and functions. Simple bot engine (random and minimax)
 """
 
 import random
+import time
+from collections.abc import Callable
 from copy import deepcopy
-from typing import Final, Literal, TypeAlias
+from typing import Final, Literal, NamedTuple, TypeAlias
 
 from tic_tac_toe.exceptions import GameRulesError, InvalidMoveError
 
@@ -48,6 +50,12 @@ class TTTBoard:
         r, c = move
         self.grid[r][c] = mark
 
+    def reset(self) -> None:
+        """Clear the grid in place (for reuse of the board in a new game)"""
+        for row in self.grid:
+            for c in range(3):
+                row[c] = FREE_SPACE
+
     def n_empty_cells(self) -> int:
         """Count number of empty cells in play grid"""
         return sum(elem == FREE_SPACE for row in self.grid for elem in row)
@@ -115,6 +123,7 @@ class HandleForPlayer:
         _game: GameConductor instance. Shouldn't be accessed by player (imagine that)
     Methods:
         is_my_turn() -> (bool): is this player's turn
+        is_valid() -> (bool): the game wasn't reset since the handle was given
     Magic methods:
         __call__(move) -> None: call this handle to make a move in a board
     Example:
@@ -129,15 +138,22 @@ class HandleForPlayer:
     def __init__(self, game: "GameConductor", mark: Mark) -> None:
         self._game = game
         self.mark: Mark = mark
+        self._generation = game.generation
 
     def __call__(self, move: Move) -> None:
         """Make a move."""
+        if self._generation != self._game.generation:
+            raise GameRulesError("This handle belongs to a game that was reset")
         self._game.full_handle(move, self.mark)
 
     def is_my_turn(self) -> bool:
         """Is it my turn."""
         # it is not property to be compatible with lambda func alternative
-        return self._game.current_move == self.mark
+        return self.is_valid() and self._game.current_move == self.mark
+
+    def is_valid(self) -> bool:
+        """The game of this handle wasn't reset (e.g. released to a pool)"""
+        return self._generation == self._game.generation
 
 
 class GameConductor:
@@ -146,13 +162,44 @@ class GameConductor:
     Used mainly for correct alternation of game moves.
     It gives a handle for each player to play without worries by pulling it.
     HandleForPlayer disallows illegal moves.
+
+    A conductor can be reused: `reset` makes it brand new (old handles stop
+    working), `rematch` starts a new game for the same handles with swapped marks.
+
+    Attributes:
+        board_factory: class of a board, TTTBoard or TTTBoardRs (Rust) as drop-in
+        generation: number of resets, handles are valid only for their generation
     """
 
-    def __init__(self):
-        self.game_board: TTTBoard = TTTBoard()  # validates correctness of game board
+    def __init__(self, board_factory: Callable[[], TTTBoard] = TTTBoard):
+        # validates correctness of game board
+        self.game_board: TTTBoard = board_factory()
         self._available_marks: set[Mark] = {CROSS, ZERO}
+        self._handles: list[HandleForPlayer] = []
         self.current_move: Mark = CROSS  # first move (my game rule)
         self.is_game_over: bool = False
+        self.generation = 0
+
+    def reset(self) -> None:
+        """Clean state for a new game with new handles"""
+        self.game_board.reset()
+        self._available_marks = {CROSS, ZERO}
+        self._handles.clear()
+        self.current_move = CROSS
+        self.is_game_over = False
+        self.generation += 1
+
+    def rematch(self) -> None:
+        """New game for the same players. They swap marks, handles stay valid."""
+        if not self.is_game_over:
+            raise GameRulesError("Game is not over")
+        if self._available_marks:
+            raise GameRulesError("Rematch needs two players")
+        for handle in self._handles:
+            handle.mark = get_opposite_mark(handle.mark)
+        self.game_board.reset()
+        self.current_move = CROSS
+        self.is_game_over = False
 
     def get_handle(
         self,
@@ -191,6 +238,7 @@ class GameConductor:
 
         # attempt with explicit class
         handle = HandleForPlayer(self, mark)
+        self._handles.append(handle)
 
         return handle
 
@@ -214,6 +262,38 @@ class GameConductor:
         self.current_move = get_opposite_mark(mark)  # now another player's turn
 
 
+class GameConductorPool:
+    """Bounded pool of game conductors, so back-to-back games reuse boards.
+
+    Attributes:
+        maxsize: released conductors above this number are left to GC
+        board_factory: board of new conductors
+    """
+
+    def __init__(
+        self, maxsize: int = 1024, board_factory: Callable[[], TTTBoard] = TTTBoard
+    ) -> None:
+        self.maxsize = maxsize
+        self.board_factory = board_factory
+        self._free: list[GameConductor] = []
+
+    def acquire(self) -> GameConductor:
+        """Clean conductor from the pool or a new one"""
+        if self._free:
+            return self._free.pop()
+        return GameConductor(self.board_factory)
+
+    def release(self, game_conductor: GameConductor) -> None:
+        """Return a conductor that is not used anymore. Its handles stop working."""
+        if len(self._free) < self.maxsize:
+            game_conductor.reset()
+            self._free.append(game_conductor)
+
+    def __len__(self) -> int:
+        """Number of free conductors"""
+        return len(self._free)
+
+
 def get_opposite_mark(mark: Mark) -> Mark:
     """Get opposite mark out of O and X. Useful when player made a move."""
     if mark not in (CROSS, ZERO):
@@ -282,3 +362,93 @@ def find_optimal_move(grid: Grid, mark: Mark) -> Move:
                     best_score = score
                     move = (r, c)
     return move
+
+
+class SearchStats(NamedTuple):
+    """Statistics of one minimax search.
+
+    Attributes:
+        nodes: positions visited below the root
+        cutoffs: how many times `best_score >= max_score` stopped a node early
+        terminal_nodes: finished positions that were evaluated
+        max_depth: deepest visited position (moves from the root)
+        seconds: wall time of the search
+    """
+
+    nodes: int = 0
+    cutoffs: int = 0
+    terminal_nodes: int = 0
+    max_depth: int = 0
+    seconds: float = 0.0
+
+
+class _SearchCounter:
+    __slots__ = ("nodes", "cutoffs", "terminal_nodes", "max_depth")
+
+    def __init__(self) -> None:
+        self.nodes = self.cutoffs = self.terminal_nodes = self.max_depth = 0
+
+
+def _minimax_move_score_counted(
+    game_board: TTTBoard,
+    mark: Mark,
+    max_score: int,
+    depth: int,
+    counter: _SearchCounter,
+) -> int:
+    """Copy of _minimax_move_score with counters, so the plain one stays fast"""
+    counter.nodes += 1
+    if depth > counter.max_depth:
+        counter.max_depth = depth
+    if game_board.is_game_over():
+        counter.terminal_nodes += 1
+        winner = game_board.get_winner()
+        if not winner:
+            return 0
+        if winner == mark:
+            return 10
+        return -10
+
+    best_score = -200
+    for r in range(3):
+        for c in range(3):
+            if game_board.grid[r][c] == FREE_SPACE:
+                if best_score >= max_score:
+                    counter.cutoffs += 1
+                    return best_score
+                game_board.set_cell((r, c), mark)
+                score = -_minimax_move_score_counted(
+                    game_board, get_opposite_mark(mark), -best_score, depth + 1, counter
+                )
+                game_board.set_cell((r, c), FREE_SPACE)
+                if score > best_score:
+                    best_score = score
+
+    return best_score
+
+
+def find_optimal_move_with_stats(grid: Grid, mark: Mark) -> tuple[Move, SearchStats]:
+    """Same as find_optimal_move, but also returns statistics of the search."""
+    start = time.perf_counter()
+    counter = _SearchCounter()
+    best_score, move = -200, (100, 100)
+    game_board = TTTBoard(grid)
+    for r in range(3):
+        for c in range(3):
+            if game_board.grid[r][c] == FREE_SPACE:
+                game_board.set_cell((r, c), mark)
+                score = -_minimax_move_score_counted(
+                    game_board, get_opposite_mark(mark), -best_score, 1, counter
+                )
+                game_board.set_cell((r, c), FREE_SPACE)
+                if score > best_score:
+                    best_score = score
+                    move = (r, c)
+    stats = SearchStats(
+        counter.nodes,
+        counter.cutoffs,
+        counter.terminal_nodes,
+        counter.max_depth,
+        time.perf_counter() - start,
+    )
+    return move, stats
@@ -0,0 +1,46 @@
+"""Hints for 3x3 games: the result of every move for the side to move.
+
+Results of moves in all legal positions are found once by exhaustive search
+(`analysis.solve`) and kept in a table of 9 bytes per rank of a position
+(`ranking.rank`, 54 KB), so a hint is a rank and a slice of the table instead
+of a search per cell. The table is built on first use (about 0.1 s), the bot
+builds it at startup.
+"""
+
+from functools import cache
+from typing import Final
+
+from tic_tac_toe.analysis import free_cells, is_finished, play, solve
+from tic_tac_toe.game import Grid
+from tic_tac_toe.ranking import N_CELLS, N_RANKS, rank, unrank_position
+
+# results of a move for the player who makes it
+NO_MOVE: Final = 0  # the cell is taken or the game is over
+LOSS: Final = 1
+DRAW: Final = 2
+WIN: Final = 3
+
+
+@cache
+def results_table() -> bytes:
+    """Results of moves to cells 0..8 of every position, by rank of the position"""
+    table = bytearray(N_CELLS * N_RANKS)
+    for position_rank in range(N_RANKS):
+        position = unrank_position(position_rank)
+        if is_finished(position):
+            continue
+        for cell in free_cells(position):
+            # the value after the move is for the opponent, -1..1 to LOSS..WIN
+            table[N_CELLS * position_rank + cell] = DRAW - solve(play(position, cell))
+    return bytes(table)
+
+
+def move_results(grid: Grid) -> bytes:
+    """Results of moves to cells 3 * r + c for the side to move (X if numbers of
+    marks are equal)
+
+    Raises:
+        ValueError: if numbers of marks are wrong
+    """
+    start = N_CELLS * rank(grid)
+    return results_table()[start : start + N_CELLS]
@@ -0,0 +1,123 @@
+"""Logging that doesn't block the event loop.
+
+Handlers only put records into a queue (`QueueHandler`), and a background
+thread (`QueueListener`) formats and writes them. Events of games are
+structured: `log_event(logger, "move", game=..., chat=...)` keeps fields in
+`record.fields`, and they are rendered as `key=value` pairs or as JSON.
+
+Frequent events can be sampled: with a rate of 0.1 only every 10th event (at
+random) is logged. Rates are set per event name, e.g.
+`TIC_TAC_TOE_LOG_SAMPLING="move=0.1,callback=0.01"`, others are logged always.
+"""
+
+import json
+import logging
+import random
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Any
+
+from tic_tac_toe.metrics import REGISTRY
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# sampling rates by event name
+_sampling: dict[str, float] = {}
+
+
+def parse_sampling(spec: str) -> dict[str, float]:
+    """Rates from "event=rate,event=rate"
+
+    Raises:
+        ValueError: if the format is wrong or a rate is not in [0, 1]
+    """
+    rates = {}
+    for item in filter(None, spec.replace(" ", "").split(",")):
+        event, sep, rate = item.partition("=")
+        if not sep or not 0 <= float(rate) <= 1:
+            raise ValueError(f"Wrong sampling rate {item!r}, expected event=0.1")
+        rates[event] = float(rate)
+    return rates
+
+
+def set_sampling(rates: dict[str, float]) -> None:
+    _sampling.clear()
+    _sampling.update(rates)
+
+
+def log_event(
+    logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any
+) -> None:
+    """Log a structured event, if it is enabled and sampled"""
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sampling.get(event, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        REGISTRY.counter("log_events_dropped", event=event).inc()
+        return
+    logger.log(level, event, extra={"event": event, "fields": fields})
+
+
+class StructuredFormatter(logging.Formatter):
+    """Appends fields of events to the message, or renders a record as JSON"""
+
+    def __init__(self, fmt: str = LOG_FORMAT, as_json: bool = False) -> None:
+        super().__init__(fmt)
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        if self.as_json:
+            data = {
+                "time": self.formatTime(record),
+                "logger": record.name,
+                "level": record.levelname,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                data["exception"] = self.formatException(record.exc_info)
+            elif record.exc_text:
+                data["exception"] = record.exc_text
+            return json.dumps(data, ensure_ascii=False, default=str)
+        message = super().format(record)
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+
+class _QueueHandler(QueueHandler):
+    """Keeps a record as is: the listener formats it, in its thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()  # arguments can change later
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # tracebacks can't be kept
+        return record
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    as_json: bool = False,
+    sampling: dict[str, float] | None = None,
+    handler: logging.Handler | None = None,
+) -> QueueListener:
+    """Send all logs through a queue to a listener thread (started), which writes
+    them to handler (stderr by default). Stop the listener to flush the queue."""
+    if handler is None:
+        handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(as_json=as_json))
+    queue: SimpleQueue[logging.LogRecord] = SimpleQueue()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(_QueueHandler(queue))
+    root.setLevel(level)
+    # set higher logging level for httpx to avoid all GET and POST requests being logged
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    set_sampling(sampling or {})
+    listener = QueueListener(queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,124 @@
+"""Health of the event loop: scheduling lag, slow callbacks, handlers in flight.
+
+All handlers share one event loop, so any handler that blocks it (a search
+or a write in the loop thread) delays every other user.
+
+- a probe sleeps for `interval` and measures how late it wakes up, that is
+  the lag of scheduling -> `loop_lag_seconds`, `loop_lag_max_seconds`,
+  `loop_stalls` (a lag above `threshold`, logged with handlers in flight)
+- handlers run inside `track(name)`: their tasks get the name of the handler
+  and `handlers_in_flight{handler=...}` counts running ones
+- with `slow_callbacks=True` asyncio debug mode reports every step of a task
+  that runs longer than `threshold`, and it is counted by the name of the task
+  (the handler) -> `slow_callbacks{handler=...}`. Debug mode makes the loop
+  slower, so it is off by default
+"""
+
+import asyncio
+import logging
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from tic_tac_toe.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_TASK_NAME = re.compile(r"<Task[^>]* name='([^']*)'")
+
+
+def callback_owner(description: str) -> str:
+    """Name of the task from a description of a slow callback by asyncio"""
+    match = _TASK_NAME.search(description)
+    return match.group(1) if match else "other"
+
+
+class _SlowCallbackFilter(logging.Filter):
+    """Counts reports of slow callbacks of asyncio (they are logged anyway)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.msg == "Executing %s took %.3f seconds" and record.args:
+            owner = callback_owner(str(record.args[0]))  # type: ignore
+            REGISTRY.counter("slow_callbacks", handler=owner).inc()
+        return True
+
+
+class LoopMonitor:
+    """Probe of the event loop and counters of handlers in flight.
+
+    Attributes:
+        interval: seconds between probes
+        threshold: lag (and duration of a callback) that is logged as a stall
+        slow_callbacks: detect slow callbacks with asyncio debug mode
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        threshold: float = 0.1,
+        slow_callbacks: bool = False,
+    ) -> None:
+        if interval <= 0 or threshold <= 0:
+            raise ValueError("interval and threshold should be positive")
+        self.interval = interval
+        self.threshold = threshold
+        self.slow_callbacks = slow_callbacks
+        self.max_lag = 0.0
+        self.in_flight: dict[str, int] = {}
+        self._filter = _SlowCallbackFilter()
+        self._task: asyncio.Task | None = None
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        """Count the current task as a running handler `name`"""
+        task = asyncio.current_task()
+        if task is not None:
+            task.set_name(name)
+        gauge = REGISTRY.gauge("handlers_in_flight", handler=name)
+        self.in_flight[name] = self.in_flight.get(name, 0) + 1
+        gauge.inc()
+        try:
+            yield
+        finally:
+            self.in_flight[name] -= 1
+            gauge.dec()
+
+    def record_lag(self, lag: float) -> None:
+        REGISTRY.gauge("loop_lag_seconds").set(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+            REGISTRY.gauge("loop_lag_max_seconds").set(lag)
+        if lag > self.threshold:
+            REGISTRY.counter("loop_stalls").inc()
+            running = {name: n for name, n in self.in_flight.items() if n}
+            logger.warning(f"event loop lag {lag:.3f} s, handlers in flight {running}")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record_lag(max(loop.time() - expected, 0.0))
+
+    def start(self) -> None:
+        """Start the probe in the running event loop."""
+        if self.slow_callbacks:
+            loop = asyncio.get_running_loop()
+            loop.slow_callback_duration = self.threshold
+            loop.set_debug(True)
+            logging.getLogger("asyncio").addFilter(self._filter)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="loop_monitor")
+
+    async def stop(self) -> None:
+        if self.slow_callbacks:
+            asyncio.get_running_loop().set_debug(False)
+            logging.getLogger("asyncio").removeFilter(self._filter)
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
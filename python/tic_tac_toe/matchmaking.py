@@ -0,0 +1,91 @@
+"""Background matchmaking for multiplayer games.
+
+Players only join the queue in handlers. Pairing and eviction of players who
+waited for too long happen here, in one task that wakes up every `tick` seconds.
+Notifications of a whole batch are sent concurrently.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from tic_tac_toe.multiplayer import GamePersonalized, Multiplayer
+
+logger = logging.getLogger(__name__)
+
+OnPair = Callable[[GamePersonalized], Awaitable[None]]
+OnEvict = Callable[[dict], Awaitable[None]]
+
+
+class Matchmaker:
+    """Pairs waiting players in batches and evicts stale ones.
+
+    Attributes:
+        multiplayer: shared Multiplayer instance with the queue and games
+        on_pair: coroutine to notify both players about a new game
+            (game is given from the point of view of the first player)
+        on_evict: coroutine to notify a player who was removed from the queue
+        tick: seconds between matchmaking rounds
+        wait_timeout: seconds a player can wait in the queue
+        batch_size: max number of games to start in one round
+    """
+
+    def __init__(
+        self,
+        multiplayer: Multiplayer,
+        on_pair: OnPair,
+        on_evict: OnEvict,
+        tick: float = 0.5,
+        wait_timeout: float = 300.0,
+        batch_size: int = 500,
+    ) -> None:
+        self.multiplayer = multiplayer
+        self.on_pair = on_pair
+        self.on_evict = on_evict
+        self.tick = tick
+        self.wait_timeout = wait_timeout
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> tuple[int, int]:
+        """One round of matchmaking. Returns numbers of started games and evictions."""
+        games = self.multiplayer.register_pairs(max_pairs=self.batch_size)
+        evicted = self.multiplayer.evict_stale_players(self.wait_timeout)
+        if not games and not evicted:
+            return 0, 0
+
+        results = await asyncio.gather(
+            *[self.on_pair(game) for game in games],
+            *[self.on_evict(player) for player in evicted],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error("matchmaking notification failed", exc_info=result)
+        logger.info(f"matchmaking: {len(games)} games, {len(evicted)} evicted")
+        return len(games), len(evicted)
+
+    async def run(self) -> None:
+        """Run matchmaking rounds forever."""
+        while True:
+            try:
+                await self.run_once()
+            except Exception:  # matchmaking must survive a bad round
+                logger.exception("matchmaking round failed")
+            await asyncio.sleep(self.tick)
+
+    def start(self) -> None:
+        """Start a background task in the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background task."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
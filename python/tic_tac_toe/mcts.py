@@ -0,0 +1,373 @@
+"""Monte Carlo tree search (UCT) for 3x3 tic tac toe.
+
+Nodes live in parallel typed arrays (`array.array`), a node is an index and the
+root is node 0. Children of a node are created at once on expansion (in random
+order) and stored contiguously, so a node keeps the index of its first child
+and their number. Scores are in half-points (win 2, draw 1, loss 0) for the
+player who moved into the node.
+
+Rollouts play random moves on a packed board (bitboards of crosses and zeros,
+cell (r, c) is bit 3 * r + c) with lookup tables of free cells and wins.
+
+Values of nodes are also proven (MCTS-Solver): terminal positions are known on
+expansion, a node is lost if any child is won by the opponent, and a node with
+all children proven gets the best of their values. Proven nodes don't need
+rollouts, and a proven root ends the search.
+
+`MCTS` keeps its tree between searches. If the new position follows from the
+root by moves in the tree (the bot's move and the reply), the subtree of the
+actual line becomes the new tree and the rest is dropped. `MCTSRust` is the
+same search in Rust (if the extension is built).
+"""
+
+import math
+import random
+import time
+from array import array
+from typing import Final, NamedTuple
+
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.exceptions import GameRulesError
+from tic_tac_toe.game import Grid, Mark, Move
+from tic_tac_toe.ranking import Position, grid_to_position
+from tic_tac_toe.ultimate import FREE_CELLS, FULL, IS_WIN, SIDES
+
+if HAS_RUST:
+    from tic_tac_toe import MCTSRs
+
+UNKNOWN: Final = 2  # proven values are 1 (win), 0 (draw) and -1 (loss)
+NO_NODE: Final = -1
+ROOT_CELL: Final = 9  # the root has no move
+
+DEFAULT_PLAYOUTS: Final = 3_000
+DEFAULT_PLAYOUTS_RS: Final = 50_000
+EXPLORATION: Final = 1.4
+MAX_NODES: Final = 1 << 20
+
+
+class MCTSResult(NamedTuple):
+    """Chosen move and statistics of a search.
+
+    Attributes:
+        move: the most visited move that is not proven to lose
+        value: expected score of the move (0 loss, 1 win), exact if proven
+        playouts: iterations of this search
+        reused: visits of the root kept from previous searches
+        tree_size: number of nodes after the search
+        seconds: wall time of the search
+    """
+
+    move: Move
+    value: float
+    playouts: int
+    reused: int
+    tree_size: int
+    seconds: float
+
+
+def rollout(boards: list[int], side: int, choice=random.choice) -> int | None:
+    """Play random moves until the end. Returns winner side or None for a draw.
+
+    `boards` are modified in place, the position must not be finished.
+    """
+    while True:
+        free = FREE_CELLS[boards[0] | boards[1]]
+        if not free:
+            return None
+        boards[side] |= 1 << choice(free)
+        if IS_WIN[boards[side]]:
+            return side
+        side ^= 1
+
+
+class MCTS:
+    """UCT search with a tree kept between moves.
+
+    Attributes:
+        playouts: number of iterations of a search (None for no limit)
+        time_limit: seconds of a search (None for no limit)
+        exploration: constant of UCB1
+        max_nodes: nodes are not expanded beyond this size of the tree (the root
+            is expanded anyway, so a search always has moves to choose from)
+    """
+
+    def __init__(
+        self,
+        playouts: int | None = DEFAULT_PLAYOUTS,
+        time_limit: float | None = None,
+        exploration: float = EXPLORATION,
+        max_nodes: int = MAX_NODES,
+        seed: int | None = None,
+    ) -> None:
+        if playouts is None and time_limit is None:
+            raise ValueError("Search needs a limit of playouts or time")
+        if time_limit is not None and not 0 <= time_limit < math.inf:
+            raise ValueError("time_limit should be a non-negative number of seconds")
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self._rng = random.Random(seed)
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop the tree"""
+        self.root_position: Position | None = None
+        self.root_side = 0
+        self._parent = array("i")
+        self._first_child = array("i")
+        self._n_children = array("B")
+        self._cell = array("B")
+        self._visits = array("I")
+        self._score = array("I")
+        self._proven = array("b")
+
+    def __len__(self) -> int:
+        return len(self._visits)
+
+    def _add_node(self, parent: int, cell: int, proven: int) -> None:
+        self._parent.append(parent)
+        self._first_child.append(NO_NODE)
+        self._n_children.append(0)
+        self._cell.append(cell)
+        self._visits.append(0)
+        self._score.append(0)
+        self._proven.append(proven)
+
+    def search(self, grid: Grid, mark: Mark) -> MCTSResult:
+        """Best move for mark, the tree is reused if the position follows from it.
+
+        Raises:
+            GameRulesError: if the game is over
+        """
+        start = time.perf_counter()
+        position = grid_to_position(grid)
+        crosses, zeros = position
+        if IS_WIN[crosses] or IS_WIN[zeros] or crosses | zeros == FULL:
+            raise GameRulesError("Game has ended, no more moves!")
+        self._advance(position, SIDES[mark])
+        reused = self._visits[0]
+        if self._first_child[0] == NO_NODE:  # even if the tree is full
+            self._expand(0, list(position), SIDES[mark])
+
+        deadline = math.inf if self.time_limit is None else start + self.time_limit
+        limit = math.inf if self.playouts is None else self.playouts
+        playouts = 0
+        while self._proven[0] == UNKNOWN and playouts < limit:
+            self._playout()
+            playouts += 1
+            if playouts & 63 == 0 and time.perf_counter() > deadline:
+                break
+
+        child = self._best_child()
+        proven = self._proven[child]
+        if proven != UNKNOWN:
+            value = (proven + 1) / 2
+        else:
+            value = self._score[child] / (2 * self._visits[child])
+        return MCTSResult(
+            divmod(self._cell[child], 3),  # type: ignore
+            value,
+            playouts,
+            reused,
+            len(self),
+            time.perf_counter() - start,
+        )
+
+    def _advance(self, position: Position, side: int) -> None:
+        """Make the node of position the root, or start a new tree"""
+        node = NO_NODE
+        if self.root_position is not None:
+            node, boards, to_move = 0, list(self.root_position), self.root_side
+            while (boards[0], boards[1]) != position:
+                new = position[to_move] & ~boards[to_move]
+                if new.bit_count() != 1 or self._first_child[node] == NO_NODE:
+                    node = NO_NODE
+                    break
+                node = self._find_child(node, new.bit_length() - 1)
+                if node == NO_NODE:
+                    break
+                boards[to_move] |= new
+                to_move ^= 1
+            if to_move != side:
+                node = NO_NODE
+
+        if node == NO_NODE:
+            self.reset()
+            self._add_node(NO_NODE, ROOT_CELL, UNKNOWN)
+        elif node != 0:
+            self._reroot(node)
+        self.root_position, self.root_side = position, side
+
+    def _find_child(self, node: int, cell: int) -> int:
+        first = self._first_child[node]
+        for child in range(first, first + self._n_children[node]):
+            if self._cell[child] == cell:
+                return child
+        return NO_NODE
+
+    def _reroot(self, root: int) -> None:
+        """Keep only the subtree of root, copied breadth-first (children stay
+        contiguous)"""
+        first_child, n_children = self._first_child, self._n_children
+        cell, visits, score, proven = (
+            self._cell,
+            self._visits,
+            self._score,
+            self._proven,
+        )
+        self.reset()
+        self._add_node(NO_NODE, ROOT_CELL, proven[root])
+        self._visits[0], self._score[0] = visits[root], score[root]
+        queue = [(root, 0)]
+        for old, new in queue:  # the queue grows while iterating
+            first = first_child[old]
+            if first == NO_NODE:
+                continue
+            self._first_child[new] = len(self)
+            self._n_children[new] = n_children[old]
+            for child in range(first, first + n_children[old]):
+                queue.append((child, len(self)))
+                self._add_node(new, cell[child], proven[child])
+                self._visits[-1], self._score[-1] = visits[child], score[child]
+
+    def _expand(self, node: int, boards: list[int], side: int) -> None:
+        cells = list(FREE_CELLS[boards[0] | boards[1]])
+        self._rng.shuffle(cells)
+        self._first_child[node] = len(self)
+        self._n_children[node] = len(cells)
+        taken = boards[0] | boards[1]
+        for cell in cells:
+            mine = boards[side] | 1 << cell
+            if IS_WIN[mine]:
+                proven = 1
+            elif taken | 1 << cell == FULL:
+                proven = 0
+            else:
+                proven = UNKNOWN
+            self._add_node(node, cell, proven)
+
+    def _select(self, node: int) -> int:
+        """Child with the best UCB1, a proven win at once, proven losses never"""
+        visits, score, proven = self._visits, self._score, self._proven
+        first = self._first_child[node]
+        log_n = math.log(max(visits[node], 1))  # a fresh root has no visits
+        best, best_ucb = first, -math.inf
+        for child in range(first, first + self._n_children[node]):
+            value = proven[child]
+            if value == 1:
+                return child
+            if value == -1:
+                continue
+            n = visits[child]
+            if n == 0:
+                return child
+            ucb = score[child] / (2 * n) + self.exploration * math.sqrt(log_n / n)
+            if ucb > best_ucb:
+                best, best_ucb = child, ucb
+        return best
+
+    def _playout(self) -> None:
+        """One iteration: selection, expansion, rollout and backpropagation"""
+        first_child, cell, proven = self._first_child, self._cell, self._proven
+        node, side = 0, self.root_side
+        boards = list(self.root_position)  # type: ignore
+        while first_child[node] != NO_NODE and proven[node] == UNKNOWN:
+            node = self._select(node)
+            boards[side] |= 1 << cell[node]
+            side ^= 1
+
+        if proven[node] == UNKNOWN and len(self) + 9 <= self.max_nodes:
+            self._expand(node, boards, side)
+            node = first_child[node]  # children are shuffled
+            boards[side] |= 1 << cell[node]
+            side ^= 1
+        value = proven[node]  # for the player who moved into node
+        if value == UNKNOWN:
+            winner = rollout(boards, side, self._rng.choice)
+            value = 0 if winner is None else (-1 if winner == side else 1)
+        self._backpropagate(node, value, proven[node] != UNKNOWN)
+
+    def _backpropagate(self, node: int, value: int, is_proven: bool) -> None:
+        parent, visits, score = self._parent, self._visits, self._score
+        while True:
+            visits[node] += 1
+            score[node] += value + 1
+            node = parent[node]
+            if node == NO_NODE:
+                return
+            if is_proven:
+                is_proven = self._prove(node)
+            value = -value
+
+    def _prove(self, node: int) -> bool:
+        """Try to prove value of node by its children"""
+        proven = self._proven
+        if proven[node] != UNKNOWN:
+            return True
+        best = -1
+        first = self._first_child[node]
+        for child in range(first, first + self._n_children[node]):
+            value = proven[child]
+            if value == 1:  # opponent has a winning move
+                proven[node] = -1
+                return True
+            if value == UNKNOWN:
+                best = UNKNOWN
+            elif best != UNKNOWN:
+                best = max(best, value)
+        if best == UNKNOWN:
+            return False
+        proven[node] = -best
+        return True
+
+    def _best_child(self) -> int:
+        first = self._first_child[0]
+        children = range(first, first + self._n_children[0])
+        proven, visits = self._proven, self._visits
+        for child in children:
+            if proven[child] == 1:
+                return child
+        not_lost = [child for child in children if proven[child] != -1] or children
+        return max(not_lost, key=lambda child: (visits[child], self._score[child]))
+
+
+class MCTSRust:
+    """Same search with the tree in Rust. It releases the GIL while searching."""
+
+    def __init__(
+        self,
+        playouts: int | None = DEFAULT_PLAYOUTS_RS,
+        time_limit: float | None = None,
+        exploration: float = EXPLORATION,
+        max_nodes: int = MAX_NODES,
+        seed: int | None = None,
+    ) -> None:
+        if playouts is None and time_limit is None:
+            raise ValueError("Search needs a limit of playouts or time")
+        self._tree = MCTSRs(playouts, time_limit, exploration, max_nodes, seed)
+
+    def reset(self) -> None:
+        self._tree.reset()
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    def search(self, grid: Grid, mark: Mark) -> MCTSResult:
+        move, *stats = self._tree.search(grid, mark)
+        return MCTSResult(tuple(move), *stats)  # type: ignore
+
+
+# engines that keep a tree between moves of a game
+TREES: Final[dict[str, type[MCTS] | type[MCTSRust]]] = {"mcts": MCTS}
+if HAS_RUST:
+    TREES["mcts_rs"] = MCTSRust
+
+
+def mcts_move(grid: Grid, mark: Mark) -> Move:
+    """Move of a fresh search with the default budget"""
+    return MCTS().search(grid, mark).move
+
+
+def mcts_rs_move(grid: Grid, mark: Mark) -> Move:
+    return MCTSRust().search(grid, mark).move
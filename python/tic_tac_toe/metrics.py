@@ -0,0 +1,101 @@
+"""Tiny in-process metrics: counters and gauges in one registry.
+
+Metrics are identified by name and optional labels, e.g.
+`REGISTRY.counter("reaped_games", kind="multiplayer")`.
+Gauges can be computed lazily by a function at snapshot time.
+"""
+
+import os
+import sys
+from collections.abc import Callable
+
+
+def metric_key(name: str, **labels: str) -> str:
+    """Render name with labels like `name{label="value"}`"""
+    if not labels:
+        return name
+    rendered = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class Counter:
+    """Monotonic counter"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """Value that goes up and down, or is computed by a function on read"""
+
+    __slots__ = ("_value", "_func")
+
+    def __init__(self, func: Callable[[], float] | None = None) -> None:
+        self._value: float = 0
+        self._func = func
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._func() if self._func else self._value
+
+
+class MetricsRegistry:
+    """Registry of all metrics in the process. Metrics are created on first access."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Gauge] = {}
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        key = metric_key(name, **labels)
+        metric = self._metrics.setdefault(key, Counter())
+        if not isinstance(metric, Counter):
+            raise TypeError(f"metric {key} is not a counter")
+        return metric
+
+    def gauge(
+        self, name: str, func: Callable[[], float] | None = None, **labels: str
+    ) -> Gauge:
+        key = metric_key(name, **labels)
+        if func is not None:  # function gauges are replaced, e.g. on bot restart
+            self._metrics[key] = Gauge(func)
+        metric = self._metrics.setdefault(key, Gauge())
+        if not isinstance(metric, Gauge):
+            raise TypeError(f"metric {key} is not a gauge")
+        return metric
+
+    def snapshot(self) -> dict[str, float]:
+        """Current values of all metrics sorted by key"""
+        return {key: self._metrics[key].value for key in sorted(self._metrics)}
+
+    def render(self) -> str:
+        """Text representation: one `key value` per line"""
+        return "\n".join(f"{key} {value:g}" for key, value in self.snapshot().items())
+
+
+REGISTRY = MetricsRegistry()
+
+
+def process_memory_bytes() -> float:
+    """Resident memory of the process (current on Linux, peak elsewhere)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource  # not available on Windows
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
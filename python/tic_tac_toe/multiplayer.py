@@ -1,5 +1,8 @@
 """Module with helpers for multiplayer game of Tic Tac Toe"""
-from collections.abc import Iterator
+import itertools
+import time
+from bisect import bisect_left, insort
+from collections.abc import Callable
 from typing import NamedTuple, TypeAlias
 
 from tic_tac_toe.exceptions import (
@@ -11,6 +14,7 @@ from tic_tac_toe.exceptions import (
 from tic_tac_toe.game import (
     CROSS,
     GameConductor,
+    GameConductorPool,
     HandleForPlayer,
     Mark,
 )
@@ -20,13 +24,28 @@ ChatId: TypeAlias = int
 
 
 class ChatPlayerInfo(NamedTuple):
-    """Struct with basic info about user in the game."""
+    """Struct with basic info about user in the game.
+
+    Ratings and statistics are kept by user_id (the same user in any chat),
+    chat_id is used when it is unknown.
+    """
 
     chat_id: ChatId
     message_id: MessageId
     handle: HandleForPlayer
     mark: Mark
     user_name: str
+    user_id: int | None = None
+
+    @property
+    def player_id(self) -> int:
+        return self.chat_id if self.user_id is None else self.user_id
+
+
+def player_id(player_dict: dict) -> int:
+    """Id of a player in the queue for ratings, see ChatPlayerInfo"""
+    user_id = player_dict.get("user_id")
+    return player_dict["chat_id"] if user_id is None else user_id
 
 
 class Game(NamedTuple):
@@ -34,6 +53,7 @@ class Game(NamedTuple):
 
     chat_dict: dict[ChatId, ChatPlayerInfo]
     game_conductor: GameConductor
+    game_id: int = 0
 
 
 class GamePersonalized(NamedTuple):
@@ -42,55 +62,108 @@ class GamePersonalized(NamedTuple):
     myself: ChatPlayerInfo
     opponent: ChatPlayerInfo
     game_conductor: GameConductor
+    game_id: int = 0
 
 
 class PlayersQueue:
-    """Queue for players waiting for multiplayer game."""
+    """Queue for players waiting for multiplayer game.
 
-    def __init__(self):
-        """One list for incoming players. Another - for outcoming."""
-        self.inlist = []
-        self.outlist = []
+    Players are kept in a dict ordered by arrival, so membership checks, lookups
+    and removals are O(1) and the oldest waiters are always at the front.
 
-    def enqueue(self, value: dict) -> None:
+    With `rating_of` (rating by player_id), players are also kept in a list
+    sorted by rating (at the time they joined), so the closest-rated player is
+    found by binary search.
+    """
+
+    def __init__(self, rating_of: Callable[[ChatId], float] | None = None):
+        """Players by chat_id (in order of arrival) and time when they joined."""
+        self._players: dict[ChatId, dict] = {}
+        self._joined_at: dict[ChatId, float] = {}
+        self.rating_of = rating_of
+        # (rating, arrival, chat_id) in sorted order
+        self._ladder: list[tuple[float, int, ChatId]] = []
+        self._ladder_key: dict[ChatId, tuple[float, int, ChatId]] = {}
+        self._arrivals = itertools.count()
+
+    def enqueue(self, value: dict, joined_at: float | None = None) -> None:
         """Add element to queue"""
         assert "chat_id" in value and "message_id" in value
-        self.inlist.append(value)
+        chat_id = value["chat_id"]
+        if self.rating_of is not None:
+            key = (self.rating_of(player_id(value)), next(self._arrivals), chat_id)
+            self._ladder_key[chat_id] = key
+            insort(self._ladder, key)
+        self._players[chat_id] = value
+        self._joined_at[chat_id] = time.monotonic() if joined_at is None else joined_at
+
+    def _remove_from_ladder(self, chat_id: ChatId) -> None:
+        key = self._ladder_key.pop(chat_id, None)
+        if key is not None:
+            del self._ladder[bisect_left(self._ladder, key)]
 
     def dequeue(self) -> dict:
         """Pop first element from queue"""
-        if not self.outlist:
-            while self.inlist:
-                self.outlist.append(self.inlist.pop())
-        return self.outlist.pop()
-
-    def _union_queues(self) -> Iterator[dict]:
-        for player in self.inlist + self.outlist:
-            yield player
+        if not self._players:
+            raise IndexError("dequeue from empty queue")
+        chat_id = next(iter(self._players))
+        del self._joined_at[chat_id]
+        self._remove_from_ladder(chat_id)
+        return self._players.pop(chat_id)
+
+    def dequeue_closest(self, rating: float) -> dict:
+        """Pop the player with the closest rating (the earliest of equally close)"""
+        if self.rating_of is None:
+            raise TicTacToeException("Queue doesn't know ratings")
+        if not self._players:
+            raise IndexError("dequeue from empty queue")
+        i = bisect_left(self._ladder, (rating,))
+        candidates = self._ladder[max(i - 1, 0) : i + 1]
+        _, _, chat_id = min(candidates, key=lambda key: (abs(key[0] - rating), key[1]))
+        del self._joined_at[chat_id]
+        self._remove_from_ladder(chat_id)
+        return self._players.pop(chat_id)
+
+    def dequeue_stale(self, older_than: float) -> list[dict]:
+        """Pop all players who joined before `older_than` (time.monotonic scale).
+
+        Only the stale head of the queue is visited.
+        """
+        stale = []
+        for chat_id, joined_at in self._joined_at.items():
+            if joined_at >= older_than:
+                break
+            stale.append(chat_id)
+        for chat_id in stale:
+            del self._joined_at[chat_id]
+            self._remove_from_ladder(chat_id)
+        return [self._players.pop(chat_id) for chat_id in stale]
+
+    def waiting_since(self, chat_id: ChatId) -> float:
+        """When the player joined the queue (time.monotonic scale)"""
+        try:
+            return self._joined_at[chat_id]
+        except KeyError:
+            raise TicTacToeException("No such player in queue") from None
 
     def __contains__(self, chat_id) -> bool:
-        for player in self._union_queues():
-            if chat_id == player["chat_id"]:
-                return True
-        return False
+        return chat_id in self._players
 
     def remove(self, chat_id) -> None:
-        for queue in (self.inlist, self.outlist):
-            for idx, player in enumerate(queue):
-                if chat_id == player["chat_id"]:
-                    del queue[idx]
-                    return
-
-        raise TicTacToeException("No such player in queue")
+        if chat_id not in self._players:
+            raise TicTacToeException("No such player in queue")
+        del self._players[chat_id]
+        del self._joined_at[chat_id]
+        self._remove_from_ladder(chat_id)
 
     def get(self, chat_id: ChatId) -> dict:
-        for player in self._union_queues():
-            if chat_id == player["chat_id"]:
-                return player
-        raise TicTacToeException("No such player in queue")
+        try:
+            return self._players[chat_id]
+        except KeyError:
+            raise TicTacToeException("No such player in queue") from None
 
     def __len__(self) -> int:
-        return len(list(self._union_queues()))
+        return len(self._players)
 
 
 class Multiplayer:
@@ -99,26 +172,38 @@ class Multiplayer:
     Attributes:
         players_queue: queue for players waiting for multiplayer game
         games: dict that links chat_id to a Game. For 1 game there are two links
-            from two players for convenience.
+            from two players for convenience. Every game gets a unique game_id.
+            A finished game stays here until it is removed or rematched.
+        conductors: pool of game conductors, removed games return there
     Methods:
         register_player: put player in the queue
-        register_pair: start a game with two earliest players
+        register_pair: start a game of the earliest player with the closest-rated
+            one (with ratings) or the next one
+        register_pairs: start as many games as possible from the queue
+        evict_stale_players: remove players who have been waiting for too long
+        request_rematch: play the finished game again with swapped marks
+        get_rematch_request: message of a player waiting for a rematch
+        is_game_over: is the game of the player finished
         get_game: get personalized game by chat_id
+        get_game_by_id: get game by game_id (for spectators)
+        live_games: games in progress
         remove_game: remove game from current_games by chat_id
         is_this_player_in_queue
         remove_player_from_queue
         get_player_from_queue
     """
 
-    def __init__(self) -> None:
-        self.players_queue = PlayersQueue()
+    def __init__(self, rating_of: Callable[[ChatId], float] | None = None) -> None:
+        self.players_queue = PlayersQueue(rating_of)
         self.games: dict[ChatId, Game] = {}
+        self._games_by_id: dict[int, Game] = {}
+        self.conductors = GameConductorPool()
+        self._game_ids = itertools.count(1)
+        self._rematch_requests: dict[ChatId, MessageId] = {}
 
     @property
-    def is_player_waiting(self):
+    def is_player_waiting(self) -> bool:
         """Check if somebody is already in the queue, waiting for a game"""
-        if len(self.players_queue) >= 2:
-            raise ValueError("Too many players wait for game, tinder somebody please")
         return len(self.players_queue) != 0
 
     def register_player(self, **kwargs):
@@ -136,17 +221,26 @@ class Multiplayer:
 
         self.players_queue.enqueue(kwargs)
 
-    def register_pair(self) -> None:
+    def register_pair(self) -> GamePersonalized:
         """Try to make a pair from players in the queue and start a game.
 
+        The earliest player is paired with the closest-rated one if the queue
+        knows ratings, otherwise with the next one.
+        Returns the game from the point of view of the first player (CROSS).
         If not enough players (0 or 1), raises NotEnoughPlayersError
         """
-        if len(self.players_queue) < 2:
+        queue = self.players_queue
+        if len(queue) < 2:
             raise NotEnoughPlayersError("Not enough players")
-        player1_dict = self.players_queue.dequeue()
-        player2_dict = self.players_queue.dequeue()
+        player1_dict = queue.dequeue()
+        if queue.rating_of is None:
+            player2_dict = queue.dequeue()
+        else:
+            player2_dict = queue.dequeue_closest(
+                queue.rating_of(player_id(player1_dict))
+            )
 
-        gc = GameConductor()
+        gc = self.conductors.acquire()
         # First joined player will get CROSS always
         handle1 = gc.get_handle(CROSS, what_is_left=True)
         handle2 = gc.get_handle(CROSS, what_is_left=True)
@@ -160,10 +254,48 @@ class Multiplayer:
                 ),
             },
             gc,
+            next(self._game_ids),
         )
         # two links for each player
         self.games[player1_dict["chat_id"]] = game
         self.games[player2_dict["chat_id"]] = game
+        self._games_by_id[game.game_id] = game
+        return self._make_personalized_game(game, player1_dict["chat_id"])
+
+    def register_pairs(self, max_pairs: int | None = None) -> list[GamePersonalized]:
+        """Pair waiting players (earliest first) until the queue has less than 2.
+
+        Arguments:
+            max_pairs: upper bound of games to start in one batch
+        """
+        games = []
+        while len(self.players_queue) >= 2 and (
+            max_pairs is None or len(games) < max_pairs
+        ):
+            games.append(self.register_pair())
+        return games
+
+    def evict_stale_players(
+        self, timeout: float, now: float | None = None
+    ) -> list[dict]:
+        """Remove players who have been waiting longer than `timeout` seconds.
+
+        Returns info of evicted players, so they can be notified.
+        """
+        now = time.monotonic() if now is None else now
+        return self.players_queue.dequeue_stale(now - timeout)
+
+    def get_game_by_id(self, game_id: int) -> Game | None:
+        return self._games_by_id.get(game_id)
+
+    def live_games(self, limit: int | None = None) -> list[Game]:
+        """Games in progress, oldest first"""
+        games = (
+            game
+            for game in self._games_by_id.values()
+            if not game.game_conductor.is_game_over
+        )
+        return list(itertools.islice(games, limit))
 
     def get_game(self, chat_id: ChatId) -> GamePersonalized:
         "Get personalized game by chat_id"
@@ -175,13 +307,52 @@ class Multiplayer:
         chat_id_opponent = game_pers.opponent.chat_id
         del self.games[chat_id]
         del self.games[chat_id_opponent]
+        del self._games_by_id[game_pers.game_id]
+        self._rematch_requests.pop(chat_id, None)
+        self._rematch_requests.pop(chat_id_opponent, None)
+        self.conductors.release(game_pers.game_conductor)
+
+    def request_rematch(
+        self, chat_id: ChatId, message_id: MessageId
+    ) -> GamePersonalized | None:
+        """Player wants to play the finished game again in a message message_id.
+
+        When the opponent wants it too, the same game (pairing, game_id and
+        conductor) starts again with swapped marks and is returned from the point
+        of view of the player with CROSS. Until then returns None.
+        """
+        game = self.games[chat_id]
+        if not game.game_conductor.is_game_over:
+            raise CurrentGameError("Game is not over yet")
+        self._rematch_requests[chat_id] = message_id
+        if not all(player in self._rematch_requests for player in game.chat_dict):
+            return None
+
+        game.game_conductor.rematch()
+        for player, info in game.chat_dict.items():
+            game.chat_dict[player] = info._replace(
+                mark=info.handle.mark, message_id=self._rematch_requests.pop(player)
+            )
+        first = next(p for p, info in game.chat_dict.items() if info.mark == CROSS)
+        return self._make_personalized_game(game, first)
+
+    def get_rematch_request(self, chat_id: ChatId) -> MessageId | None:
+        """Message of a player who waits for the opponent to accept a rematch"""
+        return self._rematch_requests.get(chat_id)
+
+    def is_game_over(self, chat_id: ChatId) -> bool:
+        """Game of the player is finished (and kept for a rematch)"""
+        return self.games[chat_id].game_conductor.is_game_over
 
     @staticmethod
     def _make_personalized_game(game: Game, chat_id: ChatId) -> GamePersonalized:
         """Convert Game into GamePersonalized"""
         other_chat_id = list(set(game.chat_dict.keys()) - {chat_id})[0]
         return GamePersonalized(
-            game.chat_dict[chat_id], game.chat_dict[other_chat_id], game.game_conductor
+            game.chat_dict[chat_id],
+            game.chat_dict[other_chat_id],
+            game.game_conductor,
+            game.game_id,
         )
 
     def is_this_player_in_queue(self, chat_id: ChatId) -> bool:
@@ -0,0 +1,120 @@
+"""Settings of the HTTP layer of the bot: pools, timeouts, keep-alive.
+
+Every move makes a few Bot API calls (answer a button, edit one or two
+messages), so under load the pool of connections limits throughput. Outbound
+calls and long polling (`getUpdates`) have separate pools, so a poll that
+waits for updates never takes a connection from handlers.
+
+A bigger pool isn't faster: httpx matches queued calls against all connections
+of the pool on every change, so with hundreds of connections the bot spends
+its CPU in the pool (`experiments/benchmark_network.py`). A small pool with
+keep-alive is the fastest, a call that waits for a connection is cheaper than
+one more connection.
+
+Settings are read from a TOML file (table `[network]`, the path is in
+`TIC_TAC_TOE_NETWORK_CONFIG`), then from environment variables
+`TIC_TAC_TOE_<NAME>` that override the file, e.g. `TIC_TAC_TOE_POOL_SIZE=64`.
+"""
+
+import os
+import tomllib
+from collections.abc import Mapping
+from typing import Any, Final, NamedTuple
+
+import httpx
+from telegram.ext import Application, ApplicationBuilder
+from telegram.request import HTTPXRequest
+
+ENV_PREFIX: Final = "TIC_TAC_TOE_"
+CONFIG_ENV: Final = "TIC_TAC_TOE_NETWORK_CONFIG"
+
+
+class NetworkSettings(NamedTuple):
+    """Settings of connections to the Bot API.
+
+    Attributes:
+        pool_size: connections of outbound calls (edits, answers, messages)
+        keepalive_connections: idle connections kept open for reuse, 0 to open
+            a new connection for every call
+        keepalive_expiry: seconds an idle connection is kept
+        pool_timeout: seconds a call waits for a free connection
+        connect_timeout, read_timeout, write_timeout: seconds of a call
+        updates_pool_size: connections of `getUpdates`
+        updates_read_timeout: seconds to wait for a response of `getUpdates`
+            (added to the timeout of long polling)
+        concurrent_updates: updates processed at once, 1 for one by one
+        base_url: Bot API server, a local one for benchmarks
+    """
+
+    pool_size: int = 16
+    keepalive_connections: int = 16
+    keepalive_expiry: float = 30.0
+    pool_timeout: float = 5.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    write_timeout: float = 10.0
+    updates_pool_size: int = 1
+    updates_read_timeout: float = 10.0
+    concurrent_updates: int = 64
+    base_url: str = "https://api.telegram.org/bot"
+
+
+def load_settings(
+    environ: Mapping[str, str] = os.environ, path: str | None = None
+) -> NetworkSettings:
+    """Settings from a config file and environment (which has the priority)
+
+    Raises:
+        ValueError: if a value has a wrong type or is out of range
+    """
+    path = path or environ.get(CONFIG_ENV)
+    values: dict[str, Any] = {}
+    if path:
+        with open(path, "rb") as config:
+            values.update(tomllib.load(config).get("network", {}))
+    unknown = set(values) - set(NetworkSettings._fields)
+    if unknown:
+        raise ValueError(f"Unknown network settings: {', '.join(sorted(unknown))}")
+    for name in NetworkSettings._fields:
+        if ENV_PREFIX + name.upper() in environ:
+            values[name] = environ[ENV_PREFIX + name.upper()]
+    types = NetworkSettings.__annotations__
+    settings = NetworkSettings(**{name: types[name](v) for name, v in values.items()})
+    if settings.pool_size < 1 or settings.updates_pool_size < 1:
+        raise ValueError("Pools should have at least one connection")
+    if settings.concurrent_updates < 1:
+        raise ValueError("concurrent_updates should be positive")
+    if settings.keepalive_connections < 0:
+        raise ValueError("keepalive_connections should be non-negative")
+    return settings
+
+
+def make_request(settings: NetworkSettings, updates: bool = False) -> HTTPXRequest:
+    """HTTP client of outbound calls, or of `getUpdates`"""
+    pool_size = settings.updates_pool_size if updates else settings.pool_size
+    read_timeout = settings.updates_read_timeout if updates else settings.read_timeout
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=min(settings.keepalive_connections, pool_size),
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        read_timeout=read_timeout,
+        write_timeout=settings.write_timeout,
+        connect_timeout=settings.connect_timeout,
+        pool_timeout=settings.pool_timeout,
+        httpx_kwargs={"limits": limits},
+    )
+
+
+def application_builder(token: str, settings: NetworkSettings) -> ApplicationBuilder:
+    """Builder of an application with the HTTP layer from settings"""
+    return (
+        Application.builder()
+        .token(token)
+        .base_url(settings.base_url)
+        .request(make_request(settings))
+        .get_updates_request(make_request(settings, updates=True))
+        .concurrent_updates(settings.concurrent_updates)
+    )
@@ -0,0 +1,345 @@
+"""Database of solved positions of m x n tic tac toe (k in a row wins).
+
+Values of all positions are computed by retrograde analysis: layers of
+positions by the number of marks are solved from the full board back to the
+empty one, and a layer needs only values of the next one. Positions of a layer
+are split into chunks, worker processes solve them with NumPy and write values
+straight into the output file mapped into memory (shared pages).
+
+File layout (little-endian):
+- header of HEADER_SIZE bytes: magic, version, rows, cols, k, number of
+  positions, CRC32 of the table
+- table: one byte per position, indexed by the rank of the position
+
+Rank is a perfect index of all 3 ** (rows * cols) grids: cell i (in reading
+order) is a base-3 digit, 0 free, 1 X, 2 O. A byte is 0 for positions that
+can't happen in a game (wrong numbers of marks, a line of the side to move),
+otherwise it has the result for the side to move (X if numbers of marks are
+equal) in two high bits and the number of moves to the end with perfect play
+in six low bits (the winner hurries, the loser delays, draws have 0).
+
+The table is not indexed by `ranking.rank`: that perfect hash is built for
+the 3x3 board (6046 legal grids), while the database solves any variant up to
+MAX_CELLS cells. A base-3 index works for every board size, keeps the rank of
+a child a single addition away (`rank + code * 3 ** cell`) for vectorized
+retrograde analysis, and costs a table 3-4 times larger than the number of
+positions with legal numbers of marks (19 KB for 3x3, 43 MB for 4x4).
+
+`PositionDB` maps a file read-only, so all processes of the bot share the same
+physical pages. `PositionDbRs` reads the same mapping from Rust through the
+buffer protocol (see `PositionDB.rust_reader`).
+
+Run: `python -m tic_tac_toe.position_db build --rows 4 --cols 4 --k 4 db.bin`
+"""
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Final, NamedTuple
+
+import numpy as np
+
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.exceptions import PositionDbError
+from tic_tac_toe.game import CROSS, FREE_SPACE, ZERO, Mark, Move
+
+if HAS_RUST:
+    from tic_tac_toe import PositionDbRs
+
+MAGIC: Final = b"TTTPOSDB"
+VERSION: Final = 1
+HEADER: Final = struct.Struct("<8sHBBB3xQI")
+HEADER_SIZE: Final = 64
+MAX_CELLS: Final = 16  # 43 MB table (4x4)
+
+# results for the side to move
+ILLEGAL: Final = 0
+LOSS: Final = 1
+DRAW: Final = 2
+WIN: Final = 3
+
+CODES: Final = {FREE_SPACE: 0, CROSS: 1, ZERO: 2}
+CHUNK_SIZE: Final = 1 << 18
+
+
+class Variant(NamedTuple):
+    """Board of rows x cols, k marks in a row win"""
+
+    rows: int = 3
+    cols: int = 3
+    k: int = 3
+
+    @property
+    def n_cells(self) -> int:
+        return self.rows * self.cols
+
+    @property
+    def n_positions(self) -> int:
+        return 3**self.n_cells
+
+    def lines(self) -> Iterator[tuple[int, ...]]:
+        """Cells of all winning lines"""
+        for r in range(self.rows):
+            for c in range(self.cols):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_r, end_c = r + dr * (self.k - 1), c + dc * (self.k - 1)
+                    if 0 <= end_r < self.rows and 0 <= end_c < self.cols:
+                        yield tuple(
+                            (r + dr * i) * self.cols + c + dc * i for i in range(self.k)
+                        )
+
+    def check(self) -> None:
+        if not (1 <= self.n_cells <= MAX_CELLS):
+            raise ValueError(f"Board should have from 1 to {MAX_CELLS} cells")
+        if not (1 <= self.k <= max(self.rows, self.cols)):
+            raise ValueError(f"Can't make {self.k} in a row on this board")
+
+
+def encode(result: int, moves: int) -> int:
+    return result << 6 | moves
+
+
+def decode(value: int) -> tuple[int, int]:
+    """Result for the side to move and moves to the end"""
+    return value >> 6, value & 63
+
+
+def _mark_counts(n_cells: int) -> tuple[np.ndarray, np.ndarray]:
+    """Number of marks and X minus O for every rank"""
+    marks = balance = np.zeros(1, dtype=np.int8)
+    for _ in range(n_cells):  # the lowest digit is the first cell
+        marks = (marks[:, None] + np.array([0, 1, 1], dtype=np.int8)).ravel()
+        balance = (balance[:, None] + np.array([0, 1, -1], dtype=np.int8)).ravel()
+    return marks, balance
+
+
+def _open_table(path: Path, variant: Variant, writable: bool = False) -> np.ndarray:
+    return np.memmap(
+        path,
+        dtype=np.uint8,
+        mode="r+" if writable else "r",
+        offset=HEADER_SIZE,
+        shape=(variant.n_positions,),
+    )
+
+
+def solve_ranks(
+    table: np.ndarray, variant: Variant, ranks: np.ndarray, to_move: int
+) -> np.ndarray:
+    """Values of positions with the same side to move (code 1 X, 2 O).
+    Positions after any move must be already solved in table."""
+    powers = 3 ** np.arange(variant.n_cells, dtype=np.int64)
+    digits = (ranks[:, None] // powers % 3).astype(np.uint8)
+    mover_won = np.zeros(len(ranks), dtype=bool)
+    other_won = np.zeros(len(ranks), dtype=bool)
+    for line in variant.lines():
+        mover_won |= (digits[:, line] == to_move).all(axis=1)
+        other_won |= (digits[:, line] == 3 - to_move).all(axis=1)
+
+    fastest_win = np.full(len(ranks), 255, dtype=np.uint8)
+    can_draw = np.zeros(len(ranks), dtype=bool)
+    slowest_loss = np.full(len(ranks), -1, dtype=np.int16)
+    for cell in range(variant.n_cells):
+        (free,) = np.nonzero(digits[:, cell] == 0)
+        result, moves = np.divmod(table[ranks[free] + to_move * powers[cell]], 64)
+        won = free[result == LOSS]  # opponent loses after this move
+        fastest_win[won] = np.minimum(fastest_win[won], moves[result == LOSS])
+        can_draw[free[result == DRAW]] = True
+        lost = free[result == WIN]
+        slowest_loss[lost] = np.maximum(slowest_loss[lost], moves[result == WIN])
+
+    values = np.full(len(ranks), encode(DRAW, 0), dtype=np.uint8)  # full board
+    losing = slowest_loss >= 0
+    values[losing] = encode(LOSS, 0) + slowest_loss[losing] + 1
+    values[can_draw] = encode(DRAW, 0)
+    winning = fastest_win < 255
+    values[winning] = encode(WIN, 0) + fastest_win[winning] + 1
+    values[other_won] = encode(LOSS, 0)  # game is over
+    values[mover_won] = ILLEGAL  # mover can't have a line before the move
+    return values
+
+
+def _solve_chunk(path: Path, variant: Variant, ranks: np.ndarray, to_move: int) -> int:
+    table = _open_table(path, variant, writable=True)
+    table[ranks] = solve_ranks(table, variant, ranks, to_move)
+    table.flush()
+    return len(ranks)
+
+
+def build(
+    path: str | Path,
+    variant: Variant = Variant(),
+    processes: int | None = 1,
+    chunk_size: int = CHUNK_SIZE,
+) -> "PositionDB":
+    """Solve all positions of variant into a file at path.
+
+    Layers are solved one after another, chunks of a layer in `processes`
+    worker processes (None for a process per CPU, 1 for this process only).
+    """
+    variant.check()
+    path = Path(path)
+    with open(path, "wb") as file:
+        file.truncate(HEADER_SIZE + variant.n_positions)
+
+    marks, balance = _mark_counts(variant.n_cells)
+    executor = ProcessPoolExecutor(processes) if processes != 1 else None
+    try:
+        for n_marks in range(variant.n_cells, -1, -1):
+            to_move = 1 if n_marks % 2 == 0 else 2
+            (ranks,) = np.nonzero((marks == n_marks) & (balance == n_marks % 2))
+            chunks = np.array_split(ranks, max(1, math.ceil(len(ranks) / chunk_size)))
+            args = (repeat(path), repeat(variant), chunks, repeat(to_move))
+            if executor is None:
+                list(map(_solve_chunk, *args))
+            else:
+                list(executor.map(_solve_chunk, *args))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    table = _open_table(path, variant)
+    checksum = zlib.crc32(table)
+    del table
+    header = HEADER.pack(MAGIC, VERSION, *variant, variant.n_positions, checksum)
+    with open(path, "r+b") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+    return PositionDB(path, verify=False)
+
+
+class PositionDB:
+    """Read-only table of solved positions mapped into memory.
+
+    Attributes:
+        variant: rows, cols and k of the solved game
+        checksum: CRC32 of the table from the header
+        table: NumPy view of the table (no copy)
+    Raises:
+        PositionDbError: if the file is not a database of this version, or
+            the checksum doesn't match (with `verify`)
+    """
+
+    def __init__(self, path: str | Path, verify: bool = True) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise PositionDbError(f"{self.path} is too small for a database")
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *variant, n_positions, self.checksum = HEADER.unpack_from(
+            self._mmap
+        )
+        if magic != MAGIC:
+            self.close()
+            raise PositionDbError(f"{self.path} is not a database of positions")
+        if version != VERSION:
+            self.close()
+            raise PositionDbError(f"Version {version} is not supported")
+        self.variant = Variant(*variant)
+        if n_positions != self.variant.n_positions or (
+            size != HEADER_SIZE + n_positions
+        ):
+            self.close()
+            raise PositionDbError(f"{self.path} has a wrong size of the table")
+        self.table = np.frombuffer(self._mmap, dtype=np.uint8, offset=HEADER_SIZE)
+        if verify and zlib.crc32(self.table) != self.checksum:
+            self.close()
+            raise PositionDbError(f"{self.path} is corrupted (checksum mismatch)")
+
+    def close(self) -> None:
+        """Unmap the file. Rust readers of this database should be dropped first."""
+        self.__dict__.pop("table", None)
+        self._mmap.close()
+
+    def __enter__(self) -> "PositionDB":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def rank(self, grid: list[list[Mark]]) -> int:
+        rows, cols, _ = self.variant
+        if len(grid) != rows or any(len(row) != cols for row in grid):
+            raise ValueError(f"Grid should be {rows}x{cols}")
+        rank = 0
+        for mark in reversed([mark for row in grid for mark in row]):
+            rank = rank * 3 + CODES[mark]
+        return rank
+
+    def lookup(self, grid: list[list[Mark]]) -> tuple[int, int]:
+        """Result for the side to move (ILLEGAL if the position is impossible)
+        and moves to the end"""
+        return decode(int(self.table[self.rank(grid)]))
+
+    def best_move(self, grid: list[list[Mark]], mark: Mark) -> Move:
+        """The fastest win, a draw, or the slowest loss for mark"""
+        rank, code = self.rank(grid), CODES[mark]
+        best_move, best_key = None, None
+        for cell in range(self.variant.n_cells):
+            r, c = divmod(cell, self.variant.cols)
+            if grid[r][c] != FREE_SPACE:
+                continue
+            result, moves = decode(int(self.table[rank + code * 3**cell]))
+            if result == ILLEGAL:
+                raise PositionDbError(f"It is not the move of {mark} or game is over")
+            # result is for the opponent
+            key = (-result, moves if result == WIN else -moves)
+            if best_key is None or key > best_key:
+                best_move, best_key = (r, c), key
+        if best_move is None:
+            raise PositionDbError("No free cells")
+        return best_move
+
+    def rust_reader(self) -> "PositionDbRs":
+        """Reader in Rust over the same mapping (no copy of the table)
+
+        Raises:
+            PositionDbError: if the Rust extension isn't built
+        """
+        if not HAS_RUST:
+            raise PositionDbError("Rust extension isn't built")
+        return PositionDbRs(self._mmap)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="solve a variant into a file")
+    build_parser.add_argument("path")
+    build_parser.add_argument("--rows", type=int, default=3)
+    build_parser.add_argument("--cols", type=int, default=3)
+    build_parser.add_argument("--k", type=int, default=3)
+    build_parser.add_argument("--processes", type=int, default=None)
+    info_parser = commands.add_parser("info", help="verify a file and show stats")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        variant = Variant(args.rows, args.cols, args.k)
+        build(args.path, variant, args.processes).close()
+        print(f"{variant} solved in {time.perf_counter() - start:.2f} s")
+
+    with PositionDB(args.path) as db:
+        rows, cols, _ = db.variant
+        results = np.bincount(db.table >> 6, minlength=4)
+        result, moves = db.lookup([[FREE_SPACE] * cols for _ in range(rows)])
+        print(
+            f"{db.variant}: {db.variant.n_positions} ranks, "
+            f"legal: {db.variant.n_positions - results[ILLEGAL]} "
+            f"(wins: {results[WIN]}, draws: {results[DRAW]}, "
+            f"losses: {results[LOSS]}), empty board: "
+            f"{['illegal', 'loss', 'draw', 'win'][result]} in {moves} moves"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""On-demand profiling of the running bot.
+
+Nothing is profiled until a session is started (by a signal or by an admin
+command), so there is no cost in normal operation. A session lasts N seconds:
+
+- `cProfile` collects deterministic stats of the event loop thread, where all
+  handlers run -> `<name>.pstats`
+- a sampling thread takes stacks of all threads every few ms, so searches in
+  worker threads (`asyncio.to_thread`) are seen too -> `<name>.collapsed`
+  (one `thread;frame;frame count` per line, for flamegraphs)
+- `tracemalloc` snapshot with top allocations -> `<name>.tracemalloc.txt`
+
+Files are written in a thread, names have a time and a number of the session.
+"""
+
+import asyncio
+import cProfile
+import itertools
+import logging
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import NamedTuple
+
+from tic_tac_toe.exceptions import ProfilingError
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileResult(NamedTuple):
+    """Paths to files of a finished profiling session"""
+
+    pstats: Path
+    collapsed: Path
+    tracemalloc: Path
+    n_samples: int
+
+
+def collapse_stack(frame: FrameType | None) -> str:
+    """Render stack from the root to frame as `module:function;...`"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Thread that samples stacks of all other threads at a fixed interval.
+    Stacks start with the name of the thread."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    name = names.get(thread_id, thread_id)
+                    self.stacks[f"{name};{collapse_stack(frame)}"] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class Profiler:
+    """Runs one profiling session at a time and writes results to output_dir.
+
+    Attributes:
+        output_dir: directory for result files
+        sample_interval: seconds between stack samples
+        top_allocations: number of lines in tracemalloc report
+    """
+
+    def __init__(
+        self,
+        output_dir: str | Path = "profiles",
+        sample_interval: float = 0.005,
+        top_allocations: int = 30,
+    ) -> None:
+        self.output_dir = Path(output_dir)
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self._lock = asyncio.Lock()
+        self._sessions = itertools.count(1)
+        self._signal_task: asyncio.Task | None = None
+
+    @property
+    def is_active(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float) -> ProfileResult:
+        """Profile the bot for `seconds`. Must run in the loop."""
+        if self.is_active:
+            raise ProfilingError("Profiling session is already running")
+        async with self._lock:
+            logger.info(f"profiling session for {seconds} s has started")
+            started_tracemalloc = not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            sampler = StackSampler(self.sample_interval)
+            profiler = cProfile.Profile()
+
+            sampler.start()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+                sampler.stop()
+                snapshot = tracemalloc.take_snapshot()
+                if started_tracemalloc:
+                    tracemalloc.stop()
+
+            result = await asyncio.to_thread(
+                self._write, profiler, sampler.stacks, snapshot, next(self._sessions)
+            )
+            logger.info(f"profiling session has ended, results: {result.pstats}")
+            return result
+
+    def _write(
+        self,
+        profiler: cProfile.Profile,
+        stacks: Counter[str],
+        snapshot: tracemalloc.Snapshot,
+        session: int,
+    ) -> ProfileResult:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self.output_dir / time.strftime(f"profile-%Y%m%d-%H%M%S-{session}")
+
+        pstats_path = prefix.with_suffix(".pstats")
+        profiler.dump_stats(pstats_path)
+
+        collapsed_path = prefix.with_suffix(".collapsed")
+        collapsed_path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        )
+
+        tracemalloc_path = prefix.with_suffix(".tracemalloc.txt")
+        top = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        ).statistics("lineno")[: self.top_allocations]
+        tracemalloc_path.write_text("".join(f"{stat}\n" for stat in top))
+
+        return ProfileResult(
+            pstats_path, collapsed_path, tracemalloc_path, sum(stacks.values())
+        )
+
+    def install_signal_handler(self, seconds: float, signum: int | None = None) -> bool:
+        """Start a session on signal (SIGUSR1 by default). Returns False if the
+        platform doesn't support it (e.g. Windows)."""
+        signum = signum or getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signum, self._on_signal, seconds)
+        except (NotImplementedError, RuntimeError):
+            return False
+        return True
+
+    def _on_signal(self, seconds: float) -> None:
+        if self.is_active:
+            logger.warning("profiling session is already running, signal ignored")
+            return
+        self._signal_task = asyncio.get_running_loop().create_task(
+            self.profile(seconds)
+        )
+        self._signal_task.add_done_callback(_log_failure)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception():
+        logger.error("profiling session failed", exc_info=task.exception())
@@ -0,0 +1,206 @@
+"""Dense ranks of 3x3 positions (a perfect hash) for caches, tables and logs.
+
+A position is legal by the numbers of marks: X moves first, so there are as
+many crosses as zeros or one more. All 6046 such grids get ranks from 0 to
+N_RANKS - 1 (13 bits):
+- positions are ordered by the number of marks, `OFFSETS[n]` is the first rank
+  of positions with n marks
+- then `rank_x * C(9 - x, o) + rank_o`, where rank_x is the rank of the set of
+  x crosses among 9 cells and rank_o is the rank of the set of o zeros among
+  9 - x cells left (combinatorial number system: cells c_1 < ... < c_k have
+  rank C(c_1, 1) + ... + C(c_k, k))
+
+A canonical rank is the smallest rank of 8 symmetric positions (rotations and
+reflections of the grid), the same for positions that are the same game.
+
+`rank_array` and `canonical_rank_array` rank many grids at once with NumPy.
+`rank_rs`, `unrank_rs` and `canonical_rank_rs` are the same in Rust.
+"""
+
+from bisect import bisect_right
+from itertools import accumulate
+from math import comb
+from typing import Final, TypeAlias
+
+import numpy as np
+
+from tic_tac_toe.game import CROSS, FREE_SPACE, ZERO, Grid
+
+Position: TypeAlias = tuple[int, int]  # bitboards of crosses and zeros
+
+N_CELLS: Final = 9
+FULL: Final = (1 << N_CELLS) - 1
+COMB: Final = tuple(tuple(comb(n, k) for k in range(N_CELLS + 1)) for n in range(10))
+# numbers of legal positions by the number of marks, and the first rank of them
+COUNTS: Final = tuple(
+    COMB[N_CELLS][(n + 1) // 2] * COMB[N_CELLS - (n + 1) // 2][n // 2]
+    for n in range(N_CELLS + 1)
+)
+OFFSETS: Final = (0, *accumulate(COUNTS))
+N_RANKS: Final = OFFSETS[-1]
+
+
+def _symmetries() -> tuple[tuple[int, ...], ...]:
+    """Permutations of cells: cell i of a symmetric grid is cell perm[i]"""
+    identity = tuple(range(N_CELLS))
+    rotate = tuple(3 * (2 - c) + r for r in range(3) for c in range(3))
+    reflect = tuple(3 * r + 2 - c for r in range(3) for c in range(3))
+    perms = []
+    for base in (identity, reflect):
+        perm = base
+        for _ in range(4):
+            perms.append(perm)
+            perm = tuple(perm[cell] for cell in rotate)
+    return tuple(perms)
+
+
+SYMMETRIES: Final = _symmetries()
+# bitboards transformed by every symmetry
+_SYMMETRIC_MASKS: Final = tuple(
+    tuple(
+        sum(1 << cell for cell, source in enumerate(perm) if mask >> source & 1)
+        for mask in range(FULL + 1)
+    )
+    for perm in SYMMETRIES
+)
+
+
+def grid_to_position(grid: Grid) -> Position:
+    crosses = zeros = 0
+    for r, row in enumerate(grid):
+        for c, mark in enumerate(row):
+            if mark == CROSS:
+                crosses |= 1 << 3 * r + c
+            elif mark == ZERO:
+                zeros |= 1 << 3 * r + c
+    return crosses, zeros
+
+
+def position_to_grid(position: Position) -> Grid:
+    crosses, zeros = position
+    grid: Grid = [[FREE_SPACE] * 3 for _ in range(3)]
+    for cell in range(N_CELLS):
+        if crosses >> cell & 1:
+            grid[cell // 3][cell % 3] = CROSS
+        elif zeros >> cell & 1:
+            grid[cell // 3][cell % 3] = ZERO
+    return grid
+
+
+def rank_position(position: Position) -> int:
+    """Rank of a legal position
+
+    Raises:
+        ValueError: if numbers of marks are wrong or marks overlap
+    """
+    crosses, zeros = position
+    n_crosses, n_zeros = crosses.bit_count(), zeros.bit_count()
+    if crosses & zeros or (crosses | zeros) > FULL or n_crosses - n_zeros not in (0, 1):
+        raise ValueError("Position is not legal")
+    rank_x = rank_o = n_x = n_o = slot = 0
+    for cell in range(N_CELLS):
+        if crosses >> cell & 1:
+            n_x += 1
+            rank_x += COMB[cell][n_x]
+            continue
+        if zeros >> cell & 1:
+            n_o += 1
+            rank_o += COMB[slot][n_o]
+        slot += 1
+    return (
+        OFFSETS[n_crosses + n_zeros]
+        + rank_x * COMB[N_CELLS - n_crosses][n_zeros]
+        + rank_o
+    )
+
+
+def _unrank_set(rank: int, k: int, n: int) -> int:
+    """Mask of the k-subset of n slots with rank"""
+    mask = 0
+    for i in range(k, 0, -1):
+        n -= 1
+        while COMB[n][i] > rank:
+            n -= 1
+        rank -= COMB[n][i]
+        mask |= 1 << n
+    return mask
+
+
+def unrank_position(rank: int) -> Position:
+    if not 0 <= rank < N_RANKS:
+        raise ValueError(f"Rank should be from 0 to {N_RANKS - 1}")
+    n_marks = bisect_right(OFFSETS, rank) - 1
+    n_crosses, n_zeros = (n_marks + 1) // 2, n_marks // 2
+    rank_x, rank_o = divmod(rank - OFFSETS[n_marks], COMB[N_CELLS - n_crosses][n_zeros])
+    crosses = _unrank_set(rank_x, n_crosses, N_CELLS)
+    zero_slots = _unrank_set(rank_o, n_zeros, N_CELLS - n_crosses)
+    zeros = slot = 0
+    for cell in range(N_CELLS):
+        if not crosses >> cell & 1:
+            if zero_slots >> slot & 1:
+                zeros |= 1 << cell
+            slot += 1
+    return crosses, zeros
+
+
+def canonical_rank_position(position: Position) -> int:
+    crosses, zeros = position
+    rank_position(position)  # checks legality of the original
+    return min(
+        rank_position((masks[crosses], masks[zeros])) for masks in _SYMMETRIC_MASKS
+    )
+
+
+def rank(grid: Grid) -> int:
+    return rank_position(grid_to_position(grid))
+
+
+def unrank(rank: int) -> Grid:
+    return position_to_grid(unrank_position(rank))
+
+
+def canonical_rank(grid: Grid) -> int:
+    return canonical_rank_position(grid_to_position(grid))
+
+
+_COMB_ARRAY: Final = np.array(COMB, dtype=np.int64)
+_OFFSETS_ARRAY: Final = np.array(OFFSETS, dtype=np.int64)
+
+
+def rank_array(cells: np.ndarray) -> np.ndarray:
+    """Ranks of grids given as codes of cells (0 free, 1 X, 2 O) in an array of
+    shape (n, 3, 3) or (n, 9)
+
+    Raises:
+        ValueError: if any grid is not legal
+    """
+    cells = np.asarray(cells).reshape(-1, N_CELLS)
+    is_x, is_o = cells == 1, cells == 2
+    n_crosses, n_zeros = is_x.sum(axis=1), is_o.sum(axis=1)
+    if np.any(cells > 2) or np.any(cells < 0):
+        raise ValueError("Codes of cells should be 0, 1 or 2")
+    if np.any((n_crosses - n_zeros != 0) & (n_crosses - n_zeros != 1)):
+        raise ValueError("Position is not legal")
+    cell_index = np.arange(N_CELLS)
+    rank_x = (_COMB_ARRAY[cell_index, np.cumsum(is_x, axis=1)] * is_x).sum(axis=1)
+    slots = np.maximum(np.cumsum(~is_x, axis=1) - 1, 0)  # among cells without X
+    rank_o = (_COMB_ARRAY[slots, np.cumsum(is_o, axis=1)] * is_o).sum(axis=1)
+    return (
+        _OFFSETS_ARRAY[n_crosses + n_zeros]
+        + rank_x * _COMB_ARRAY[N_CELLS - n_crosses, n_zeros]
+        + rank_o
+    )
+
+
+def canonical_rank_array(cells: np.ndarray) -> np.ndarray:
+    cells = np.asarray(cells).reshape(-1, N_CELLS)
+    return np.min([rank_array(cells[:, perm]) for perm in SYMMETRIES], axis=0)
+
+
+def grids_to_array(grids: list[Grid]) -> np.ndarray:
+    """Codes of cells of grids, shape (n, 9)"""
+    codes = {FREE_SPACE: 0, CROSS: 1, ZERO: 2}
+    return np.array(
+        [[codes[mark] for row in grid for mark in row] for grid in grids],
+        dtype=np.int8,
+    ).reshape(-1, N_CELLS)
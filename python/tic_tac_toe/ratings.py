@@ -0,0 +1,327 @@
+"""Elo ratings of players and a leaderboard.
+
+A rating changes after every finished game: multiplayer games rate both
+players, games with the bot rate the player against a fixed rating of the
+engine (its difficulty).
+
+Ratings are rounded to integer buckets of a Fenwick tree with numbers of
+players, so the rank of a player is a prefix sum and the top of the
+leaderboard is found bucket by bucket, both in O(log R) per step (R is the
+range of ratings) without sorting all players.
+
+Ratings are kept in memory and written to SQLite in batches: changed players
+are marked dirty and a background task flushes them every few seconds, in a
+thread, in one transaction.
+"""
+
+import asyncio
+import heapq
+import logging
+import sqlite3
+from typing import Final, NamedTuple
+
+from tic_tac_toe.game import Mark
+from tic_tac_toe.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INITIAL_RATING: Final = 1500.0
+K_FACTOR: Final = 32.0
+MAX_RATING: Final = 4000  # ratings are clipped to [0, MAX_RATING] in the index
+
+# ratings of bots by engine
+BOT_RATINGS: Final = {
+    "random": 800.0,
+    "mcts": 1900.0,
+    "mcts_rs": 2100.0,
+    "minimax": 2200.0,
+    "minimax_rs": 2200.0,
+    "minimax_bb": 2200.0,
+    "ultimate_rs": 2000.0,
+}
+
+
+def game_score(winner: Mark | None, mark: Mark) -> float:
+    """Score of the player with mark: 1 for a win, 0.5 for a draw, 0 for a loss"""
+    if winner is None:
+        return 0.5
+    return 1.0 if winner == mark else 0.0
+
+
+def expected_score(rating: float, opponent: float) -> float:
+    """Expected score (0 to 1) of a player against an opponent"""
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def elo_update(
+    rating: float, opponent: float, score: float, k: float = K_FACTOR
+) -> tuple[float, float]:
+    """New ratings of a player and an opponent after a game.
+
+    Arguments:
+        score: 1 for a win of the player, 0.5 for a draw, 0 for a loss
+    """
+    delta = k * (score - expected_score(rating, opponent))
+    return rating + delta, opponent - delta
+
+
+class RatingIndex:
+    """Players by integer buckets of ratings, with counts in a Fenwick tree"""
+
+    def __init__(self, max_rating: int = MAX_RATING) -> None:
+        self.size = max_rating + 1
+        self._tree = [0] * (self.size + 1)  # 1-based
+        self._buckets: dict[int, set[int]] = {}
+        self._bucket_of: dict[int, int] = {}
+        self._step = 1 << (self.size.bit_length() - 1)  # for the binary search
+
+    def __len__(self) -> int:
+        return len(self._bucket_of)
+
+    def bucket(self, rating: float) -> int:
+        return min(max(round(rating), 0), self.size - 1)
+
+    def _add_count(self, bucket: int, delta: int) -> None:
+        i = bucket + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_up_to(self, bucket: int) -> int:
+        """Number of players with bucket <= given"""
+        total, i = 0, bucket + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _kth_bucket(self, k: int) -> int:
+        """Bucket of the k-th lowest player (k from 1)"""
+        position, step = 0, self._step
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self._tree[nxt] < k:
+                position = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return position  # tree index position + 1, so bucket position
+
+    def update(self, player: int, rating: float) -> None:
+        """Add a player or move to a new rating"""
+        bucket = self.bucket(rating)
+        old = self._bucket_of.get(player)
+        if old == bucket:
+            return
+        if old is not None:
+            self._remove(player, old)
+        self._bucket_of[player] = bucket
+        self._buckets.setdefault(bucket, set()).add(player)
+        self._add_count(bucket, 1)
+
+    def remove(self, player: int) -> None:
+        self._remove(player, self._bucket_of.pop(player))
+
+    def _remove(self, player: int, bucket: int) -> None:
+        players = self._buckets[bucket]
+        players.discard(player)
+        if not players:
+            del self._buckets[bucket]
+        self._add_count(bucket, -1)
+
+    def rank(self, player: int) -> int:
+        """1 + number of players with a higher rating (equal ratings share a rank)"""
+        bucket = self._bucket_of[player]
+        return len(self) - self._count_up_to(bucket) + 1
+
+    def top(self, k: int) -> list[int]:
+        """Up to k players with the highest ratings, best first"""
+        result: list[int] = []
+        remaining = len(self)
+        while remaining and len(result) < k:
+            bucket = self._kth_bucket(remaining)
+            players = self._buckets[bucket]
+            result.extend(heapq.nsmallest(k - len(result), players))
+            remaining -= len(players)
+        return result
+
+
+class PlayerRating(NamedTuple):
+    rating: float
+    games: int
+    name: str
+
+
+class Ratings:
+    """Ratings of all players with a leaderboard and batched persistence.
+
+    Attributes:
+        path: SQLite database, None to keep ratings only in memory
+        flush_interval: seconds between writes of changed ratings
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        flush_interval: float = 10.0,
+        k: float = K_FACTOR,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.k = k
+        self.players: dict[int, PlayerRating] = {}
+        self.index = RatingIndex()
+        self._dirty: set[int] = set()
+        self._connection: sqlite3.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()  # one write at a time
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def rating(self, player: int) -> float:
+        info = self.players.get(player)
+        return INITIAL_RATING if info is None else info.rating
+
+    def _set(self, player: int, rating: float, name: str | None) -> None:
+        old = self.players.get(player)
+        games = 1 if old is None else old.games + 1
+        name = name or (old.name if old is not None else "")
+        self.players[player] = PlayerRating(rating, games, name)
+        self.index.update(player, rating)
+        self._dirty.add(player)
+
+    def record_game(
+        self,
+        player: int,
+        opponent: int,
+        score: float,
+        names: tuple[str, str] | None = None,
+    ) -> tuple[float, float]:
+        """Rate a game between players. Returns their new ratings.
+
+        Arguments:
+            score: 1 for a win of the player, 0.5 for a draw, 0 for a loss
+        """
+        if player == opponent:
+            raise ValueError("Player can't play with themselves")
+        new, new_opponent = elo_update(
+            self.rating(player), self.rating(opponent), score, self.k
+        )
+        name, name_opponent = names or (None, None)
+        self._set(player, new, name)
+        self._set(opponent, new_opponent, name_opponent)
+        REGISTRY.counter("rated_games", kind="multiplayer").inc()
+        return new, new_opponent
+
+    def record_bot_game(
+        self, player: int, engine: str, score: float, name: str | None = None
+    ) -> float:
+        """Rate a game with the bot, which has a fixed rating of its engine"""
+        bot_rating = BOT_RATINGS.get(engine, INITIAL_RATING)
+        new, _ = elo_update(self.rating(player), bot_rating, score, self.k)
+        self._set(player, new, name)
+        REGISTRY.counter("rated_games", kind="bot").inc()
+        return new
+
+    def rank(self, player: int) -> int | None:
+        """Place in the leaderboard, None for players without games"""
+        if player not in self.players:
+            return None
+        return self.index.rank(player)
+
+    def top(self, k: int = 10) -> list[tuple[int, PlayerRating]]:
+        return [(player, self.players[player]) for player in self.index.top(k)]
+
+    # persistence
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            assert self.path is not None
+            # used by one thread at a time: loading, then flushes one by one
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ratings ("
+                "player INTEGER PRIMARY KEY, rating REAL, games INTEGER, name TEXT)"
+            )
+        return self._connection
+
+    def load(self) -> int:
+        """Read ratings from the database. Returns number of players."""
+        if self.path is None:
+            return 0
+        rows = self._connect().execute(
+            "SELECT player, rating, games, name FROM ratings"
+        )
+        for player, rating, games, name in rows:
+            self.players[player] = PlayerRating(rating, games, name)
+            self.index.update(player, rating)
+        return len(self.players)
+
+    def _take_dirty(self) -> list[tuple[int, float, int, str]]:
+        rows = [(player, *self.players[player]) for player in self._dirty]
+        self._dirty.clear()
+        return rows
+
+    def _write(self, rows: list[tuple[int, float, int, str]]) -> None:
+        with self._connect() as connection:  # one transaction
+            connection.executemany(
+                "INSERT INTO ratings (player, rating, games, name) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(player) DO UPDATE SET "
+                "rating = excluded.rating, games = excluded.games, "
+                "name = excluded.name",
+                rows,
+            )
+
+    def flush(self) -> int:
+        """Write changed ratings now. Returns number of written players."""
+        if self.path is None or not self._dirty:
+            return 0
+        rows = self._take_dirty()
+        self._write(rows)
+        return len(rows)
+
+    async def flush_async(self) -> int:
+        """Same as flush, but writes in a thread (rows are taken in the loop).
+
+        Flushes wait for each other, so a flush returns after an earlier one.
+        """
+        async with self._flush_lock:
+            if self.path is None or not self._dirty:
+                return 0
+            rows = self._take_dirty()
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except BaseException:
+                self._dirty.update(row[0] for row in rows)  # try again next time
+                raise
+        REGISTRY.counter("ratings_flushed").inc(len(rows))
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # a cancelled task leaves the write running (it holds the lock)
+                await asyncio.shield(self.flush_async())
+            except Exception:
+                logger.exception("flush of ratings failed")
+
+    def start(self) -> None:
+        """Start periodic flushes in the running event loop."""
+        REGISTRY.gauge("rated_players", lambda: len(self))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop flushes and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_async()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
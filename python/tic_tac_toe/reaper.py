@@ -0,0 +1,160 @@
+"""Inactivity tracking for abandoned games.
+
+Every game has a key and a timestamp of the last activity. Touching a game is
+a dict write, expiration is handled by a hashed timing wheel, so thousands of
+timeouts cost O(1) each. When a game expires, it is rescheduled if there was an
+activity in the meantime, otherwise it is reaped in a batch with other games.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Hashable
+
+from tic_tac_toe.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """Hashed timing wheel.
+
+    Time is split into ticks of equal length, and every slot keeps keys that
+    expire at this tick (modulo number of slots). Keys that expire later than one
+    revolution keep a number of rounds to wait.
+    """
+
+    def __init__(self, tick: float, n_slots: int = 512, start: float = 0.0) -> None:
+        if tick <= 0 or n_slots <= 0:
+            raise ValueError("tick and n_slots should be positive")
+        self.tick = tick
+        self.n_slots = n_slots
+        self._start = start
+        self._current = 0  # last processed tick
+        self._slots: list[dict[Hashable, int]] = [{} for _ in range(n_slots)]
+        self._slot_of: dict[Hashable, int] = {}
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """Schedule (or reschedule) key to expire at deadline"""
+        self.cancel(key)
+        ticks = math.ceil((deadline - self._start) / self.tick)
+        ticks = max(ticks, self._current + 1)  # can't expire in the past
+        slot = ticks % self.n_slots
+        self._slots[slot][key] = (ticks - self._current - 1) // self.n_slots
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable) -> None:
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self, now: float) -> list[Hashable]:
+        """Move the wheel to `now` and return keys that have expired"""
+        target = math.floor((now - self._start) / self.tick)
+        expired = []
+        while self._current < target:
+            self._current += 1
+            slot = self._slots[self._current % self.n_slots]
+            for key, rounds in list(slot.items()):
+                if rounds == 0:
+                    del slot[key]
+                    del self._slot_of[key]
+                    expired.append(key)
+                else:
+                    slot[key] = rounds - 1
+        return expired
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+
+class IdleReaper:
+    """Finds games without activity for `timeout` seconds and reaps them.
+
+    Attributes:
+        timeout: seconds of inactivity before a game is reaped
+        on_reap: coroutine that cleans up a batch of games by keys
+            (should be set before start)
+        tick: resolution of the timer wheel and period of checks
+    Methods:
+        touch: register activity in the game
+        forget: stop tracking the game (it has ended or was dropped)
+        collect: pop keys of idle games
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        on_reap: Callable[[list[Hashable]], Awaitable[None]] | None = None,
+        tick: float = 1.0,
+        n_slots: int = 512,
+    ) -> None:
+        self.timeout = timeout
+        self.on_reap = on_reap
+        self.tick = tick
+        self._last_activity: dict[Hashable, float] = {}
+        self._wheel = TimerWheel(tick, n_slots, start=time.monotonic())
+        self._task: asyncio.Task | None = None
+
+    def touch(self, key: Hashable, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._last_activity[key] = now
+        if key not in self._wheel:
+            self._wheel.schedule(key, now + self.timeout)
+
+    def forget(self, key: Hashable) -> None:
+        self._last_activity.pop(key, None)
+        self._wheel.cancel(key)
+
+    def collect(self, now: float | None = None) -> list[Hashable]:
+        """Pop keys of games without activity for `timeout` seconds"""
+        now = time.monotonic() if now is None else now
+        idle = []
+        for key in self._wheel.advance(now):
+            deadline = self._last_activity[key] + self.timeout
+            if deadline <= now:
+                del self._last_activity[key]
+                idle.append(key)
+            else:  # there was an activity after scheduling
+                self._wheel.schedule(key, deadline)
+        return idle
+
+    def __len__(self) -> int:
+        """Number of tracked games"""
+        return len(self._last_activity)
+
+    async def run_once(self) -> int:
+        idle = self.collect()
+        if idle:
+            assert self.on_reap is not None, "on_reap is not set"
+            await self.on_reap(idle)
+            logger.info(f"{len(idle)} idle games have been reaped")
+        return len(idle)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("reaping of idle games failed")
+            await asyncio.sleep(self.tick)
+
+    def start(self) -> None:
+        """Start a background task in the running event loop."""
+        REGISTRY.gauge("tracked_games", lambda: len(self))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
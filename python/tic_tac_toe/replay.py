@@ -0,0 +1,356 @@
+"""Recording of real updates and their replay for performance regression tests.
+
+Synthetic load misses what real users do: bursts, `/start` in the middle of a
+game, abandoned queues, double taps. The bot can record incoming updates
+(`TIC_TAC_TOE_RECORD_PATH`), and a recording is replayed into a local bot
+against the fake Bot API (`fake_api.py`), so two builds are compared on the
+same traffic.
+
+- updates are anonymized: ids of users and chats are replaced with keyed
+  hashes (the key is random and never written, so pseudonyms are the same
+  within a recording only), names are dropped, text that isn't a command is
+  cleared. Callback data and message ids are kept, the bot needs them
+- a recording is gzip of JSON lines `[time, update]`, appended in batches by a
+  background task, in a thread. Every batch is a gzip member, so a file is
+  only appended, and a batch cut by a crash loses only itself
+- a replay feeds updates at their pace (`speed` times faster, or without
+  pauses) and measures, for every update, the time until all its handlers are
+  finished, and which of them failed
+
+    python -m tic_tac_toe.replay updates.jsonl.gz --speed 10 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import math
+import secrets
+import time
+import zlib
+from collections.abc import AsyncIterator, Coroutine, Iterable, Iterator
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Final, NamedTuple
+
+from telegram import Update
+from telegram.ext import Application
+
+from tic_tac_toe.fake_api import FakeBotApi
+from tic_tac_toe.metrics import REGISTRY
+from tic_tac_toe.network import NetworkSettings, application_builder
+
+logger = logging.getLogger(__name__)
+
+# objects with ids of users and chats
+ID_OWNERS: Final = frozenset({"from", "chat", "user", "sender_chat", "via_bot"})
+# personal data that a replay doesn't need
+DROPPED_KEYS: Final = frozenset(
+    {
+        "last_name",
+        "username",
+        "language_code",
+        "is_premium",
+        "title",
+        "bio",
+        "caption",
+        "caption_entities",
+    }
+)
+ANONYMOUS_NAME: Final = "user"
+
+
+class Record(NamedTuple):
+    """Update (as a dict of the Bot API) and the time (Unix) it was received"""
+
+    time: float
+    update: dict[str, Any]
+
+
+def pseudonym(key: bytes, id_: int) -> int:
+    """Keyed hash of an id, 48 bits with the sign of the id (chats of groups
+    are negative)"""
+    digest = hmac.new(key, str(abs(id_)).encode(), hashlib.sha256).digest()
+    value = int.from_bytes(digest[:6], "big") or 1
+    return -value if id_ < 0 else value
+
+
+def anonymize(value: Any, key: bytes, owner: str = "") -> Any:
+    """Copy of an update without personal data, see the module docstring"""
+    if isinstance(value, list):
+        return [anonymize(item, key, owner) for item in value]
+    if not isinstance(value, dict):
+        return value
+    is_command = str(value.get("text", "")).startswith("/")
+    result = {}
+    for name, item in value.items():
+        if name in DROPPED_KEYS or name == "entities" and not is_command:
+            continue
+        if name == "first_name":
+            result[name] = ANONYMOUS_NAME
+        elif name == "id" and owner in ID_OWNERS or name in ("chat_id", "user_id"):
+            result[name] = pseudonym(key, item)
+        elif name == "text" and not is_command:
+            result[name] = ""
+        else:
+            result[name] = anonymize(item, key, name)
+    return result
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """Records of a file in order, a batch cut by a crash is skipped"""
+    with gzip.open(path, "rt") as file:
+        try:
+            for line in file:
+                timestamp, update = json.loads(line)
+                yield Record(timestamp, update)
+        except (EOFError, zlib.error, gzip.BadGzipFile, json.JSONDecodeError):
+            logger.warning(f"{path} ends with a broken batch, it is skipped")
+
+
+class UpdateRecorder:
+    """Appends anonymized updates to a file.
+
+    `record` only keeps an update in memory, updates are anonymized and written
+    by `flush_async` in a thread, every `flush_interval` seconds after `start`.
+    """
+
+    def __init__(
+        self, path: str, flush_interval: float = 1.0, key: bytes | None = None
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.key = key or secrets.token_bytes(16)
+        self._pending: list[Record] = []
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()  # one write at a time
+
+    def record(self, update: dict[str, Any], received: float | None = None) -> None:
+        """Keep an update received at a time (Unix, now by default)"""
+        received = time.time() if received is None else received
+        self._pending.append(Record(received, update))
+
+    def _write(self, records: list[Record]) -> None:
+        lines = "".join(
+            json.dumps(
+                [round(record.time, 3), anonymize(record.update, self.key)],
+                separators=(",", ":"),
+                ensure_ascii=False,
+            )
+            + "\n"
+            for record in records
+        )
+        with gzip.open(self.path, "at", encoding="utf-8") as file:
+            file.write(lines)
+
+    def flush(self) -> int:
+        """Write recorded updates now. Returns number of written updates."""
+        records, self._pending = self._pending, []
+        if records:
+            self._write(records)
+        return len(records)
+
+    async def flush_async(self) -> int:
+        """Same as flush, but writes in a thread"""
+        async with self._flush_lock:
+            records, self._pending = self._pending, []
+            if not records:
+                return 0
+            try:
+                await asyncio.to_thread(self._write, records)
+            except BaseException:
+                self._pending[:0] = records  # try again next time
+                raise
+        REGISTRY.counter("updates_recorded").inc(len(records))
+        return len(records)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.shield(self.flush_async())
+            except Exception:
+                logger.exception("write of recorded updates failed")
+
+    def start(self) -> None:
+        """Start periodic writes in the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop writes and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_async()
+
+
+class ReplayApplication(Application):
+    """Application that tracks tasks of handlers by update.
+
+    Handlers of the bot don't block (`block=False`), so an update is processed
+    by tasks from `create_task`. The latency of an update is the time from
+    `fed` until the last of its tasks is finished, an update fails if any of
+    its tasks raises.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.fed: dict[int, float] = {}
+        self.finished: dict[int, float] = {}
+        self.failed: set[int] = set()
+        self.pending: set[asyncio.Task] = set()
+
+    def create_task(
+        self,
+        coroutine: Coroutine,
+        update: object | None = None,
+        *,
+        name: str | None = None,
+    ) -> asyncio.Task:
+        task = super().create_task(coroutine, update, name=name)
+        if isinstance(update, Update):
+            self.pending.add(task)
+            task.add_done_callback(partial(self._task_done, update.update_id))
+        return task
+
+    def _task_done(self, update_id: int, task: asyncio.Task) -> None:
+        self.pending.discard(task)
+        self.finished[update_id] = max(
+            self.finished.get(update_id, 0.0), asyncio.get_running_loop().time()
+        )
+        if not task.cancelled() and task.exception() is not None:
+            self.failed.add(update_id)
+
+    async def wait_handlers(self) -> None:
+        """Wait for all handlers, with ones they start"""
+        await self.update_queue.join()
+        while self.pending:
+            await asyncio.wait(self.pending)
+
+
+class ReplayReport(NamedTuple):
+    """Result of a replay, latencies are in seconds"""
+
+    updates: int
+    failed: int
+    latencies: list[float]
+    seconds: float
+    calls: dict[str, int]  # of the Bot API by method
+
+    def percentile(self, q: float) -> float:
+        """Latency that `q` percents of updates don't exceed (nearest rank)"""
+        latencies = sorted(self.latencies)
+        return latencies[max(math.ceil(q / 100 * len(latencies)) - 1, 0)]
+
+    def render(self) -> str:
+        if not self.latencies:
+            return f"{self.updates} updates, none was handled"
+        return (
+            f"{self.updates} updates in {self.seconds:.1f} s, "
+            f"failed {self.failed} ({self.failed / self.updates:.1%})\n"
+            f"latency ms: p50 {1000 * self.percentile(50):.1f}, "
+            f"p90 {1000 * self.percentile(90):.1f}, "
+            f"p99 {1000 * self.percentile(99):.1f}, "
+            f"max {1000 * max(self.latencies):.1f}\n"
+            f"API calls: {dict(sorted(self.calls.items()))}"
+        )
+
+
+async def replay(
+    records: Iterable[Record],
+    application: ReplayApplication,
+    api: FakeBotApi,
+    speed: float = 1.0,
+) -> ReplayReport:
+    """Feed updates into a running application (with the API) at `speed` times
+    their pace (0 for no pauses) and wait for their handlers"""
+    if speed < 0:
+        raise ValueError("speed should be non-negative")
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    first = None
+    for record in records:
+        first = record.time if first is None else first
+        if speed:
+            delay = start + (record.time - first) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(record.update, application.bot)
+        application.fed[update.update_id] = loop.time()
+        await application.update_queue.put(update)
+    await application.wait_handlers()
+    latencies = [
+        application.finished[update_id] - fed
+        for update_id, fed in application.fed.items()
+        if update_id in application.finished
+    ]
+    return ReplayReport(
+        updates=len(application.fed),
+        failed=len(application.failed),
+        latencies=latencies,
+        seconds=loop.time() - start,
+        calls=dict(api.calls),
+    )
+
+
+@asynccontextmanager
+async def running_bot(
+    latency: float,
+) -> AsyncIterator[tuple[ReplayApplication, FakeBotApi]]:
+    """The bot with its background tasks, running against the fake Bot API"""
+    from tic_tac_toe import bot  # imports this module
+
+    # ratings and statistics are kept in memory, so every replay starts with
+    # empty ones and replays of different builds are comparable
+    bot.ratings.path = bot.user_stats.path = None
+    bot.recorder = None
+    api = FakeBotApi(latency=latency)
+    await api.start()
+    settings = NetworkSettings(base_url=api.base_url)
+    application = (
+        application_builder(api.token, settings)
+        .application_class(ReplayApplication)
+        .build()
+    )
+    bot.add_handlers(application)
+    try:
+        async with application:
+            await bot.start_background_tasks(application)
+            await application.start()
+            yield application, api
+            await application.stop()
+            await bot.stop_background_tasks(application)
+    finally:
+        await api.stop()
+
+
+async def replay_into_bot(path: str, speed: float, latency: float) -> ReplayReport:
+    """Replay a recording into the bot with the fake Bot API"""
+    async with running_bot(latency) as (application, api):
+        return await replay(read_records(path), application, api, speed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="recording (TIC_TAC_TOE_RECORD_PATH)")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="times faster, 0 for no pauses"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="seconds of every API call"
+    )
+    args = parser.parse_args()
+    report = asyncio.run(replay_into_bot(args.path, args.speed, args.latency))
+    print(report.render())
+
+
+if __name__ == "__main__":
+    main()
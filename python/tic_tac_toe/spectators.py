@@ -0,0 +1,156 @@
+"""Spectators of multiplayer games and fan-out of board updates to them.
+
+Every game has a set of watchers (a chat and a message that shows the board).
+After a move the text is rendered once and published to all watchers of the
+game. A watcher has a slot with the latest text only: if the previous edit is
+not sent yet, a new text replaces it, so slow watchers skip intermediate boards.
+
+Edits are sent by a few worker tasks under a global rate budget (token bucket).
+`publish` never waits, so players' own updates don't depend on the number of
+spectators.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from tic_tac_toe.metrics import REGISTRY
+from tic_tac_toe.multiplayer import ChatId, MessageId
+
+logger = logging.getLogger(__name__)
+
+Watcher = tuple[ChatId, MessageId]
+SendEdit = Callable[[ChatId, MessageId, str], Awaitable[object]]
+
+
+class TokenBucket:
+    """Rate limiter: `rate` tokens per second, up to `burst` at once"""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate and burst should be positive")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait for a token and take it"""
+        self._refill()
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._refill()
+        self._tokens -= 1
+
+
+class Spectators:
+    """Watchers of games and the publisher of their updates.
+
+    Attributes:
+        send_edit: coroutine that edits a message of a watcher with a text
+            (should be set before start)
+        rate: edits per second for all watchers together
+        n_workers: number of concurrent edits
+    Methods:
+        watch: subscribe a chat to a game (a chat watches one game at a time)
+        unwatch: unsubscribe a chat
+        publish: send text to all watchers of a game (only the latest is kept)
+        drop_game: forget all watchers of a game
+    """
+
+    def __init__(
+        self,
+        send_edit: SendEdit | None = None,
+        rate: float = 20.0,
+        n_workers: int = 8,
+    ) -> None:
+        self.send_edit = send_edit
+        self.n_workers = n_workers
+        self._bucket = TokenBucket(rate, burst=n_workers)
+        self._watchers: dict[int, dict[ChatId, MessageId]] = {}
+        self._watching: dict[ChatId, int] = {}
+        self._pending: dict[Watcher, str] = {}
+        self._ready: asyncio.Queue[Watcher] = asyncio.Queue()
+        self._in_flight: set[Watcher] = set()
+        self._workers: list[asyncio.Task] = []
+
+    def watch(self, game_id: int, chat_id: ChatId, message_id: MessageId) -> None:
+        self.unwatch(chat_id)
+        self._watchers.setdefault(game_id, {})[chat_id] = message_id
+        self._watching[chat_id] = game_id
+
+    def unwatch(self, chat_id: ChatId) -> int | None:
+        """Stop watching. Returns game_id of the watched game if there was one."""
+        game_id = self._watching.pop(chat_id, None)
+        if game_id is not None:
+            watchers = self._watchers[game_id]
+            del watchers[chat_id]
+            if not watchers:
+                del self._watchers[game_id]
+        return game_id
+
+    def watchers(self, game_id: int) -> dict[ChatId, MessageId]:
+        return self._watchers.get(game_id, {})
+
+    def watching(self, chat_id: ChatId) -> int | None:
+        """game_id of the game the chat is watching"""
+        return self._watching.get(chat_id)
+
+    def drop_game(self, game_id: int) -> None:
+        """Forget watchers of a finished game. Published texts are still sent."""
+        for chat_id in self._watchers.pop(game_id, {}):
+            del self._watching[chat_id]
+
+    def publish(self, game_id: int, text: str) -> int:
+        """Schedule edits of all watchers' messages. Returns number of watchers."""
+        watchers = self._watchers.get(game_id, {})
+        for watcher in watchers.items():
+            if watcher in self._pending:  # previous text was not sent, skip it
+                REGISTRY.counter("spectator_edits", result="skipped").inc()
+            elif watcher not in self._in_flight:
+                self._ready.put_nowait(watcher)
+            self._pending[watcher] = text
+        return len(watchers)
+
+    def __len__(self) -> int:
+        """Number of edits waiting to be sent"""
+        return len(self._pending)
+
+    async def _work(self) -> None:
+        while True:
+            watcher = await self._ready.get()
+            await self._bucket.acquire()
+            text = self._pending.pop(watcher)  # the latest one
+            self._in_flight.add(watcher)
+            assert self.send_edit is not None, "send_edit is not set"
+            try:
+                await self.send_edit(*watcher, text)
+                REGISTRY.counter("spectator_edits", result="sent").inc()
+            except Exception as e:  # e.g. spectator deleted the message
+                REGISTRY.counter("spectator_edits", result="failed").inc()
+                logger.warning(f"can't update spectator {watcher[0]}: {e}")
+            finally:
+                self._in_flight.discard(watcher)
+            if watcher in self._pending:  # new text arrived while sending
+                self._ready.put_nowait(watcher)
+
+    def start(self) -> None:
+        """Start workers in the running event loop."""
+        REGISTRY.gauge("spectators", lambda: len(self._watching))
+        REGISTRY.gauge("spectator_edits_pending", lambda: len(self))
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self.n_workers)
+            ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,212 @@
+"""Statistics of players: wins, draws, losses and lengths of games.
+
+Counters live in NumPy arrays, in an open-addressing hash table keyed by user
+id (linear probing, at most half full). A user costs 8 bytes of a key and 16
+bytes of counters (4 x uint32) per slot, so a million users fit into ~50 MB,
+and the table never grows beyond `max_users`. Recording a game and reading a
+user are O(1), nothing is aggregated on request.
+
+A snapshot of the table is written to a `.npz` file every few minutes (arrays
+are copied in the event loop, written in a thread, and the file is replaced
+atomically) and read on start.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Final, NamedTuple
+
+import numpy as np
+
+from tic_tac_toe.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EMPTY: Final = np.iinfo(np.int64).min  # key of a free slot
+WINS, DRAWS, LOSSES, MOVES = range(4)  # columns of counters
+N_COUNTERS: Final = 4
+MAX_LOAD: Final = 0.5
+_GOLDEN: Final = 0x9E3779B97F4A7C15  # Fibonacci hashing
+_MASK64: Final = (1 << 64) - 1
+
+
+class UserStats(NamedTuple):
+    wins: int
+    draws: int
+    losses: int
+    moves: int  # in all games
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    @property
+    def average_length(self) -> float:
+        return self.moves / self.games if self.games else 0.0
+
+
+class StatsTable:
+    """Counters of users in an open-addressing hash table.
+
+    Attributes:
+        max_users: new users are not tracked beyond this number
+        path: file of snapshots, None to keep statistics only in memory
+        snapshot_interval: seconds between snapshots
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1 << 10,
+        max_users: int = 10_000_000,
+        path: str | None = None,
+        snapshot_interval: float = 300.0,
+    ) -> None:
+        if capacity & (capacity - 1):
+            raise ValueError("Capacity should be a power of 2")
+        self.max_users = max_users
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._allocate(capacity)
+        self._task: asyncio.Task | None = None
+
+    def _allocate(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._keys = np.full(capacity, EMPTY, dtype=np.int64)
+        self._counters = np.zeros((capacity, N_COUNTERS), dtype=np.uint32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self._keys.nbytes + self._counters.nbytes
+
+    def _slot(self, user_id: int) -> int:
+        """Slot of the user or a free slot where it should be"""
+        mask = self.capacity - 1
+        slot = ((user_id & _MASK64) * _GOLDEN & _MASK64) >> self._shift
+        keys = self._keys
+        while True:
+            key = keys[slot]
+            if key == user_id or key == EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def get(self, user_id: int) -> UserStats | None:
+        slot = self._slot(user_id)
+        if self._keys[slot] == EMPTY:
+            return None
+        return UserStats(*map(int, self._counters[slot]))
+
+    def record(self, user_id: int, score: float, moves: int) -> bool:
+        """Count a finished game, score is 1 for a win, 0.5 for a draw, 0 for a
+        loss. Returns False if the user is new and the table is full."""
+        slot = self._slot(user_id)
+        if self._keys[slot] == EMPTY:
+            if self._size >= self.max_users:
+                REGISTRY.counter("stats_users_dropped").inc()
+                return False
+            if (self._size + 1) > self.capacity * MAX_LOAD:
+                self._grow()
+                slot = self._slot(user_id)
+            self._keys[slot] = user_id
+            self._size += 1
+        column = WINS if score == 1 else DRAWS if score == 0.5 else LOSSES
+        row = self._counters[slot]
+        row[column] += 1
+        row[MOVES] += moves
+        return True
+
+    def _grow(self) -> None:
+        occupied = self._keys != EMPTY
+        keys, counters = self._keys[occupied], self._counters[occupied]
+        self._allocate(self.capacity * 2)
+        self._insert_many(keys, counters)
+
+    def _insert_many(self, keys: np.ndarray, counters: np.ndarray) -> None:
+        """Put new distinct keys into the table, vectorized: in every round keys
+        take free slots (the first of colliding keys wins), others probe on"""
+        mask = self.capacity - 1
+        slots = (keys.astype(np.uint64) * np.uint64(_GOLDEN)) >> np.uint64(self._shift)
+        slots = slots.astype(np.int64)
+        pending = np.arange(len(keys))
+        while pending.size:
+            candidates = slots[pending]
+            free = self._keys[candidates] == EMPTY
+            taken, first = np.unique(candidates[free], return_index=True)
+            placed = pending[free][first]
+            self._keys[taken] = keys[placed]
+            self._counters[taken] = counters[placed]
+            is_placed = np.zeros(len(keys), dtype=bool)
+            is_placed[placed] = True
+            pending = pending[~is_placed[pending]]
+            slots[pending] = (slots[pending] + 1) & mask
+        self._size += len(keys)
+
+    # snapshots
+
+    def save(self, path: str | None = None) -> int:
+        """Write a snapshot, returns number of users"""
+        return self._write(path or self.path, *self._copy())
+
+    def _copy(self) -> tuple[np.ndarray, np.ndarray]:
+        occupied = self._keys != EMPTY
+        return self._keys[occupied], self._counters[occupied]
+
+    @staticmethod
+    def _write(path: str | None, keys: np.ndarray, counters: np.ndarray) -> int:
+        assert path is not None, "path of snapshots is not set"
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, keys=keys, counters=counters)
+        os.replace(temporary, path)
+        return len(keys)
+
+    def load(self, path: str | None = None) -> int:
+        """Replace the table with a snapshot. Returns number of users."""
+        path = path or self.path
+        if path is None or not os.path.exists(path):
+            return 0
+        with np.load(path) as snapshot:
+            keys, counters = snapshot["keys"], snapshot["counters"]
+        capacity = self.capacity
+        while len(keys) > capacity * MAX_LOAD:
+            capacity *= 2
+        self._allocate(capacity)
+        self._insert_many(keys, counters.astype(np.uint32))
+        return len(keys)
+
+    async def save_async(self) -> int:
+        """Copy the table in the event loop and write it in a thread"""
+        users = await asyncio.to_thread(self._write, self.path, *self._copy())
+        REGISTRY.counter("stats_snapshots").inc()
+        return users
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.save_async()
+            except Exception:
+                logger.exception("snapshot of statistics failed")
+
+    def start(self) -> None:
+        """Start periodic snapshots in the running event loop."""
+        REGISTRY.gauge("stats_users", lambda: len(self))
+        REGISTRY.gauge("stats_bytes", lambda: self.nbytes)
+        if self.path is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop snapshots and write the last one"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.save_async()
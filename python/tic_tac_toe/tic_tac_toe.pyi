@@ -1,2 +1,129 @@
+from collections.abc import Buffer
+
 def find_optimal_move_rs(grid: list[list[str]], mark: str) -> tuple[int, int]:
     """Find optimal move using minimax for tic tac toe board using Rust."""
+
+def find_optimal_move_stats_rs(
+    grid: list[list[str]], mark: str
+) -> tuple[tuple[int, int], tuple[int, int, int, int, float]]:
+    """Same search with statistics: (nodes, cutoffs, terminal nodes, max depth, seconds)."""
+
+class TTTBoardRs:
+    """Game board for 3x3 Tic-Tac-Toe with state in Rust. Compatible with TTTBoard."""
+
+    def __init__(self, grid: list[list[str]] | None = None) -> None: ...
+    @property
+    def grid(self) -> list[list[str]]:
+        """Copy of the grid"""
+    def select_cell(self, move: tuple[int, int]) -> str: ...
+    def set_cell(self, move: tuple[int, int], mark: str) -> None: ...
+    def reset(self) -> None:
+        """Clear the grid in place"""
+    def n_empty_cells(self) -> int: ...
+    def is_game_over(self) -> bool: ...
+    def is_move_legal(self, move: tuple[int, int]) -> bool: ...
+    def make_move(self, move: tuple[int, int], mark: str) -> None:
+        """Put move into the grid.
+
+        Raises:
+            InvalidMoveError: if this cell is already taken
+        """
+    def get_winner(self) -> str | None: ...
+    def find_optimal_move(self, mark: str) -> tuple[int, int]:
+        """Optimal move for mark (minimax) without converting the grid."""
+    def __eq__(self, obj: object) -> bool: ...
+
+def search_ultimate_rs(
+    crosses: list[int],
+    zeros: list[int],
+    next_board: int | None,
+    time_limit: float = 1.0,
+    max_depth: int = 81,
+) -> tuple[tuple[int, int], int, int, int, float]:
+    """Time-bounded search for Ultimate tic tac toe (without the GIL).
+
+    Arguments are 9-bit masks of sub-boards of X and O and the sub-board of the
+    next move. Returns (move, score, completed depth, nodes, seconds).
+
+    Raises:
+        GameRulesError: if the game is over
+    """
+
+class MCTSRs:
+    """Monte Carlo tree search with the tree kept between searches of a game."""
+
+    def __init__(
+        self,
+        playouts: int | None = 50_000,
+        time_limit: float | None = None,
+        exploration: float = 1.4,
+        max_nodes: int = 1_048_576,
+        seed: int | None = None,
+    ) -> None: ...
+    def reset(self) -> None:
+        """Drop the tree"""
+    def __len__(self) -> int: ...
+    def search(
+        self, grid: list[list[str]], mark: str
+    ) -> tuple[tuple[int, int], float, int, int, int, float]:
+        """Best move for mark, runs without the GIL.
+
+        Returns (move, value, playouts, reused visits, tree size, seconds).
+
+        Raises:
+            GameRulesError: if the game is over
+        """
+
+class PositionDbRs:
+    """Reader of a database of solved positions (see position_db.py) over a
+    buffer, e.g. mmap of the file. The table is not copied."""
+
+    rows: int
+    cols: int
+    k: int
+    checksum: int
+
+    def __init__(self, buffer: Buffer, verify: bool = False) -> None:
+        """Raises:
+        PositionDbError: if header is wrong or checksum doesn't match (with verify)
+        """
+    def lookup(self, grid: list[list[str]]) -> tuple[int, int]:
+        """Result for the side to move (0 illegal, 1 loss, 2 draw, 3 win) and
+        moves to the end"""
+    def best_move(self, grid: list[list[str]], mark: str) -> tuple[int, int]:
+        """The fastest win, a draw, or the slowest loss for mark"""
+
+def rank_rs(grid: list[list[str]]) -> int:
+    """Rank of a legal grid, from 0 to 6045 (see ranking.py)
+
+    Raises:
+        ValueError: if the position is not legal
+    """
+
+def unrank_rs(rank: int) -> list[list[str]]:
+    """Grid of a rank"""
+
+def canonical_rank_rs(grid: list[list[str]]) -> int:
+    """The smallest rank of 8 symmetric grids"""
+
+def simulate_games_rs(
+    strategy_x: str,
+    strategy_o: str,
+    n_games: int,
+    seed: int | None = None,
+    threads: int | None = None,
+    record_moves: bool = False,
+) -> tuple[int, int, int, int, float, bytes | None]:
+    """Play whole games between native strategies in threads without the GIL.
+
+    Strategies are "random", "minimax" (the same moves as find_optimal_move_rs)
+    and "table" (a random move of the best ones from a table of solved
+    positions). X moves first. Results don't depend on the number of threads.
+
+    Returns (X wins, O wins, draws, moves, seconds, recorded moves). Recorded
+    moves are 9 bytes per game: cells (3 * row + column) in order of moves,
+    255 after the end.
+
+    Raises:
+        ValueError: if a strategy is unknown
+    """
@@ -0,0 +1,320 @@
+"""Ultimate tic tac toe: 3x3 board of 3x3 sub-boards.
+
+A move is (board, cell), both from 0 to 8 in reading order. The cell of a move
+is the sub-board where the opponent must play next. If that sub-board is closed
+(won or full), the opponent can play in any open sub-board. Winning three
+sub-boards in a row wins the game. X plays first.
+
+Every side has a bitboard (9 bits) per sub-board, and a meta-board of won
+sub-boards. Lookup tables by 9-bit mask (wins, free cells, lines with two
+marks) make move generation and evaluation a few list lookups.
+
+`UltimateBoard` is a drop-in board for `GameConductor`. `search_ultimate` is a
+time-bounded alpha-beta search, a reference implementation of the Rust one
+(`search_ultimate_with_rust`), which gives the same results at a fixed depth.
+"""
+
+import copy
+import time
+from typing import Final, NamedTuple
+
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.exceptions import GameRulesError, InvalidMoveError
+from tic_tac_toe.game import CROSS, FREE_SPACE, ZERO, Mark, Move
+
+if HAS_RUST:
+    from tic_tac_toe import search_ultimate_rs
+
+FULL: Final = 0b111_111_111
+WIN_MASKS: Final = (
+    0b000_000_111,  # rows
+    0b000_111_000,
+    0b111_000_000,
+    0b001_001_001,  # columns
+    0b010_010_010,
+    0b100_100_100,
+    0b100_010_001,  # diagonals
+    0b001_010_100,
+)
+SIDES: Final = {CROSS: 0, ZERO: 1}
+MARKS: Final = (CROSS, ZERO)
+
+# tables by 9-bit mask
+IS_WIN: Final = tuple(
+    any(mask & win == win for win in WIN_MASKS) for mask in range(FULL + 1)
+)
+FREE_CELLS: Final = tuple(
+    tuple(cell for cell in range(9) if not mask >> cell & 1) for mask in range(FULL + 1)
+)
+TWO_IN_LINE: Final = tuple(  # lines with exactly two marks of the mask
+    tuple(win for win in WIN_MASKS if (mask & win).bit_count() == 2)
+    for mask in range(FULL + 1)
+)
+
+WIN_SCORE: Final = 100_000
+SUB_BOARD_SCORE: Final = 100  # won sub-board
+META_THREAT_SCORE: Final = 200  # two won sub-boards in an open line
+THREAT_SCORE: Final = 10  # two marks in an open line of a sub-board
+CENTER_SCORE: Final = 3  # center cell of an open sub-board
+
+
+class UltimateBoard:
+    """Game board for Ultimate Tic-Tac-Toe.
+
+    Attributes:
+        cells: bitboards of sub-boards for X and O, `cells[side][board]`
+        won: meta-boards of sub-boards won by X and O
+        closed: sub-boards that are won or full
+        next_board: sub-board of the next move, None if any open one
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        """Empty board (for reuse in a new game)"""
+        self.cells: list[list[int]] = [[0] * 9, [0] * 9]
+        self.won = [0, 0]
+        self.closed = 0
+        self.next_board: int | None = None
+        self._history: list[tuple[int, int, int, int | None, int, int]] = []
+
+    @property
+    def n_moves(self) -> int:
+        return len(self._history)
+
+    @property
+    def side_to_move(self) -> int:
+        """0 for X, 1 for O"""
+        return len(self._history) % 2
+
+    def select_cell(self, move: Move) -> Mark:
+        board, cell = move
+        for side, mark in enumerate(MARKS):
+            if self.cells[side][board] >> cell & 1:
+                return mark
+        return FREE_SPACE
+
+    def legal_moves(self) -> list[Move]:
+        if self.winner_side() is not None:
+            return []
+        x, o = self.cells
+        if self.next_board is not None:
+            board = self.next_board
+            return [(board, cell) for cell in FREE_CELLS[x[board] | o[board]]]
+        return [
+            (board, cell)
+            for board in FREE_CELLS[self.closed]
+            for cell in FREE_CELLS[x[board] | o[board]]
+        ]
+
+    def is_move_legal(self, move: Move) -> bool:
+        return move in self.legal_moves()
+
+    def make_move(self, move: Move, mark: Mark) -> None:
+        """Put a mark, checking rules of the variant.
+
+        Raises:
+            InvalidMoveError: if the cell is taken or it is a wrong sub-board
+            GameRulesError: if the game is over
+        """
+        board, cell = move
+        if self.is_game_over():
+            raise GameRulesError("Game has ended, no more moves!")
+        if not (0 <= board < 9 and 0 <= cell < 9):
+            raise InvalidMoveError(f"move {move} is out of the board")
+        if self.next_board is not None and board != self.next_board:
+            raise InvalidMoveError(f"you should play in board {self.next_board + 1}")
+        if self.closed >> board & 1:
+            raise InvalidMoveError(f"board {board + 1} is closed")
+        taken = self.select_cell(move)
+        if taken != FREE_SPACE:
+            raise InvalidMoveError(f"this cell is not free, but {taken}")
+        self.play(board, cell, SIDES[mark])
+
+    def play(self, board: int, cell: int, side: int) -> None:
+        """Make a legal move without checks (for search)"""
+        self._history.append(
+            (board, cell, side, self.next_board, self.won[side], self.closed)
+        )
+        cells = self.cells[side]
+        cells[board] |= 1 << cell
+        if IS_WIN[cells[board]]:
+            self.won[side] |= 1 << board
+            self.closed |= 1 << board
+        elif self.cells[0][board] | self.cells[1][board] == FULL:
+            self.closed |= 1 << board
+        self.next_board = None if self.closed >> cell & 1 else cell
+
+    def undo(self) -> None:
+        """Take back the last move"""
+        board, cell, side, self.next_board, won, self.closed = self._history.pop()
+        self.won[side] = won
+        self.cells[side][board] &= ~(1 << cell)
+
+    def winner_side(self) -> int | None:
+        if IS_WIN[self.won[0]]:
+            return 0
+        if IS_WIN[self.won[1]]:
+            return 1
+        return None
+
+    def get_winner(self) -> Mark | None:
+        side = self.winner_side()
+        return None if side is None else MARKS[side]
+
+    def is_game_over(self) -> bool:
+        return self.winner_side() is not None or self.closed == FULL
+
+    def board_state(self, board: int) -> Mark | None:
+        """Winner of a sub-board, FREE_SPACE if it is full without a winner"""
+        for side, mark in enumerate(MARKS):
+            if self.won[side] >> board & 1:
+                return mark
+        if self.closed >> board & 1:
+            return FREE_SPACE
+        return None
+
+    def __str__(self) -> str:
+        """9 rows of 3 sub-boards, free space as underscore"""
+        lines = []
+        for row in range(9):
+            if row and row % 3 == 0:
+                lines.append("---+---+---")
+            big_r, r = divmod(row, 3)
+            lines.append(
+                "|".join(
+                    "".join(
+                        self.select_cell((3 * big_r + big_c, 3 * r + c))
+                        for c in range(3)
+                    ).replace(FREE_SPACE, "_")
+                    for big_c in range(3)
+                )
+            )
+        return "\n".join(lines)
+
+
+def evaluate(board: UltimateBoard, side: int) -> int:
+    """Heuristic score of the position for side"""
+    return _side_score(board, side) - _side_score(board, 1 - side)
+
+
+def _side_score(board: UltimateBoard, side: int) -> int:
+    mine, theirs = board.cells[side], board.cells[1 - side]
+    won, won_opp = board.won[side], board.won[1 - side]
+    score = SUB_BOARD_SCORE * won.bit_count()
+    for line in TWO_IN_LINE[won]:
+        if not won_opp & line and not (board.closed & line) & ~won:
+            score += META_THREAT_SCORE
+    for sub in FREE_CELLS[board.closed]:  # open sub-boards
+        for line in TWO_IN_LINE[mine[sub]]:
+            if not theirs[sub] & line:
+                score += THREAT_SCORE
+        if mine[sub] >> 4 & 1:
+            score += CENTER_SCORE
+    return score
+
+
+class UltimateSearch(NamedTuple):
+    """Result of a search: best move, its score, completed depth and statistics"""
+
+    move: Move
+    score: int
+    depth: int
+    nodes: int
+    seconds: float
+
+
+class _Timeout(Exception):
+    pass
+
+
+class _Search:
+    __slots__ = ("board", "deadline", "nodes")
+
+    def __init__(self, board: UltimateBoard, deadline: float) -> None:
+        self.board = board
+        self.deadline = deadline
+        self.nodes = 0
+
+    def negamax(self, side: int, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise _Timeout
+        board = self.board
+        if board.winner_side() is not None:  # previous player has won
+            return -WIN_SCORE + ply
+        moves = board.legal_moves()
+        if not moves:
+            return 0
+        if depth == 0:
+            return evaluate(board, side)
+        for sub, cell in moves:
+            board.play(sub, cell, side)
+            score = -self.negamax(1 - side, depth - 1, -beta, -alpha, ply + 1)
+            board.undo()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def root(self, moves: list[Move], side: int, depth: int) -> tuple[Move, int]:
+        board = self.board
+        alpha, best = -WIN_SCORE - 1, moves[0]
+        for sub, cell in moves:
+            board.play(sub, cell, side)
+            score = -self.negamax(1 - side, depth - 1, -WIN_SCORE - 1, -alpha, 1)
+            board.undo()
+            if score > alpha:
+                alpha, best = score, (sub, cell)
+        return best, alpha
+
+
+def search_ultimate(
+    board: UltimateBoard, time_limit: float = 1.0, max_depth: int = 81
+) -> UltimateSearch:
+    """Iterative deepening alpha-beta for the side to move.
+
+    Returns the best move of the deepest completed iteration. The board is
+    restored even if the time is over in the middle of an iteration.
+    """
+    start = time.perf_counter()
+    moves = board.legal_moves()
+    if not moves:
+        raise GameRulesError("Game has ended, no more moves!")
+    side = board.side_to_move
+    search = _Search(board, start + time_limit)
+    n_moves = board.n_moves
+    best, score, depth = moves[0], 0, 0
+    for iteration in range(1, max_depth + 1):
+        # the best move of the previous iteration is searched first
+        ordered = [best, *(move for move in moves if move != best)]
+        try:
+            best, score = search.root(ordered, side, iteration)
+        except _Timeout:
+            while board.n_moves > n_moves:
+                board.undo()
+            break
+        depth = iteration
+        if len(moves) == 1 or abs(score) >= WIN_SCORE - 100:
+            break  # forced move or forced result
+        if iteration >= 81 - n_moves:
+            break  # the whole tree is searched
+    return UltimateSearch(best, score, depth, search.nodes, time.perf_counter() - start)
+
+
+def search_ultimate_with_rust(
+    board: UltimateBoard, time_limit: float = 1.0, max_depth: int = 81
+) -> UltimateSearch:
+    """Same as search_ultimate, but in Rust. It releases the GIL while searching.
+
+    Without the extension it is search_ultimate on a copy of the board, which
+    holds the GIL, so the board can be read during the search.
+    """
+    if not HAS_RUST:
+        return search_ultimate(copy.deepcopy(board), time_limit, max_depth)
+    move, score, depth, nodes, seconds = search_ultimate_rs(
+        board.cells[0], board.cells[1], board.next_board, time_limit, max_depth
+    )
+    return UltimateSearch(tuple(move), score, depth, nodes, seconds)  # type: ignore
@@ -1,12 +1,21 @@
 #![allow(unused)]
 
+use pyo3::buffer::{PyBuffer, ReadOnlyCell};
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3::pyclass::CompareOp;
+use pyo3::types::PyBytes;
+use std::time::{Duration, Instant};
+
+pyo3::import_exception!(tic_tac_toe.exceptions, InvalidMoveError);
+pyo3::import_exception!(tic_tac_toe.exceptions, GameRulesError);
+pyo3::import_exception!(tic_tac_toe.exceptions, PositionDbError);
 
 const TOTAL_ROWS: usize = 3;
 const TOTAL_COLUMNS: usize = 3;
 const MAX_FILL: usize = TOTAL_ROWS * TOTAL_COLUMNS;
 
-#[derive(Clone, PartialEq, Copy)]
+#[derive(Clone, PartialEq, Copy, Debug)]
 enum Mark {
     FreeSpace,
     Cross,
@@ -33,11 +42,24 @@ fn get_mark_of_char(mark: char) -> Mark {
     };
 }
 
+fn parse_mark(mark: char) -> PyResult<Mark> {
+    // like get_mark_of_char, but raises ValueError in Python instead of panic
+    match mark {
+        '.' => Ok(Mark::FreeSpace),
+        'X' => Ok(Mark::Cross),
+        'O' => Ok(Mark::Zero),
+        _ => Err(PyValueError::new_err(format!(
+            "This mark {mark} is unknown"
+        ))),
+    }
+}
+
 type Move = [usize; 2];
-type Grid = Vec<Vec<Mark>>;
+// fixed size array is Copy, so searching on a copy of a board is cheap
+type Grid = [[Mark; TOTAL_COLUMNS]; TOTAL_ROWS];
 
 fn create_board() -> Grid {
-    vec![vec![Mark::FreeSpace; TOTAL_COLUMNS]; TOTAL_ROWS]
+    [[Mark::FreeSpace; TOTAL_COLUMNS]; TOTAL_ROWS]
 }
 
 fn is_valid_move(grid: &Grid, play_move: &Move) -> bool {
@@ -108,8 +130,54 @@ fn get_opposite_mark(mark: &Mark) -> Mark {
     };
 }
 
-fn minimax_move_score(grid: &mut Grid, mark: Mark, max_score: i32) -> i32 {
+/// Counters of the search. `()` counts nothing and compiles away,
+/// so the default search doesn't pay for statistics.
+trait SearchCounter {
+    fn node(&mut self, depth: u32);
+    fn cutoff(&mut self);
+    fn terminal(&mut self);
+}
+
+impl SearchCounter for () {
+    #[inline(always)]
+    fn node(&mut self, _depth: u32) {}
+    #[inline(always)]
+    fn cutoff(&mut self) {}
+    #[inline(always)]
+    fn terminal(&mut self) {}
+}
+
+#[derive(Default)]
+struct SearchStats {
+    nodes: u64,
+    cutoffs: u64,
+    terminal_nodes: u64,
+    max_depth: u32,
+}
+
+impl SearchCounter for SearchStats {
+    fn node(&mut self, depth: u32) {
+        self.nodes += 1;
+        self.max_depth = self.max_depth.max(depth);
+    }
+    fn cutoff(&mut self) {
+        self.cutoffs += 1;
+    }
+    fn terminal(&mut self) {
+        self.terminal_nodes += 1;
+    }
+}
+
+fn minimax_move_score<C: SearchCounter>(
+    grid: &mut Grid,
+    mark: Mark,
+    max_score: i32,
+    depth: u32,
+    counter: &mut C,
+) -> i32 {
+    counter.node(depth);
     if is_game_over(grid) {
+        counter.terminal();
         let result = check_winner(&grid);
         match result {
             None => {
@@ -127,10 +195,17 @@ fn minimax_move_score(grid: &mut Grid, mark: Mark, max_score: i32) -> i32 {
         for c in 0..TOTAL_COLUMNS {
             if grid[r][c] == Mark::FreeSpace {
                 if best_score >= max_score {
+                    counter.cutoff();
                     return best_score;
                 }
                 set_cell(grid, [r, c], &mark);
-                let score = -minimax_move_score(grid, get_opposite_mark(&mark), -best_score);
+                let score = -minimax_move_score(
+                    grid,
+                    get_opposite_mark(&mark),
+                    -best_score,
+                    depth + 1,
+                    counter,
+                );
                 set_cell(grid, [r, c], &Mark::FreeSpace);
                 if score > best_score {
                     best_score = score;
@@ -151,25 +226,51 @@ fn grid_char_to_grid_mark(mut grid: Vec<Vec<char>>) -> Grid {
     return new_grid;
 }
 
-#[pyfunction]
-fn find_optimal_move_rs(mut grid: Vec<Vec<char>>, mark: char) -> Move {
-    // there is specific function signature to match Python,
-    // but we convert them to what's useful for us
-    let mut proper_grid: Vec<Vec<Mark>> = grid_char_to_grid_mark(grid);
-    let mark_enum: Mark = get_mark_of_char(mark);
+fn try_grid_from_chars(grid: &Vec<Vec<char>>) -> PyResult<Grid> {
+    // checked conversion for boards created from Python
+    if grid.len() != TOTAL_ROWS || grid.iter().any(|row| row.len() != TOTAL_COLUMNS) {
+        return Err(PyValueError::new_err("Grid should be 3x3"));
+    }
+    let mut new_grid: Grid = create_board();
+    for r in 0..TOTAL_ROWS {
+        for c in 0..TOTAL_COLUMNS {
+            new_grid[r][c] = parse_mark(grid[r][c])?;
+        }
+    }
+    Ok(new_grid)
+}
 
+fn grid_to_chars(grid: &Grid) -> Vec<Vec<char>> {
+    grid.iter()
+        .map(|row| row.iter().map(|mark| get_char_of_mark(*mark)).collect())
+        .collect()
+}
+
+fn check_move(play_move: Move) -> PyResult<Move> {
+    let [r, c] = play_move;
+    if r >= TOTAL_ROWS || c >= TOTAL_COLUMNS {
+        return Err(PyValueError::new_err(format!(
+            "Move {r}{c} is out of the grid"
+        )));
+    }
+    Ok(play_move)
+}
+
+fn find_optimal_move_in_grid<C: SearchCounter>(
+    grid: &mut Grid,
+    mark: Mark,
+    counter: &mut C,
+) -> Move {
+    // search for the best move, grid is restored after the search
     let mut best_score: i32 = -200;
     let mut play_move: Move = [100, 100];
     for r in 0..TOTAL_ROWS {
         for c in 0..TOTAL_COLUMNS {
-            if proper_grid[r][c] == Mark::FreeSpace {
-                set_cell(&mut proper_grid, [r, c], &mark_enum);
-                let score: i32 = -minimax_move_score(
-                    &mut proper_grid,
-                    get_opposite_mark(&mark_enum),
-                    -best_score,
-                );
-                set_cell(&mut proper_grid, [r, c], &Mark::FreeSpace);
+            if grid[r][c] == Mark::FreeSpace {
+                set_cell(grid, [r, c], &mark);
+                let score: i32 =
+                    -minimax_move_score(grid, get_opposite_mark(&mark), -best_score, 1, counter);
+                set_cell(grid, [r, c], &Mark::FreeSpace);
                 if score > best_score {
                     best_score = score;
                     play_move = [r, c];
@@ -180,9 +281,1610 @@ fn find_optimal_move_rs(mut grid: Vec<Vec<char>>, mark: char) -> Move {
     return play_move;
 }
 
+#[pyfunction]
+fn find_optimal_move_rs(mut grid: Vec<Vec<char>>, mark: char) -> Move {
+    // there is specific function signature to match Python,
+    // but we convert them to what's useful for us
+    let mut proper_grid: Grid = grid_char_to_grid_mark(grid);
+    let mark_enum: Mark = get_mark_of_char(mark);
+    find_optimal_move_in_grid(&mut proper_grid, mark_enum, &mut ())
+}
+
+/// Same search as `find_optimal_move_rs`, but also returns statistics:
+/// (nodes, cutoffs, terminal nodes, max depth, seconds)
+#[pyfunction]
+fn find_optimal_move_stats_rs(
+    grid: Vec<Vec<char>>,
+    mark: char,
+) -> PyResult<(Move, (u64, u64, u64, u32, f64))> {
+    let mut proper_grid: Grid = try_grid_from_chars(&grid)?;
+    let mark = parse_mark(mark)?;
+    if mark == Mark::FreeSpace {
+        return Err(PyValueError::new_err("Free space can't make a move"));
+    }
+    let mut stats = SearchStats::default();
+    let start = Instant::now();
+    let play_move = find_optimal_move_in_grid(&mut proper_grid, mark, &mut stats);
+    let seconds = start.elapsed().as_secs_f64();
+    Ok((
+        play_move,
+        (
+            stats.nodes,
+            stats.cutoffs,
+            stats.terminal_nodes,
+            stats.max_depth,
+            seconds,
+        ),
+    ))
+}
+
+/// Board with the same interface as TTTBoard in Python, but state lives in Rust.
+/// Search runs directly on this state, without converting grids.
+#[pyclass(name = "TTTBoardRs")]
+#[derive(Clone)]
+struct TTTBoardRs {
+    grid: Grid,
+}
+
+#[pymethods]
+impl TTTBoardRs {
+    #[new]
+    #[pyo3(signature = (grid=None))]
+    fn new(grid: Option<Vec<Vec<char>>>) -> PyResult<Self> {
+        let grid = match grid {
+            Some(grid) => try_grid_from_chars(&grid)?,
+            None => create_board(),
+        };
+        Ok(TTTBoardRs { grid })
+    }
+
+    /// Copy of the grid as list of lists of marks
+    #[getter]
+    fn grid(&self) -> Vec<Vec<char>> {
+        grid_to_chars(&self.grid)
+    }
+
+    fn select_cell(&self, play_move: Move) -> PyResult<char> {
+        let [r, c] = check_move(play_move)?;
+        Ok(get_char_of_mark(self.grid[r][c]))
+    }
+
+    fn set_cell(&mut self, play_move: Move, mark: char) -> PyResult<()> {
+        let play_move = check_move(play_move)?;
+        set_cell(&mut self.grid, play_move, &parse_mark(mark)?);
+        Ok(())
+    }
+
+    /// Clear the grid in place (for reuse of the board in a new game)
+    fn reset(&mut self) {
+        self.grid = create_board();
+    }
+
+    fn n_empty_cells(&self) -> usize {
+        self.grid
+            .iter()
+            .flatten()
+            .filter(|mark| **mark == Mark::FreeSpace)
+            .count()
+    }
+
+    fn is_game_over(&self) -> bool {
+        is_game_over(&self.grid)
+    }
+
+    fn is_move_legal(&self, play_move: Move) -> PyResult<bool> {
+        Ok(is_valid_move(&self.grid, &check_move(play_move)?))
+    }
+
+    fn make_move(&mut self, play_move: Move, mark: char) -> PyResult<()> {
+        let play_move = check_move(play_move)?;
+        let mark = parse_mark(mark)?;
+        let [r, c] = play_move;
+        let cell = self.grid[r][c];
+        make_move(&mut self.grid, play_move, mark).map_err(|_| {
+            InvalidMoveError::new_err(format!(
+                "this cell is not free, but {}",
+                get_char_of_mark(cell)
+            ))
+        })
+    }
+
+    fn get_winner(&self) -> Option<char> {
+        check_winner(&self.grid).map(get_char_of_mark)
+    }
+
+    /// Optimal move for mark using minimax on the internal state
+    fn find_optimal_move(&self, mark: char) -> PyResult<(usize, usize)> {
+        let mark = parse_mark(mark)?;
+        if mark == Mark::FreeSpace {
+            return Err(PyValueError::new_err("Free space can't make a move"));
+        }
+        let mut grid = self.grid; // copy of 9 bytes
+        let [r, c] = find_optimal_move_in_grid(&mut grid, mark, &mut ());
+        Ok((r, c))
+    }
+
+    fn __str__(&self) -> String {
+        // same as TTTBoard: rows on separate lines, free space as underscore
+        self.grid
+            .iter()
+            .map(|row| {
+                row.iter()
+                    .map(|mark| match mark {
+                        Mark::FreeSpace => '_',
+                        mark => get_char_of_mark(*mark),
+                    })
+                    .collect::<String>()
+            })
+            .collect::<Vec<String>>()
+            .join("\n")
+    }
+
+    fn __repr__(&self) -> String {
+        format!("TTTBoardRs({:?})", grid_to_chars(&self.grid))
+    }
+
+    fn __richcmp__(&self, other: &PyAny, op: CompareOp, py: Python<'_>) -> PyObject {
+        // compare with another board (Rust or Python) or with a grid
+        let other_grid = if let Ok(board) = other.extract::<PyRef<TTTBoardRs>>() {
+            Some(board.grid)
+        } else if let Ok(grid) = other.extract::<Vec<Vec<char>>>() {
+            try_grid_from_chars(&grid).ok()
+        } else if let Ok(grid) = other
+            .getattr("grid")
+            .and_then(|g| g.extract::<Vec<Vec<char>>>())
+        {
+            try_grid_from_chars(&grid).ok()
+        } else {
+            None
+        };
+        match (op, other_grid) {
+            (CompareOp::Eq, Some(grid)) => (self.grid == grid).into_py(py),
+            (CompareOp::Ne, Some(grid)) => (self.grid != grid).into_py(py),
+            _ => py.NotImplemented(),
+        }
+    }
+}
+
+// Ultimate tic tac toe: same rules, evaluation and move order as
+// python/tic_tac_toe/ultimate.py, so both engines agree at a fixed depth.
+// Sub-boards are 9-bit masks, a move is (board, cell) in reading order.
+
+const FULL: u16 = 0b111_111_111;
+const WIN_MASKS: [u16; 8] = [
+    0b000_000_111,
+    0b000_111_000,
+    0b111_000_000,
+    0b001_001_001,
+    0b010_010_010,
+    0b100_100_100,
+    0b100_010_001,
+    0b001_010_100,
+];
+const WIN_SCORE: i32 = 100_000;
+const SUB_BOARD_SCORE: i32 = 100;
+const META_THREAT_SCORE: i32 = 200;
+const THREAT_SCORE: i32 = 10;
+const CENTER_SCORE: i32 = 3;
+const MAX_MOVES: usize = 81;
+
+const fn win_table() -> [bool; 512] {
+    let mut table = [false; 512];
+    let mut mask = 0;
+    while mask < 512 {
+        let mut i = 0;
+        while i < WIN_MASKS.len() {
+            if mask as u16 & WIN_MASKS[i] == WIN_MASKS[i] {
+                table[mask] = true;
+            }
+            i += 1;
+        }
+        mask += 1;
+    }
+    table
+}
+
+static IS_WIN: [bool; 512] = win_table();
+
+type UltimateMove = (usize, usize);
+
+#[derive(Clone, Copy)]
+struct UltimateBoard {
+    cells: [[u16; 9]; 2],
+    won: [u16; 2],
+    closed: u16,
+    next_board: Option<usize>,
+}
+
+impl UltimateBoard {
+    fn from_cells(crosses: [u16; 9], zeros: [u16; 9], next_board: Option<usize>) -> Self {
+        let mut board = UltimateBoard {
+            cells: [crosses, zeros],
+            won: [0, 0],
+            closed: 0,
+            next_board,
+        };
+        for sub in 0..9 {
+            for side in 0..2 {
+                if IS_WIN[board.cells[side][sub] as usize] {
+                    board.won[side] |= 1 << sub;
+                    board.closed |= 1 << sub;
+                }
+            }
+            if crosses[sub] | zeros[sub] == FULL {
+                board.closed |= 1 << sub;
+            }
+        }
+        board
+    }
+
+    fn side_to_move(&self) -> usize {
+        let n_moves: u32 = self
+            .cells
+            .iter()
+            .flatten()
+            .map(|mask| mask.count_ones())
+            .sum();
+        (n_moves % 2) as usize
+    }
+
+    fn winner_side(&self) -> Option<usize> {
+        (0..2).find(|&side| IS_WIN[self.won[side] as usize])
+    }
+
+    /// Fills moves in the order of Python's legal_moves, returns their number
+    fn legal_moves(&self, moves: &mut [UltimateMove; MAX_MOVES]) -> usize {
+        if self.winner_side().is_some() {
+            return 0;
+        }
+        let open = match self.next_board {
+            Some(sub) => 1 << sub,
+            None => !self.closed & FULL,
+        };
+        let mut n = 0;
+        for sub in 0..9 {
+            if open >> sub & 1 == 0 {
+                continue;
+            }
+            let mut free = !(self.cells[0][sub] | self.cells[1][sub]) & FULL;
+            while free != 0 {
+                moves[n] = (sub, free.trailing_zeros() as usize);
+                n += 1;
+                free &= free - 1;
+            }
+        }
+        n
+    }
+
+    fn play(&mut self, sub: usize, cell: usize, side: usize) {
+        self.cells[side][sub] |= 1 << cell;
+        if IS_WIN[self.cells[side][sub] as usize] {
+            self.won[side] |= 1 << sub;
+            self.closed |= 1 << sub;
+        } else if self.cells[0][sub] | self.cells[1][sub] == FULL {
+            self.closed |= 1 << sub;
+        }
+        self.next_board = if self.closed >> cell & 1 == 1 {
+            None
+        } else {
+            Some(cell)
+        };
+    }
+
+    fn side_score(&self, side: usize) -> i32 {
+        let (mine, theirs) = (&self.cells[side], &self.cells[1 - side]);
+        let (won, won_opp) = (self.won[side], self.won[1 - side]);
+        let mut score = SUB_BOARD_SCORE * won.count_ones() as i32;
+        for line in WIN_MASKS {
+            if (won & line).count_ones() == 2
+                && won_opp & line == 0
+                && self.closed & line & !won == 0
+            {
+                score += META_THREAT_SCORE;
+            }
+        }
+        for sub in 0..9 {
+            if self.closed >> sub & 1 == 1 {
+                continue;
+            }
+            for line in WIN_MASKS {
+                if (mine[sub] & line).count_ones() == 2 && theirs[sub] & line == 0 {
+                    score += THREAT_SCORE;
+                }
+            }
+            if mine[sub] >> 4 & 1 == 1 {
+                score += CENTER_SCORE;
+            }
+        }
+        score
+    }
+
+    fn evaluate(&self, side: usize) -> i32 {
+        self.side_score(side) - self.side_score(1 - side)
+    }
+}
+
+struct Timeout;
+
+struct UltimateSearch {
+    deadline: Instant,
+    nodes: u64,
+}
+
+impl UltimateSearch {
+    fn negamax(
+        &mut self,
+        board: &UltimateBoard,
+        side: usize,
+        depth: u32,
+        mut alpha: i32,
+        beta: i32,
+        ply: i32,
+    ) -> Result<i32, Timeout> {
+        self.nodes += 1;
+        if self.nodes & 1023 == 0 && Instant::now() > self.deadline {
+            return Err(Timeout);
+        }
+        if board.winner_side().is_some() {
+            // previous player has won
+            return Ok(-WIN_SCORE + ply);
+        }
+        let mut moves = [(0, 0); MAX_MOVES];
+        let n_moves = board.legal_moves(&mut moves);
+        if n_moves == 0 {
+            return Ok(0);
+        }
+        if depth == 0 {
+            return Ok(board.evaluate(side));
+        }
+        for &(sub, cell) in &moves[..n_moves] {
+            let mut child = *board;
+            child.play(sub, cell, side);
+            let score = -self.negamax(&child, 1 - side, depth - 1, -beta, -alpha, ply + 1)?;
+            if score > alpha {
+                alpha = score;
+                if alpha >= beta {
+                    break;
+                }
+            }
+        }
+        Ok(alpha)
+    }
+
+    fn root(
+        &mut self,
+        board: &UltimateBoard,
+        moves: &[UltimateMove],
+        side: usize,
+        depth: u32,
+    ) -> Result<(UltimateMove, i32), Timeout> {
+        let (mut alpha, mut best) = (-WIN_SCORE - 1, moves[0]);
+        for &(sub, cell) in moves {
+            let mut child = *board;
+            child.play(sub, cell, side);
+            let score = -self.negamax(&child, 1 - side, depth - 1, -WIN_SCORE - 1, -alpha, 1)?;
+            if score > alpha {
+                alpha = score;
+                best = (sub, cell);
+            }
+        }
+        Ok((best, alpha))
+    }
+}
+
+/// Iterative deepening like search_ultimate in Python.
+/// Returns (move, score, completed depth, nodes)
+fn search_ultimate(
+    board: &UltimateBoard,
+    time_limit: Duration,
+    max_depth: u32,
+) -> (UltimateMove, i32, u32, u64) {
+    let mut moves = [(0, 0); MAX_MOVES];
+    let n_moves = board.legal_moves(&mut moves);
+    let moves = &moves[..n_moves];
+    let mut ordered = moves.to_vec();
+    let side = board.side_to_move();
+    let empty_cells: u32 = 81
+        - board
+            .cells
+            .iter()
+            .flatten()
+            .map(|mask| mask.count_ones())
+            .sum::<u32>();
+    let mut search = UltimateSearch {
+        deadline: Instant::now() + time_limit,
+        nodes: 0,
+    };
+    let (mut best, mut score, mut depth) = (moves[0], 0, 0);
+    for iteration in 1..=max_depth {
+        // the best move of the previous iteration is searched first
+        ordered.clear();
+        ordered.push(best);
+        ordered.extend(moves.iter().filter(|&&m| m != best));
+        match search.root(board, &ordered, side, iteration) {
+            Ok((iteration_best, iteration_score)) => {
+                best = iteration_best;
+                score = iteration_score;
+            }
+            Err(Timeout) => break,
+        }
+        depth = iteration;
+        if n_moves == 1 || score.abs() >= WIN_SCORE - 100 || iteration >= empty_cells {
+            break;
+        }
+    }
+    (best, score, depth, search.nodes)
+}
+
+/// Seconds from Python as a duration, from_secs_f64 would panic on negative,
+/// NaN, infinite and too large values
+fn parse_time_limit(seconds: f64) -> PyResult<Duration> {
+    Duration::try_from_secs_f64(seconds)
+        .ok()
+        .filter(|&limit| Instant::now().checked_add(limit).is_some())
+        .ok_or_else(|| {
+            PyValueError::new_err("time_limit should be a non-negative number of seconds")
+        })
+}
+
+fn parse_sub_boards(masks: Vec<u16>) -> PyResult<[u16; 9]> {
+    let masks: [u16; 9] = masks
+        .try_into()
+        .map_err(|_| PyValueError::new_err("There should be 9 sub-boards"))?;
+    if masks.iter().any(|&mask| mask > FULL) {
+        return Err(PyValueError::new_err("Sub-board should be a 9-bit mask"));
+    }
+    Ok(masks)
+}
+
+/// Time-bounded search for Ultimate tic tac toe, runs without the GIL.
+/// Returns (move, score, completed depth, nodes, seconds)
+#[pyfunction]
+#[pyo3(signature = (crosses, zeros, next_board, time_limit=1.0, max_depth=81))]
+fn search_ultimate_rs(
+    py: Python<'_>,
+    crosses: Vec<u16>,
+    zeros: Vec<u16>,
+    next_board: Option<usize>,
+    time_limit: f64,
+    max_depth: u32,
+) -> PyResult<(UltimateMove, i32, u32, u64, f64)> {
+    let time_limit = parse_time_limit(time_limit)?;
+    let board = UltimateBoard::from_cells(
+        parse_sub_boards(crosses)?,
+        parse_sub_boards(zeros)?,
+        next_board,
+    );
+    if let Some(sub) = next_board {
+        if sub >= 9 || board.closed >> sub & 1 == 1 {
+            return Err(PyValueError::new_err("Next board should be open"));
+        }
+    }
+    if board.winner_side().is_some() || board.closed == FULL {
+        return Err(GameRulesError::new_err("Game has ended, no more moves!"));
+    }
+    let start = Instant::now();
+    let (best, score, depth, nodes) =
+        py.allow_threads(|| search_ultimate(&board, time_limit, max_depth));
+    Ok((best, score, depth, nodes, start.elapsed().as_secs_f64()))
+}
+
+// Monte Carlo tree search for 3x3 tic tac toe, the same algorithm as
+// python/tic_tac_toe/mcts.py: nodes in parallel vectors, children stored
+// contiguously, scores in half-points for the player who moved into the node
+// and proven values (1 win, 0 draw, -1 loss) for solved subtrees.
+
+const UNKNOWN: i8 = 2;
+const NO_NODE: i32 = -1;
+const ROOT_CELL: u8 = 9;
+
+struct XorShift(u64);
+
+impl XorShift {
+    fn new(seed: u64) -> Self {
+        XorShift(seed.max(1)) // zero state would stay zero
+    }
+
+    fn next(&mut self) -> u64 {
+        let mut x = self.0;
+        x ^= x << 13;
+        x ^= x >> 7;
+        x ^= x << 17;
+        self.0 = x;
+        x
+    }
+
+    /// Uniform number in 0..n
+    fn below(&mut self, n: u32) -> u32 {
+        ((self.next() >> 32) * n as u64 >> 32) as u32
+    }
+}
+
+fn nth_free_cell(mut free: u16, n: u32) -> u8 {
+    for _ in 0..n {
+        free &= free - 1; // drop the lowest free cell
+    }
+    free.trailing_zeros() as u8
+}
+
+/// Random moves until the end, returns the winner side (None for a draw)
+fn rollout(boards: &mut [u16; 2], mut side: usize, rng: &mut XorShift) -> Option<usize> {
+    loop {
+        let free = FULL & !(boards[0] | boards[1]);
+        if free == 0 {
+            return None;
+        }
+        let cell = nth_free_cell(free, rng.below(free.count_ones()));
+        boards[side] |= 1 << cell;
+        if IS_WIN[boards[side] as usize] {
+            return Some(side);
+        }
+        side ^= 1;
+    }
+}
+
+fn seed_from_time() -> u64 {
+    std::time::SystemTime::now()
+        .duration_since(std::time::UNIX_EPOCH)
+        .map(|elapsed| elapsed.as_nanos() as u64)
+        .unwrap_or(1)
+}
+
+struct MctsResult {
+    cell: u8,
+    value: f64,
+    playouts: u64,
+    reused: u32,
+}
+
+struct Mcts {
+    parent: Vec<i32>,
+    first_child: Vec<i32>,
+    n_children: Vec<u8>,
+    cell: Vec<u8>,
+    visits: Vec<u32>,
+    score: Vec<u32>,
+    proven: Vec<i8>,
+    root: Option<([u16; 2], usize)>, // position and side to move
+    rng: XorShift,
+    playouts: Option<u64>,
+    time_limit: Option<Duration>,
+    exploration: f64,
+    max_nodes: usize,
+}
+
+impl Mcts {
+    fn new(
+        playouts: Option<u64>,
+        time_limit: Option<Duration>,
+        exploration: f64,
+        max_nodes: usize,
+        seed: u64,
+    ) -> Self {
+        Mcts {
+            parent: Vec::new(),
+            first_child: Vec::new(),
+            n_children: Vec::new(),
+            cell: Vec::new(),
+            visits: Vec::new(),
+            score: Vec::new(),
+            proven: Vec::new(),
+            root: None,
+            rng: XorShift::new(seed),
+            playouts,
+            time_limit,
+            exploration,
+            max_nodes,
+        }
+    }
+
+    fn reset(&mut self) {
+        self.parent.clear();
+        self.first_child.clear();
+        self.n_children.clear();
+        self.cell.clear();
+        self.visits.clear();
+        self.score.clear();
+        self.proven.clear();
+        self.root = None;
+    }
+
+    fn len(&self) -> usize {
+        self.visits.len()
+    }
+
+    fn add_node(&mut self, parent: i32, cell: u8, proven: i8) {
+        self.parent.push(parent);
+        self.first_child.push(NO_NODE);
+        self.n_children.push(0);
+        self.cell.push(cell);
+        self.visits.push(0);
+        self.score.push(0);
+        self.proven.push(proven);
+    }
+
+    fn children(&self, node: usize) -> std::ops::Range<usize> {
+        let first = self.first_child[node] as usize;
+        first..first + self.n_children[node] as usize
+    }
+
+    /// Search from an unfinished position, the tree is reused if possible
+    fn search(&mut self, boards: [u16; 2], side: usize) -> MctsResult {
+        let start = Instant::now();
+        self.advance(boards, side);
+        let reused = self.visits[0];
+        if self.first_child[0] == NO_NODE {
+            // even if the tree is full, so that there are moves to choose from
+            self.expand(0, &boards, side);
+        }
+        let deadline = self.time_limit.map(|limit| start + limit);
+        let limit = self.playouts.unwrap_or(u64::MAX);
+        let mut playouts = 0;
+        while self.proven[0] == UNKNOWN && playouts < limit {
+            self.playout();
+            playouts += 1;
+            if playouts & 63 == 0 && deadline.map_or(false, |d| Instant::now() > d) {
+                break;
+            }
+        }
+        let child = self.best_child();
+        let value = match self.proven[child] {
+            UNKNOWN => self.score[child] as f64 / (2 * self.visits[child]) as f64,
+            proven => (proven + 1) as f64 / 2.0,
+        };
+        MctsResult {
+            cell: self.cell[child],
+            value,
+            playouts,
+            reused,
+        }
+    }
+
+    /// Make the node of position the root, or start a new tree
+    fn advance(&mut self, position: [u16; 2], side: usize) {
+        let mut node = NO_NODE;
+        if let Some((mut boards, mut to_move)) = self.root {
+            node = 0;
+            while boards != position {
+                let new = position[to_move] & !boards[to_move];
+                if new.count_ones() != 1 || self.first_child[node as usize] == NO_NODE {
+                    node = NO_NODE;
+                    break;
+                }
+                node = self.find_child(node as usize, new.trailing_zeros() as u8);
+                if node == NO_NODE {
+                    break;
+                }
+                boards[to_move] |= new;
+                to_move ^= 1;
+            }
+            if to_move != side {
+                node = NO_NODE;
+            }
+        }
+        if node == NO_NODE {
+            self.reset();
+            self.add_node(NO_NODE, ROOT_CELL, UNKNOWN);
+        } else if node != 0 {
+            self.reroot(node as usize);
+        }
+        self.root = Some((position, side));
+    }
+
+    fn find_child(&self, node: usize, cell: u8) -> i32 {
+        self.children(node)
+            .find(|&child| self.cell[child] == cell)
+            .map_or(NO_NODE, |child| child as i32)
+    }
+
+    /// Keep only the subtree of root, copied breadth-first
+    fn reroot(&mut self, root: usize) {
+        let mut old = std::mem::replace(
+            self,
+            Mcts::new(
+                self.playouts,
+                self.time_limit,
+                self.exploration,
+                self.max_nodes,
+                0,
+            ),
+        );
+        std::mem::swap(&mut self.rng, &mut old.rng);
+        self.add_node(NO_NODE, ROOT_CELL, old.proven[root]);
+        self.visits[0] = old.visits[root];
+        self.score[0] = old.score[root];
+        let mut queue = vec![(root, 0)];
+        let mut i = 0;
+        while i < queue.len() {
+            let (old_node, new_node) = queue[i];
+            i += 1;
+            if old.first_child[old_node] == NO_NODE {
+                continue;
+            }
+            self.first_child[new_node] = self.len() as i32;
+            self.n_children[new_node] = old.n_children[old_node];
+            for child in old.children(old_node) {
+                queue.push((child, self.len()));
+                self.add_node(new_node as i32, old.cell[child], old.proven[child]);
+                *self.visits.last_mut().unwrap() = old.visits[child];
+                *self.score.last_mut().unwrap() = old.score[child];
+            }
+        }
+    }
+
+    fn expand(&mut self, node: usize, boards: &[u16; 2], side: usize) {
+        let taken = boards[0] | boards[1];
+        let mut cells = [0u8; 9];
+        let mut n = 0;
+        for cell in 0..9 {
+            if taken >> cell & 1 == 0 {
+                cells[n] = cell;
+                n += 1;
+            }
+        }
+        for i in (1..n).rev() {
+            let j = self.rng.below(i as u32 + 1) as usize;
+            cells.swap(i, j);
+        }
+        self.first_child[node] = self.len() as i32;
+        self.n_children[node] = n as u8;
+        for &cell in &cells[..n] {
+            let proven = if IS_WIN[(boards[side] | 1 << cell) as usize] {
+                1
+            } else if taken | 1 << cell == FULL {
+                0
+            } else {
+                UNKNOWN
+            };
+            self.add_node(node as i32, cell, proven);
+        }
+    }
+
+    /// Child with the best UCB1, a proven win at once, proven losses never
+    fn select(&self, node: usize) -> usize {
+        let log_n = (self.visits[node] as f64).ln();
+        let mut best = self.first_child[node] as usize;
+        let mut best_ucb = f64::NEG_INFINITY;
+        for child in self.children(node) {
+            match self.proven[child] {
+                1 => return child,
+                -1 => continue,
+                _ => {}
+            }
+            let n = self.visits[child] as f64;
+            if n == 0.0 {
+                return child;
+            }
+            let ucb = self.score[child] as f64 / (2.0 * n) + self.exploration * (log_n / n).sqrt();
+            if ucb > best_ucb {
+                best = child;
+                best_ucb = ucb;
+            }
+        }
+        best
+    }
+
+    fn playout(&mut self) {
+        let (mut boards, mut side) = self.root.expect("search has a root");
+        let mut node = 0;
+        while self.first_child[node] != NO_NODE && self.proven[node] == UNKNOWN {
+            node = self.select(node);
+            boards[side] |= 1 << self.cell[node];
+            side ^= 1;
+        }
+        if self.proven[node] == UNKNOWN && self.len() + 9 <= self.max_nodes {
+            self.expand(node, &boards, side);
+            node = self.first_child[node] as usize; // children are shuffled
+            boards[side] |= 1 << self.cell[node];
+            side ^= 1;
+        }
+        let is_proven = self.proven[node] != UNKNOWN;
+        let value = if is_proven {
+            self.proven[node]
+        } else {
+            match rollout(&mut boards, side, &mut self.rng) {
+                None => 0,
+                Some(winner) if winner == side => -1,
+                Some(_) => 1,
+            }
+        };
+        self.backpropagate(node, value, is_proven);
+    }
+
+    fn backpropagate(&mut self, mut node: usize, mut value: i8, mut is_proven: bool) {
+        loop {
+            self.visits[node] += 1;
+            self.score[node] += (value + 1) as u32;
+            let parent = self.parent[node];
+            if parent == NO_NODE {
+                return;
+            }
+            node = parent as usize;
+            if is_proven {
+                is_proven = self.prove(node);
+            }
+            value = -value;
+        }
+    }
+
+    /// Try to prove value of node by its children
+    fn prove(&mut self, node: usize) -> bool {
+        if self.proven[node] != UNKNOWN {
+            return true;
+        }
+        let mut best = -1;
+        for child in self.children(node) {
+            match self.proven[child] {
+                1 => {
+                    self.proven[node] = -1; // opponent has a winning move
+                    return true;
+                }
+                UNKNOWN => best = UNKNOWN,
+                value if best != UNKNOWN => best = best.max(value),
+                _ => {}
+            }
+        }
+        if best == UNKNOWN {
+            return false;
+        }
+        self.proven[node] = -best;
+        true
+    }
+
+    fn best_child(&self) -> usize {
+        let children = self.children(0);
+        if let Some(child) = children.clone().find(|&child| self.proven[child] == 1) {
+            return child;
+        }
+        let key = |&child: &usize| (self.visits[child], self.score[child]);
+        children
+            .clone()
+            .filter(|&child| self.proven[child] != -1)
+            .max_by_key(key)
+            .or_else(|| children.max_by_key(key))
+            .expect("root of unfinished position has children")
+    }
+}
+
+/// Monte Carlo tree search with the tree kept between searches of a game.
+#[pyclass(name = "MCTSRs")]
+struct MctsRs {
+    tree: Mcts,
+}
+
+#[pymethods]
+impl MctsRs {
+    #[new]
+    #[pyo3(signature = (
+        playouts=Some(50_000), time_limit=None, exploration=1.4, max_nodes=1_048_576, seed=None
+    ))]
+    fn new(
+        playouts: Option<u64>,
+        time_limit: Option<f64>,
+        exploration: f64,
+        max_nodes: usize,
+        seed: Option<u64>,
+    ) -> PyResult<Self> {
+        if playouts.is_none() && time_limit.is_none() {
+            return Err(PyValueError::new_err(
+                "Search needs a limit of playouts or time",
+            ));
+        }
+        let time_limit = time_limit.map(parse_time_limit).transpose()?;
+        let seed = seed.unwrap_or_else(seed_from_time);
+        Ok(MctsRs {
+            tree: Mcts::new(playouts, time_limit, exploration, max_nodes, seed),
+        })
+    }
+
+    /// Drop the tree
+    fn reset(&mut self) {
+        self.tree.reset();
+    }
+
+    fn __len__(&self) -> usize {
+        self.tree.len()
+    }
+
+    /// Best move for mark, runs without the GIL.
+    /// Returns (move, value, playouts, reused visits, tree size, seconds)
+    fn search(
+        &mut self,
+        py: Python<'_>,
+        grid: Vec<Vec<char>>,
+        mark: char,
+    ) -> PyResult<(Move, f64, u64, u32, usize, f64)> {
+        let grid = try_grid_from_chars(&grid)?;
+        let side = match parse_mark(mark)? {
+            Mark::Cross => 0,
+            Mark::Zero => 1,
+            Mark::FreeSpace => return Err(PyValueError::new_err("Mark should be X or O")),
+        };
+        let boards = grid_to_bitboards(&grid);
+        if is_game_over(&grid) {
+            return Err(GameRulesError::new_err("Game has ended, no more moves!"));
+        }
+        let start = Instant::now();
+        let tree = &mut self.tree;
+        let result = py.allow_threads(|| tree.search(boards, side));
+        let cell = result.cell as usize;
+        Ok((
+            [cell / 3, cell % 3],
+            result.value,
+            result.playouts,
+            result.reused,
+            self.tree.len(),
+            start.elapsed().as_secs_f64(),
+        ))
+    }
+}
+
+// Solved positions of m x n variants (k in a row), the file is written by
+// python/tic_tac_toe/position_db.py. Python maps it read-only and Rust reads
+// the same pages through the buffer protocol, without a copy.
+
+const DB_MAGIC: &[u8; 8] = b"TTTPOSDB";
+const DB_VERSION: u16 = 1;
+const DB_HEADER_SIZE: usize = 64;
+const DB_MAX_CELLS: usize = 16;
+const DB_ILLEGAL: u8 = 0;
+const DB_WIN: u8 = 3;
+
+const fn crc32_table() -> [u32; 256] {
+    let mut table = [0u32; 256];
+    let mut i = 0;
+    while i < 256 {
+        let mut crc = i as u32;
+        let mut bit = 0;
+        while bit < 8 {
+            crc = if crc & 1 == 1 {
+                (crc >> 1) ^ 0xEDB8_8320
+            } else {
+                crc >> 1
+            };
+            bit += 1;
+        }
+        table[i] = crc;
+        i += 1;
+    }
+    table
+}
+
+static CRC32_TABLE: [u32; 256] = crc32_table();
+
+/// CRC32 as in zlib.crc32
+fn crc32(bytes: impl Iterator<Item = u8>) -> u32 {
+    let mut crc = !0u32;
+    for byte in bytes {
+        crc = CRC32_TABLE[((crc ^ byte as u32) & 0xFF) as usize] ^ (crc >> 8);
+    }
+    !crc
+}
+
+/// Reader of a database of solved positions over a buffer (e.g. mmap)
+#[pyclass(name = "PositionDbRs")]
+struct PositionDbRs {
+    buffer: PyBuffer<u8>,
+    #[pyo3(get)]
+    rows: usize,
+    #[pyo3(get)]
+    cols: usize,
+    #[pyo3(get)]
+    k: usize,
+    #[pyo3(get)]
+    checksum: u32,
+}
+
+impl PositionDbRs {
+    fn table<'a>(&'a self, py: Python<'a>) -> &'a [ReadOnlyCell<u8>] {
+        // checked to be contiguous in new
+        &self.buffer.as_slice(py).unwrap()[DB_HEADER_SIZE..]
+    }
+
+    /// Rank of grid (base-3 digits of cells) and codes of X and O marks
+    fn rank(&self, grid: &Vec<Vec<char>>) -> PyResult<usize> {
+        if grid.len() != self.rows || grid.iter().any(|row| row.len() != self.cols) {
+            return Err(PyValueError::new_err(format!(
+                "Grid should be {}x{}",
+                self.rows, self.cols
+            )));
+        }
+        let mut rank = 0;
+        for &mark in grid.iter().flatten().rev() {
+            rank = rank * 3 + db_code(parse_mark(mark)?);
+        }
+        Ok(rank)
+    }
+}
+
+fn db_code(mark: Mark) -> usize {
+    match mark {
+        Mark::FreeSpace => 0,
+        Mark::Cross => 1,
+        Mark::Zero => 2,
+    }
+}
+
+#[pymethods]
+impl PositionDbRs {
+    #[new]
+    #[pyo3(signature = (buffer, verify=false))]
+    fn new(py: Python<'_>, buffer: &PyAny, verify: bool) -> PyResult<Self> {
+        let buffer = PyBuffer::<u8>::get(buffer)?;
+        let bytes = buffer
+            .as_slice(py)
+            .ok_or_else(|| PyValueError::new_err("Buffer should be contiguous"))?;
+        if bytes.len() < DB_HEADER_SIZE {
+            return Err(PositionDbError::new_err("Too small for a database"));
+        }
+        let header: Vec<u8> = bytes[..DB_HEADER_SIZE].iter().map(|b| b.get()).collect();
+        if &header[..8] != DB_MAGIC {
+            return Err(PositionDbError::new_err("Not a database of positions"));
+        }
+        let version = u16::from_le_bytes([header[8], header[9]]);
+        if version != DB_VERSION {
+            return Err(PositionDbError::new_err(format!(
+                "Version {version} is not supported"
+            )));
+        }
+        let (rows, cols, k) = (
+            header[10] as usize,
+            header[11] as usize,
+            header[12] as usize,
+        );
+        let n_positions = u64::from_le_bytes(header[16..24].try_into().unwrap());
+        let checksum = u32::from_le_bytes(header[24..28].try_into().unwrap());
+        if rows * cols > DB_MAX_CELLS
+            || n_positions != 3u64.pow((rows * cols) as u32)
+            || bytes.len() as u64 != DB_HEADER_SIZE as u64 + n_positions
+        {
+            return Err(PositionDbError::new_err("Wrong size of the table"));
+        }
+        if verify && crc32(bytes[DB_HEADER_SIZE..].iter().map(|b| b.get())) != checksum {
+            return Err(PositionDbError::new_err("Corrupted (checksum mismatch)"));
+        }
+        Ok(PositionDbRs {
+            buffer,
+            rows,
+            cols,
+            k,
+            checksum,
+        })
+    }
+
+    /// Result for the side to move (0 illegal, 1 loss, 2 draw, 3 win)
+    /// and moves to the end
+    fn lookup(&self, py: Python<'_>, grid: Vec<Vec<char>>) -> PyResult<(u8, u8)> {
+        let value = self.table(py)[self.rank(&grid)?].get();
+        Ok((value >> 6, value & 63))
+    }
+
+    /// The fastest win, a draw, or the slowest loss for mark
+    fn best_move(&self, py: Python<'_>, grid: Vec<Vec<char>>, mark: char) -> PyResult<Move> {
+        let rank = self.rank(&grid)?;
+        let code = db_code(parse_mark(mark)?);
+        if code == 0 {
+            return Err(PyValueError::new_err("Mark should be X or O"));
+        }
+        let table = self.table(py);
+        let mut best: Option<(Move, (i8, i8))> = None;
+        let mut power = 1;
+        for cell in 0..self.rows * self.cols {
+            let (r, c) = (cell / self.cols, cell % self.cols);
+            if grid[r][c] == '.' {
+                let value = table[rank + code * power].get();
+                let (result, moves) = (value >> 6, (value & 63) as i8);
+                if result == DB_ILLEGAL {
+                    return Err(PositionDbError::new_err(format!(
+                        "It is not the move of {mark} or game is over"
+                    )));
+                }
+                // result is for the opponent
+                let key = (
+                    -(result as i8),
+                    if result == DB_WIN { moves } else { -moves },
+                );
+                if best.map_or(true, |(_, best_key)| key > best_key) {
+                    best = Some(([r, c], key));
+                }
+            }
+            power *= 3;
+        }
+        best.map(|(best_move, _)| best_move)
+            .ok_or_else(|| PositionDbError::new_err("No free cells"))
+    }
+}
+
+// Dense ranks of legal 3x3 positions (as many crosses as zeros or one more),
+// the same as python/tic_tac_toe/ranking.py: positions are ordered by the number
+// of marks, then by ranks of the set of crosses among 9 cells and the set of
+// zeros among cells left (combinatorial number system).
+
+const fn comb_table() -> [[u32; MAX_FILL + 1]; MAX_FILL + 1] {
+    let mut table = [[0; MAX_FILL + 1]; MAX_FILL + 1];
+    let mut n = 0;
+    while n <= MAX_FILL {
+        table[n][0] = 1;
+        let mut k = 1;
+        while k <= n {
+            table[n][k] = table[n - 1][k - 1] + table[n - 1][k];
+            k += 1;
+        }
+        n += 1;
+    }
+    table
+}
+
+const COMB: [[u32; MAX_FILL + 1]; MAX_FILL + 1] = comb_table();
+
+const fn rank_offsets() -> [u32; MAX_FILL + 2] {
+    let mut offsets = [0; MAX_FILL + 2];
+    let mut n = 0;
+    while n <= MAX_FILL {
+        let (crosses, zeros) = ((n + 1) / 2, n / 2);
+        offsets[n + 1] = offsets[n] + COMB[MAX_FILL][crosses] * COMB[MAX_FILL - crosses][zeros];
+        n += 1;
+    }
+    offsets
+}
+
+// first rank of positions by the number of marks
+const RANK_OFFSETS: [u32; MAX_FILL + 2] = rank_offsets();
+const N_RANKS: u32 = RANK_OFFSETS[MAX_FILL + 1];
+
+// rotations and reflections: cell i of a symmetric grid is cell perm[i]
+const SYMMETRIES: [[usize; MAX_FILL]; 8] = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8],
+    [6, 3, 0, 7, 4, 1, 8, 5, 2],
+    [8, 7, 6, 5, 4, 3, 2, 1, 0],
+    [2, 5, 8, 1, 4, 7, 0, 3, 6],
+    [2, 1, 0, 5, 4, 3, 8, 7, 6],
+    [8, 5, 2, 7, 4, 1, 6, 3, 0],
+    [6, 7, 8, 3, 4, 5, 0, 1, 2],
+    [0, 3, 6, 1, 4, 7, 2, 5, 8],
+];
+
+fn grid_to_bitboards(grid: &Grid) -> [u16; 2] {
+    let mut boards = [0u16; 2];
+    for r in 0..TOTAL_ROWS {
+        for c in 0..TOTAL_COLUMNS {
+            match grid[r][c] {
+                Mark::Cross => boards[0] |= 1 << (3 * r + c),
+                Mark::Zero => boards[1] |= 1 << (3 * r + c),
+                Mark::FreeSpace => {}
+            }
+        }
+    }
+    boards
+}
+
+fn bitboards_to_grid(boards: [u16; 2]) -> Grid {
+    let mut grid = create_board();
+    for cell in 0..MAX_FILL {
+        if boards[0] >> cell & 1 == 1 {
+            grid[cell / 3][cell % 3] = Mark::Cross;
+        } else if boards[1] >> cell & 1 == 1 {
+            grid[cell / 3][cell % 3] = Mark::Zero;
+        }
+    }
+    grid
+}
+
+fn rank_position(boards: [u16; 2]) -> Option<u32> {
+    let [crosses, zeros] = boards;
+    let (n_crosses, n_zeros) = (crosses.count_ones() as usize, zeros.count_ones() as usize);
+    if crosses & zeros != 0
+        || (crosses | zeros) > FULL
+        || !(n_zeros..=n_zeros + 1).contains(&n_crosses)
+    {
+        return None;
+    }
+    let (mut rank_x, mut rank_o, mut n_x, mut n_o, mut slot) = (0, 0, 0, 0, 0);
+    for cell in 0..MAX_FILL {
+        if crosses >> cell & 1 == 1 {
+            n_x += 1;
+            rank_x += COMB[cell][n_x];
+            continue;
+        }
+        if zeros >> cell & 1 == 1 {
+            n_o += 1;
+            rank_o += COMB[slot][n_o];
+        }
+        slot += 1;
+    }
+    Some(RANK_OFFSETS[n_crosses + n_zeros] + rank_x * COMB[MAX_FILL - n_crosses][n_zeros] + rank_o)
+}
+
+fn unrank_set(mut rank: u32, k: usize, mut n: usize) -> u16 {
+    // mask of the k-subset of n slots with rank
+    let mut mask = 0;
+    for i in (1..=k).rev() {
+        n -= 1;
+        while COMB[n][i] > rank {
+            n -= 1;
+        }
+        rank -= COMB[n][i];
+        mask |= 1 << n;
+    }
+    mask
+}
+
+fn unrank_position(rank: u32) -> Option<[u16; 2]> {
+    if rank >= N_RANKS {
+        return None;
+    }
+    let n_marks = RANK_OFFSETS.iter().rposition(|&offset| offset <= rank)?;
+    let (n_crosses, n_zeros) = ((n_marks + 1) / 2, n_marks / 2);
+    let per_crosses = COMB[MAX_FILL - n_crosses][n_zeros];
+    let rank = rank - RANK_OFFSETS[n_marks];
+    let crosses = unrank_set(rank / per_crosses, n_crosses, MAX_FILL);
+    let zero_slots = unrank_set(rank % per_crosses, n_zeros, MAX_FILL - n_crosses);
+    let (mut zeros, mut slot) = (0, 0);
+    for cell in 0..MAX_FILL {
+        if crosses >> cell & 1 == 0 {
+            if zero_slots >> slot & 1 == 1 {
+                zeros |= 1 << cell;
+            }
+            slot += 1;
+        }
+    }
+    Some([crosses, zeros])
+}
+
+fn symmetric_mask(mask: u16, perm: &[usize; MAX_FILL]) -> u16 {
+    let mut result = 0;
+    for (cell, &source) in perm.iter().enumerate() {
+        result |= (mask >> source & 1) << cell;
+    }
+    result
+}
+
+fn canonical_rank_position(boards: [u16; 2]) -> Option<u32> {
+    rank_position(boards)?;
+    SYMMETRIES
+        .iter()
+        .filter_map(|perm| {
+            rank_position([
+                symmetric_mask(boards[0], perm),
+                symmetric_mask(boards[1], perm),
+            ])
+        })
+        .min()
+}
+
+fn illegal_position() -> PyErr {
+    PyValueError::new_err("Position is not legal")
+}
+
+/// Rank of a legal grid, from 0 to 6045
+#[pyfunction]
+fn rank_rs(grid: Vec<Vec<char>>) -> PyResult<u32> {
+    let grid = try_grid_from_chars(&grid)?;
+    rank_position(grid_to_bitboards(&grid)).ok_or_else(illegal_position)
+}
+
+/// Grid of a rank
+#[pyfunction]
+fn unrank_rs(rank: u32) -> PyResult<Vec<Vec<char>>> {
+    let boards = unrank_position(rank).ok_or_else(|| {
+        PyValueError::new_err(format!("Rank should be from 0 to {}", N_RANKS - 1))
+    })?;
+    Ok(grid_to_chars(&bitboards_to_grid(boards)))
+}
+
+/// The smallest rank of 8 symmetric grids
+#[pyfunction]
+fn canonical_rank_rs(grid: Vec<Vec<char>>) -> PyResult<u32> {
+    let grid = try_grid_from_chars(&grid)?;
+    canonical_rank_position(grid_to_bitboards(&grid)).ok_or_else(illegal_position)
+}
+
+// Whole games between native strategies, for bulk bot-vs-bot runs that don't
+// cross into Python on every move. Games are split between threads, and every
+// game has its own random generator (seeded by the seed and the number of the
+// game), so results don't depend on the number of threads.
+
+const NO_MOVE: u8 = 0xFF;
+
+#[derive(Clone, Copy)]
+enum Strategy {
+    Random,
+    Minimax,
+    Table,
+}
+
+impl Strategy {
+    fn parse(name: &str) -> PyResult<Self> {
+        match name {
+            "random" => Ok(Strategy::Random),
+            "minimax" => Ok(Strategy::Minimax),
+            "table" => Ok(Strategy::Table),
+            _ => Err(PyValueError::new_err(format!(
+                "Unknown strategy {name}, should be random, minimax or table"
+            ))),
+        }
+    }
+
+    /// Cell to play, minimax moves are searched once per position and thread
+    /// and kept in the cache (by rank)
+    fn choose(self, boards: [u16; 2], side: usize, rng: &mut XorShift, cache: &mut [u8]) -> u8 {
+        match self {
+            Strategy::Random => {
+                let free = FULL & !(boards[0] | boards[1]);
+                nth_free_cell(free, rng.below(free.count_ones()))
+            }
+            Strategy::Minimax => {
+                // positions of unfinished games are always legal
+                let cached = &mut cache[rank_position(boards).unwrap() as usize];
+                if *cached == NO_MOVE {
+                    *cached = minimax_cell(boards, side);
+                }
+                *cached
+            }
+            Strategy::Table => {
+                let best = solved_table()[rank_position(boards).unwrap() as usize].best_cells;
+                nth_free_cell(best, rng.below(best.count_ones()))
+            }
+        }
+    }
+}
+
+/// Negamax with alpha-beta on bitboards, scores as in `minimax_move_score`:
+/// 10 if the side to move wins, 0 for a draw, -10 for a loss
+fn negamax_bits(boards: [u16; 2], side: usize, alpha: i32, beta: i32) -> i32 {
+    let mut free = FULL & !(boards[0] | boards[1]);
+    if free == 0 {
+        return 0;
+    }
+    let mut best = -200;
+    while free != 0 {
+        let cell = free.trailing_zeros();
+        free &= free - 1;
+        let mut next = boards;
+        next[side] |= 1 << cell;
+        let score = if IS_WIN[next[side] as usize] {
+            10
+        } else {
+            -negamax_bits(next, side ^ 1, -beta, -alpha.max(best))
+        };
+        if score > best {
+            best = score;
+            if best >= beta {
+                return best;
+            }
+        }
+    }
+    best
+}
+
+/// The first cell with the best score, the same move as `find_optimal_move_rs`
+fn minimax_cell(boards: [u16; 2], side: usize) -> u8 {
+    let (mut best_score, mut best_cell) = (-200, NO_MOVE);
+    let mut free = FULL & !(boards[0] | boards[1]);
+    while free != 0 {
+        let cell = free.trailing_zeros() as u8;
+        free &= free - 1;
+        let mut next = boards;
+        next[side] |= 1 << cell;
+        let score = if IS_WIN[next[side] as usize] {
+            10
+        } else {
+            -negamax_bits(next, side ^ 1, -200, -best_score)
+        };
+        if score > best_score {
+            (best_score, best_cell) = (score, cell);
+        }
+    }
+    best_cell
+}
+
+/// Result for the side to move (1 win, 0 draw, -1 loss) and all cells with it
+#[derive(Clone, Copy, Default)]
+struct Solved {
+    score: i8,
+    best_cells: u16,
+}
+
+fn solve_position(boards: [u16; 2], side: usize, table: &mut [Option<Solved>]) -> i8 {
+    let rank = rank_position(boards).unwrap() as usize;
+    if let Some(solved) = table[rank] {
+        return solved.score;
+    }
+    let mut free = FULL & !(boards[0] | boards[1]);
+    let mut solved = Solved {
+        score: if free == 0 { 0 } else { -2 },
+        best_cells: 0,
+    };
+    while free != 0 {
+        let cell = free.trailing_zeros();
+        free &= free - 1;
+        let mut next = boards;
+        next[side] |= 1 << cell;
+        let score = if IS_WIN[next[side] as usize] {
+            1
+        } else {
+            -solve_position(next, side ^ 1, table)
+        };
+        if score > solved.score {
+            solved = Solved {
+                score,
+                best_cells: 0,
+            };
+        }
+        if score == solved.score {
+            solved.best_cells |= 1 << cell;
+        }
+    }
+    table[rank] = Some(solved);
+    solved.score
+}
+
+static SOLVED_TABLE: std::sync::OnceLock<Vec<Solved>> = std::sync::OnceLock::new();
+
+/// Solved positions by rank, computed once (finished games are not in it)
+fn solved_table() -> &'static [Solved] {
+    SOLVED_TABLE.get_or_init(|| {
+        let mut table = vec![None; N_RANKS as usize];
+        solve_position([0, 0], 0, &mut table);
+        table.into_iter().map(Option::unwrap_or_default).collect()
+    })
+}
+
+fn splitmix64(mut x: u64) -> u64 {
+    x = x.wrapping_add(0x9E37_79B9_7F4A_7C15);
+    x = (x ^ (x >> 30)).wrapping_mul(0xBF58_476D_1CE4_E5B9);
+    x = (x ^ (x >> 27)).wrapping_mul(0x94D0_49BB_1331_11EB);
+    x ^ (x >> 31)
+}
+
+#[derive(Clone, Copy, Default)]
+struct Totals {
+    wins: [u64; 2],
+    draws: u64,
+    moves: u64,
+}
+
+impl Totals {
+    fn merge(self, other: Totals) -> Totals {
+        Totals {
+            wins: [self.wins[0] + other.wins[0], self.wins[1] + other.wins[1]],
+            draws: self.draws + other.draws,
+            moves: self.moves + other.moves,
+        }
+    }
+}
+
+/// One game, X moves first. Cells are written to record if it isn't empty.
+/// Returns the winner side (None for a draw) and the number of moves.
+fn play_game(
+    strategies: [Strategy; 2],
+    rng: &mut XorShift,
+    cache: &mut [u8],
+    record: &mut [u8],
+) -> (Option<usize>, usize) {
+    let mut boards = [0u16; 2];
+    let mut side = 0;
+    for n_move in 0..MAX_FILL {
+        let cell = strategies[side].choose(boards, side, rng, cache);
+        if let Some(slot) = record.get_mut(n_move) {
+            *slot = cell;
+        }
+        boards[side] |= 1 << cell;
+        if IS_WIN[boards[side] as usize] {
+            return (Some(side), n_move + 1);
+        }
+        side ^= 1;
+    }
+    (None, MAX_FILL)
+}
+
+fn simulate_range(
+    strategies: [Strategy; 2],
+    games: std::ops::Range<usize>,
+    seed: u64,
+    record: &mut [u8],
+) -> Totals {
+    let mut totals = Totals::default();
+    let mut records = record.chunks_mut(MAX_FILL);
+    let mut cache = vec![NO_MOVE; N_RANKS as usize];
+    for game in games {
+        let mut rng = XorShift::new(splitmix64(seed ^ game as u64));
+        let (winner, n_moves) = play_game(
+            strategies,
+            &mut rng,
+            &mut cache,
+            records.next().unwrap_or_default(),
+        );
+        match winner {
+            Some(side) => totals.wins[side] += 1,
+            None => totals.draws += 1,
+        }
+        totals.moves += n_moves as u64;
+    }
+    totals
+}
+
+/// Plays games in threads, moves are 9 bytes per game when recorded
+fn simulate_games(
+    strategies: [Strategy; 2],
+    n_games: usize,
+    seed: u64,
+    threads: usize,
+    record: bool,
+) -> (Totals, Vec<u8>) {
+    let mut moves = vec![NO_MOVE; if record { n_games * MAX_FILL } else { 0 }];
+    let chunk = n_games.div_ceil(threads).max(1);
+    let mut records: Vec<&mut [u8]> = moves.chunks_mut(chunk * MAX_FILL).collect();
+    records.resize_with(n_games.div_ceil(chunk), Default::default);
+    let seed = splitmix64(seed);
+    let totals = std::thread::scope(|scope| {
+        let workers: Vec<_> = records
+            .into_iter()
+            .enumerate()
+            .map(|(i, record)| {
+                let games = i * chunk..((i + 1) * chunk).min(n_games);
+                scope.spawn(move || simulate_range(strategies, games, seed, record))
+            })
+            .collect();
+        workers
+            .into_iter()
+            .map(|worker| worker.join().expect("simulation thread panicked"))
+            .fold(Totals::default(), Totals::merge)
+    });
+    (totals, moves)
+}
+
+/// Plays n_games between native strategies without the GIL, X moves first.
+/// Returns (X wins, O wins, draws, moves, seconds, recorded moves)
+#[pyfunction]
+#[pyo3(signature = (
+    strategy_x, strategy_o, n_games, seed=None, threads=None, record_moves=false
+))]
+fn simulate_games_rs<'py>(
+    py: Python<'py>,
+    strategy_x: &str,
+    strategy_o: &str,
+    n_games: usize,
+    seed: Option<u64>,
+    threads: Option<usize>,
+    record_moves: bool,
+) -> PyResult<(u64, u64, u64, u64, f64, Option<&'py PyBytes>)> {
+    let strategies = [Strategy::parse(strategy_x)?, Strategy::parse(strategy_o)?];
+    let threads = match threads {
+        Some(0) => {
+            return Err(PyValueError::new_err(
+                "Number of threads should be positive",
+            ))
+        }
+        Some(threads) => threads,
+        None => std::thread::available_parallelism().map_or(1, |n| n.get()),
+    };
+    let seed = seed.unwrap_or_else(seed_from_time);
+    let start = Instant::now();
+    let (totals, moves) =
+        py.allow_threads(|| simulate_games(strategies, n_games, seed, threads, record_moves));
+    Ok((
+        totals.wins[0],
+        totals.wins[1],
+        totals.draws,
+        totals.moves,
+        start.elapsed().as_secs_f64(),
+        record_moves.then(|| PyBytes::new(py, &moves)),
+    ))
+}
+
 #[pymodule]
 #[pyo3(name = "tic_tac_toe")]
 fn tic_tac_toe(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(find_optimal_move_rs, m)?)?;
+    m.add_function(wrap_pyfunction!(find_optimal_move_stats_rs, m)?)?;
+    m.add_class::<TTTBoardRs>()?;
+    m.add_function(wrap_pyfunction!(search_ultimate_rs, m)?)?;
+    m.add_class::<MctsRs>()?;
+    m.add_class::<PositionDbRs>()?;
+    m.add_function(wrap_pyfunction!(rank_rs, m)?)?;
+    m.add_function(wrap_pyfunction!(unrank_rs, m)?)?;
+    m.add_function(wrap_pyfunction!(canonical_rank_rs, m)?)?;
+    m.add_function(wrap_pyfunction!(simulate_games_rs, m)?)?;
     Ok(())
 }
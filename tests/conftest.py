@@ -0,0 +1,17 @@
+"""Tests of Rust code are marked `rust`, they are skipped if the extension isn't
+built, so the rest runs on Python engines"""
+import pytest
+from tic_tac_toe import HAS_RUST
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "rust: needs the Rust extension")
+
+
+def pytest_collection_modifyitems(config, items):
+    if HAS_RUST:
+        return
+    skip = pytest.mark.skip(reason="the Rust extension isn't built")
+    for item in items:
+        if "rust" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,55 @@
+"""Tests for exhaustive analysis of the game tree"""
+from tic_tac_toe.analysis import (
+    GameTreeStats,
+    count_games,
+    is_finished,
+    play,
+    reachable_positions,
+    solve,
+    to_grid,
+    verify_strategy,
+)
+from tic_tac_toe.engines import STRATEGIES, register_strategy
+from tic_tac_toe.game import CROSS, ZERO
+from tic_tac_toe.ranking import grid_to_position
+
+
+def solved_strategy(grid, mark):
+    """Perfect player based on solved positions"""
+    crosses, zeros = grid_to_position(grid)
+    free = [cell for cell in range(9) if not (crosses | zeros) >> cell & 1]
+    cell = min(free, key=lambda cell: solve(play((crosses, zeros), cell)))
+    return divmod(cell, 3)
+
+
+if "test_solved" not in STRATEGIES:
+    register_strategy("test_solved", solved_strategy)
+
+
+def test_count_games():
+    """Known numbers of games after the first move"""
+    assert count_games(play((0, 0), 4)).games == 25_872  # center
+    assert count_games(play((0, 0), 0)).games == 27_732  # corner
+    assert count_games(play((0, 0), 1)).games == 29_592  # edge
+    assert GameTreeStats(1, 1, 0, 0) + GameTreeStats(2, 0, 1, 1) == (3, 1, 1, 1)
+
+
+def test_positions():
+    positions = reachable_positions()
+    assert len(positions) == 5478
+    assert sum(map(is_finished, positions)) == 958
+    assert solve((0, 0)) == 0  # draw with perfect play
+    assert to_grid((0b1, 0b10)) == ([["X", "O", "."], *[["."] * 3] * 2], CROSS)
+
+
+def test_verify_strategies():
+    report = verify_strategy("test_solved")
+    assert report.positions == 4520
+    assert report.losses == report.missed_wins == 0
+    assert report.first_failure is None
+
+    report = verify_strategy("random")
+    assert report.losses > 0
+    grid, mark, move = report.first_failure
+    assert mark in (CROSS, ZERO)
+    assert grid[move[0]][move[1]] == "."
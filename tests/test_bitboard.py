@@ -0,0 +1,37 @@
+"""Tests for minimax on bitboards"""
+import pytest
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.analysis import (
+    is_finished,
+    reachable_positions,
+    to_grid,
+    verify_strategy,
+)
+from tic_tac_toe.bitboard import NO_MOVE, find_optimal_move_bb
+from tic_tac_toe.engines import DEFAULT_ENGINE, STRATEGIES
+from tic_tac_toe.game import CROSS, ZERO, find_optimal_move
+
+
+def test_never_loses():
+    report = verify_strategy("minimax_bb")
+    assert report.positions == 4520
+    assert report.losses == report.missed_wins == 0
+
+
+def test_same_moves_as_minimax():
+    positions = [p for p in reachable_positions() if not is_finished(p)]
+    for position in positions[::15]:
+        grid, mark = to_grid(position)
+        assert find_optimal_move_bb(grid, mark) == find_optimal_move(grid, mark)
+
+
+def test_edge_cases():
+    full = [[CROSS, ZERO, CROSS], [CROSS, ZERO, ZERO], [ZERO, CROSS, CROSS]]
+    assert find_optimal_move_bb(full, ZERO) == NO_MOVE
+    with pytest.raises(ValueError):
+        find_optimal_move_bb(full, ".")
+
+
+def test_engines_without_rust():
+    assert ("minimax_rs" in STRATEGIES) == ("mcts_rs" in STRATEGIES) == HAS_RUST
+    assert DEFAULT_ENGINE == ("minimax_rs" if HAS_RUST else "minimax_bb")
@@ -0,0 +1,89 @@
+"""Latency of moves of the bot against the fake Bot API with a network delay"""
+import asyncio
+import time
+
+import pytest
+from tic_tac_toe import bot
+from tic_tac_toe.bitboard import find_optimal_move_bb
+from tic_tac_toe.fake_api import callback_update, message_update
+from tic_tac_toe.game import CROSS
+from tic_tac_toe.replay import Record, replay, running_bot
+
+LATENCY = 0.2  # of every call, like a slow network
+AT_ONCE = 0.05  # calls sent within this time are concurrent
+
+
+async def feed(application, api, updates) -> None:
+    """Updates one by one, every one after handlers of the previous one"""
+    for update in updates:
+        await replay([Record(0.0, update)], application, api, speed=0)
+
+
+async def measure_move(application, api, update) -> tuple[float, list]:
+    """Latency of an update (until its handlers are finished) and calls to the
+    Bot API it made"""
+    n_calls = len(api.log)
+    await replay([Record(0.0, update)], application, api, speed=0)
+    update_id = update["update_id"]
+    latency = application.finished[update_id] - application.fed[update_id]
+    return latency, api.log[n_calls:]
+
+
+@pytest.mark.asyncio
+async def test_singleplayer_move_is_pipelined(monkeypatch):
+    monkeypatch.setattr(bot, "BOT_ENGINE", "minimax_bb")
+    monkeypatch.setattr(bot, "bot_strategy", find_optimal_move_bb)
+    monkeypatch.setattr(bot.random, "randint", lambda a, b: a)  # thinks 0.2 s
+    user_id = 501
+    setup = [
+        message_update(1, user_id, "/start"),
+        callback_update(2, user_id, "1"),  # singleplayer
+        callback_update(3, user_id, "1"),  # X
+    ]
+    async with running_bot(LATENCY) as (application, api):
+        await feed(application, api, setup)
+        latency, calls = await measure_move(
+            application, api, callback_update(4, user_id, "11")
+        )
+
+    answer, edit, bot_edit = calls
+    # the button is answered and the board is sent at once, the bot thinks
+    # meanwhile (before: an edit, an answer, thinking, an edit one by one)
+    assert {answer.method, edit.method} == {"answerCallbackQuery", "editMessageText"}
+    assert abs(answer.time - edit.time) < AT_ONCE
+    assert bot_edit.method == "editMessageText"
+    assert bot_edit.time - edit.time < LATENCY + AT_ONCE
+    assert 2 * LATENCY <= latency < 3 * LATENCY
+
+
+@pytest.mark.asyncio
+async def test_multiplayer_move_is_pipelined():
+    players = (601, 602)
+    async with running_bot(LATENCY) as (application, api):
+        setup = []
+        for i, text in enumerate(["/start", "2"]):  # multiplayer
+            for user_id in players:
+                make_update = message_update if i == 0 else callback_update
+                setup.append(make_update(10 * user_id + i, user_id, text))
+        await feed(application, api, setup)
+        deadline = time.perf_counter() + 5
+        while players[0] not in bot.multiplayer.games:  # paired by matchmaking
+            assert time.perf_counter() < deadline
+            await asyncio.sleep(0.05)
+        game = bot.multiplayer.get_game(players[0])
+        first = players[0] if game.myself.mark == CROSS else players[1]
+        latency, calls = await measure_move(
+            application, api, callback_update(1, first, "11")
+        )
+        bot.multiplayer.remove_game(first)
+
+    # the answer and edits of both players' messages are sent at once
+    assert sorted(call.method for call in calls) == [
+        "answerCallbackQuery",
+        "editMessageText",
+        "editMessageText",
+    ]
+    assert max(call.time for call in calls) - min(call.time for call in calls) < (
+        AT_ONCE
+    )
+    assert LATENCY <= latency < 2 * LATENCY
@@ -0,0 +1,123 @@
+"""Tests for formatting and parsing helpers of a bot"""
+import pytest
+from telegram.helpers import escape_markdown
+from tic_tac_toe.bot_helpers import (
+    CELL_MOVES,
+    parse_keyboard_move,
+    parse_seconds,
+    render_board,
+    render_message_at_game_end,
+    split_message,
+    wide_message,
+)
+from tic_tac_toe.game import (
+    CROSS,
+    FREE_SPACE,
+    ZERO,
+    Mark,
+    TTTBoard,
+    get_opposite_mark,
+)
+
+
+def test_parse_keyboard_move():
+    assert parse_keyboard_move("00") == (0, 0)
+    assert parse_keyboard_move("21") == (2, 1)
+    assert len(CELL_MOVES) == 9
+    for bad_data in ("", "3", "33", "012", "91", None):
+        with pytest.raises(ValueError):
+            parse_keyboard_move(bad_data)  # type: ignore
+
+
+def reference_wide_message(msg: str, escape: bool = False) -> str:
+    """wide_message before precomputed padding"""
+    add_symbols = 60 - len(msg)
+    if add_symbols <= 0:
+        return msg
+    underscores = "_" * add_symbols
+    if escape:
+        underscores = escape_markdown(underscores, version=2)
+    return msg + " " + underscores
+
+
+def reference_message_at_game_end(game_board, mark, username_mark) -> str:
+    """render_message_at_game_end before caching and templates"""
+    winner = game_board.get_winner()
+    if winner:
+        if winner == mark:
+            first_line = "You won!"
+            emoji = "\N{Smiling Face with Sunglasses}"
+            winner_username = username_mark[mark]
+        else:
+            first_line = "You lost..."
+            emoji = "\N{Melting Face}"
+            winner_username = username_mark[get_opposite_mark(mark)]
+        winner = f"{winner_username} ({winner})"
+    else:
+        winner = "Дружба \N{Smiling Cat Face with Heart-Shaped Eyes}"
+        emoji = "\N{Face with Finger Covering Closed Lips}"
+        first_line = "It's a draw!"
+    return (
+        first_line
+        + "\n"
+        + str(game_board)
+        + "\n"
+        + emoji
+        + f"\nWinner in this game: {winner}.\nThanks for playing"
+    )
+
+
+def final_boards(board: TTTBoard, mark: Mark = CROSS, seen=None):
+    """All distinct boards where a game ends"""
+    seen = set() if seen is None else seen
+    if str(board) in seen:
+        return
+    seen.add(str(board))
+    if board.is_game_over():
+        yield TTTBoard([row.copy() for row in board.grid])
+        return
+    for r in range(3):
+        for c in range(3):
+            if board.is_move_legal((r, c)):
+                board.set_cell((r, c), mark)
+                yield from final_boards(board, get_opposite_mark(mark), seen)
+                board.set_cell((r, c), FREE_SPACE)
+
+
+def test_wide_message_matches_reference():
+    for length in range(70):
+        msg = "a" * length
+        for escape in (False, True):
+            assert wide_message(msg, escape) == reference_wide_message(msg, escape)
+
+
+def test_message_at_game_end_matches_reference():
+    """Byte for byte, for every final board and both players (twice, with cache)"""
+    username_mark = {CROSS: "Alice @alice", ZERO: "Bob"}
+    boards = list(final_boards(TTTBoard()))
+    assert len(boards) == 958  # all possible final positions
+    for board in boards * 2:
+        for mark in (CROSS, ZERO):
+            assert render_message_at_game_end(
+                board, mark, username_mark
+            ) == reference_message_at_game_end(board, mark, username_mark)
+            assert render_board(board) == (str(board), board.get_winner())
+
+
+def test_split_message():
+    assert split_message("") == []
+    assert split_message("a\nbb\nc", limit=4) == ["a\nbb", "c"]
+    assert split_message("abcdefghij", limit=4) == ["abcd", "efgh", "ij"]
+    text = "\n".join(f"metric_{i} {i}" for i in range(1000))
+    messages = split_message(text)
+    assert all(len(message) <= 4096 for message in messages)
+    assert "\n".join(messages) == text
+
+
+def test_parse_seconds():
+    assert parse_seconds([], 30, 600) == 30
+    assert parse_seconds(["2.5"], 30, 600) == 2.5
+    assert parse_seconds(["1e9"], 30, 600) == 600
+    for args in (["0"], ["-1"], ["nan"], ["inf"], ["soon"], ["1", "2"]):
+        with pytest.raises(ValueError):
+            parse_seconds(args, 30, 600)
@@ -0,0 +1,85 @@
+"""Tests for absorbing of double taps"""
+import asyncio
+
+import pytest
+from tic_tac_toe.debounce import Debouncer
+from tic_tac_toe.metrics import REGISTRY
+
+
+def test_repeat_within_window():
+    now = [0.0]
+    debouncer = Debouncer(window=1.0, clock=lambda: now[0])
+    absorbed = REGISTRY.counter("callbacks_absorbed", reason="repeat")
+    before = absorbed.value
+
+    def tap(key: str, data: str, accepted: bool = True) -> bool:
+        if not debouncer.enter(key, data):
+            return False
+        if accepted:
+            debouncer.accept(key, data)
+        debouncer.leave(key)
+        return True
+
+    assert tap("game", "11")
+    now[0] = 0.5
+    assert not tap("game", "11")  # double tap
+    assert tap("game", "22")  # next move
+    assert tap("other", "22")  # another game
+    now[0] = 2.0
+    assert tap("game", "22")  # too late for a double tap
+    debouncer.forget("game")
+    assert tap("game", "22")  # new game
+    assert absorbed.value - before == 1
+
+
+def test_rejected_tap_is_not_a_repeat():
+    """A move out of turn is rejected, the same cell right after is a move"""
+    now = [0.0]
+    debouncer = Debouncer(window=1.5, clock=lambda: now[0])
+    assert debouncer.enter("player", "11")  # rejected by the handler
+    debouncer.leave("player")
+    now[0] = 0.5  # the opponent has moved
+    assert debouncer.enter("player", "11")
+    debouncer.accept("player", "11")
+    debouncer.leave("player")
+    # navigation isn't accepted as a move, so it can be repeated
+    for data in ("ub3", "u-", "ub3"):
+        assert debouncer.enter("ultimate", data)
+        debouncer.leave("ultimate")
+
+
+def test_old_buttons_expire():
+    now = [0.0]
+    debouncer = Debouncer(window=1.0, clock=lambda: now[0])
+    for key in range(100):
+        now[0] += 0.25
+        assert debouncer.enter(key, "00")
+        debouncer.accept(key, "00")
+        debouncer.leave(key)
+    assert len(debouncer._last) == 4
+
+
+@pytest.mark.asyncio
+async def test_in_flight():
+    """Taps during a slow move are absorbed, the engine runs once"""
+    debouncer = Debouncer(window=0)
+    absorbed = REGISTRY.counter("callbacks_absorbed", reason="in_flight")
+    before = absorbed.value
+    searches = []
+
+    async def tap(data: str) -> None:
+        if not debouncer.enter("game", data):
+            return
+        try:
+            debouncer.accept("game", data)
+            searches.append(data)
+            await asyncio.sleep(0.02)
+        finally:
+            debouncer.leave("game")
+
+    await asyncio.gather(tap("00"), tap("00"), tap("01"))
+    assert searches == ["00"]
+    assert len(debouncer) == 0
+    assert absorbed.value - before == 2
+    await tap("01")
+    assert searches == ["00", "01"]
@@ -1,16 +1,30 @@
 """Tests for game engine and different helpers."""
+import random
+
 import pytest
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.engines import (
+    find_optimal_move_rs_with_stats,
+    get_strategy,
+    search_totals,
+)
 from tic_tac_toe.exceptions import GameRulesError, InvalidMoveError
 from tic_tac_toe.game import (
     CROSS,
     FREE_SPACE,
     ZERO,
     GameConductor,
+    GameConductorPool,
     TTTBoard,
+    find_optimal_move,
+    find_optimal_move_with_stats,
     get_opposite_mark,
     random_available_move,
 )
 
+if HAS_RUST:
+    from tic_tac_toe import TTTBoardRs, find_optimal_move_rs, simulate_games_rs
+
 
 # board examples
 @pytest.fixture()
@@ -162,6 +176,50 @@ def test_game_conductor1():
     assert str(gc.game_board) == rendered_board  # мне хорошо, я так чувствую
 
 
+def test_reset_and_rematch(board1):
+    board1.reset()
+    assert board1 == TTTBoard()
+
+    gc = GameConductor()
+    handle1 = gc.get_handle(CROSS)
+    handle2 = gc.get_handle()
+    with pytest.raises(GameRulesError):
+        gc.rematch()  # game is not over
+    for move1, move2 in [((0, 0), (1, 0)), ((0, 1), (1, 1))]:
+        handle1(move1)
+        handle2(move2)
+    handle1((0, 2))
+
+    gc.rematch()
+    assert gc.game_board == TTTBoard() and not gc.is_game_over
+    assert (handle1.mark, handle2.mark) == (ZERO, CROSS)
+    assert handle2.is_my_turn()
+    handle2((1, 1))
+
+    gc.reset()
+    assert gc.game_board == TTTBoard() and gc.current_move == CROSS
+    assert not handle1.is_my_turn() and not handle2.is_my_turn()
+    assert not handle1.is_valid()
+    with pytest.raises(GameRulesError):
+        handle1((0, 0))
+    handle = gc.get_handle(ZERO)
+    assert gc.get_handle().mark == CROSS
+    assert not handle.is_my_turn()
+
+
+def test_game_conductor_pool():
+    pool = GameConductorPool(maxsize=1)
+    gc1, gc2 = pool.acquire(), pool.acquire()
+    assert gc1 is not gc2 and len(pool) == 0
+    gc1.get_handle(CROSS)((1, 1))
+    pool.release(gc1)
+    pool.release(gc2)  # pool is full
+    assert len(pool) == 1
+    gc = pool.acquire()
+    assert gc is gc1 and gc.game_board == TTTBoard()
+    assert gc.get_handle(CROSS).is_my_turn()
+
+
 def test_opposite_mark():
     """Test for basic ternary operator for marks"""
     assert get_opposite_mark(CROSS) == ZERO
@@ -184,3 +242,101 @@ def test_get_mark():
     assert handle2.is_my_turn() is True
     assert handle1.mark == CROSS
     assert handle2.mark == ZERO
+
+
+@pytest.mark.rust
+def test_rust_board_is_compatible():
+    """TTTBoardRs behaves like TTTBoard during random games"""
+    random.seed(48573)
+    for _ in range(20):
+        board, board_rs = TTTBoard(), TTTBoardRs()
+        mark = CROSS
+        while not board.is_game_over():
+            move = random_available_move(board.grid)
+            assert board_rs.find_optimal_move(mark) == tuple(
+                find_optimal_move_rs(board.grid, mark)
+            )
+            board.make_move(move, mark)
+            board_rs.make_move(move, mark)
+            assert board_rs == board and board_rs == board.grid
+            assert board_rs.is_game_over() == board.is_game_over()
+            assert board_rs.n_empty_cells() == board.n_empty_cells()
+            assert board_rs.get_winner() == board.get_winner()
+            assert str(board_rs) == str(board)
+            with pytest.raises(InvalidMoveError, match=r".*this cell is not free.*"):
+                board_rs.make_move(move, mark)
+            mark = get_opposite_mark(mark)
+        assert TTTBoardRs(board.grid) == board_rs
+
+
+@pytest.mark.rust
+def test_game_conductor_with_rust_board():
+    gc = GameConductor(TTTBoardRs)
+    handle1 = gc.get_handle(CROSS)
+    handle2 = gc.get_handle()
+    for move1, move2 in [((0, 0), (1, 0)), ((0, 1), (1, 1))]:
+        handle1(move1)
+        handle2(move2)
+    handle1((0, 2))
+    assert gc.is_game_over
+    assert gc.result == CROSS
+    assert str(gc.game_board) == "XXX\nOO_\n___"
+    gc.reset()
+    assert str(gc.game_board) == "___\n___\n___"
+
+
+@pytest.mark.rust
+def test_simulate_games_rs():
+    x_wins, o_wins, draws, moves, _, record = simulate_games_rs(
+        "random", "table", 500, seed=3, threads=3, record_moves=True
+    )
+    assert x_wins == 0 and x_wins + o_wins + draws == 500
+    assert simulate_games_rs("random", "table", 500, seed=3, threads=1)[:4] == (
+        x_wins,
+        o_wins,
+        draws,
+        moves,
+    )
+    # 9 cells (0 to 8) per game in order of moves, 255 after the end
+    results = {CROSS: 0, ZERO: 0, None: 0}
+    for game in range(500):
+        board, mark = TTTBoard(), CROSS
+        for cell in record[9 * game : 9 * game + 9]:
+            if cell == 255:
+                break
+            board.make_move((cell // 3, cell % 3), mark)
+            mark = get_opposite_mark(mark)
+        assert board.is_game_over()
+        results[board.get_winner()] += 1
+        moves -= 9 - board.n_empty_cells()
+    assert results == {CROSS: x_wins, ZERO: o_wins, None: draws} and moves == 0
+
+    assert simulate_games_rs("minimax", "table", 100)[2] == 100
+    assert simulate_games_rs("minimax", "random", 100)[1] == 0
+    with pytest.raises(ValueError):
+        simulate_games_rs("mcts", "random", 1)
+
+
+@pytest.mark.rust
+def test_search_stats(board1):
+    board = TTTBoard()
+    board.make_move((1, 1), CROSS)
+    move, stats = find_optimal_move_with_stats(board.grid, ZERO)
+    assert move == find_optimal_move(board.grid, ZERO)
+    assert stats[:4] == (3239, 475, 1411, 8)
+    assert stats.seconds > 0
+    move_rs, stats_rs = find_optimal_move_rs_with_stats(board.grid, ZERO)
+    assert tuple(move_rs) == move
+    assert stats_rs[:4] == stats[:4]
+    assert board == TTTBoard([[".", ".", "."], [".", "X", "."], [".", ".", "."]])
+
+    calls, totals = search_totals("minimax")
+    strategy = get_strategy("minimax", stats=True)
+    assert strategy(board1.grid, ZERO) == find_optimal_move(board1.grid, ZERO)
+    strategy(board.grid, ZERO)
+    calls_after, totals_after = search_totals("minimax")
+    assert calls_after == calls + 2
+    assert totals_after.nodes - totals.nodes > stats.nodes
+    assert totals_after.max_depth >= 8
+    with pytest.raises(ValueError, match="doesn't support statistics"):
+        get_strategy("random", stats=True)
@@ -0,0 +1,45 @@
+"""Tests for hints and keyboards of boards"""
+import pytest
+from tic_tac_toe.analysis import free_cells, is_finished, reachable_positions, to_grid
+from tic_tac_toe.bot_helpers import HINT_CALLBACK, HINT_LABELS, board_keyboard
+from tic_tac_toe.game import CROSS, ZERO, TTTBoard, find_optimal_move
+from tic_tac_toe.hints import DRAW, LOSS, NO_MOVE, WIN, move_results
+
+
+def test_results_of_moves():
+    assert move_results(TTTBoard().grid) == bytes([DRAW] * 9)
+    grid = TTTBoard([["X", "X", "."], ["O", "O", "."], [".", ".", "."]]).grid
+    expected = [NO_MOVE, NO_MOVE, WIN, NO_MOVE, NO_MOVE, DRAW, LOSS, LOSS, LOSS]
+    assert list(move_results(grid)) == expected
+    with pytest.raises(ValueError):
+        move_results([["X", "X", "."], ["."] * 3, ["."] * 3])
+
+
+def test_optimal_moves_are_the_best():
+    for position in reachable_positions()[::7]:
+        if is_finished(position):
+            continue
+        grid, mark = to_grid(position)
+        results = move_results(grid)
+        assert {results[cell] for cell in free_cells(position)} <= {WIN, DRAW, LOSS}
+        r, c = find_optimal_move(grid, mark)
+        assert results[3 * r + c] == max(results)
+
+
+def test_keyboards_are_cached():
+    board = TTTBoard([["X", ".", "."], [".", "O", "."], [".", ".", "."]])
+    keyboard = board_keyboard(board.grid)
+    assert board_keyboard(board.grid) is keyboard
+    assert keyboard.inline_keyboard[0][0].text == CROSS
+    assert keyboard.inline_keyboard[3][0].callback_data == HINT_CALLBACK
+
+    hinted = board_keyboard(board.grid, hints=True)
+    assert board_keyboard(board.grid, hints=True) is hinted
+    assert len(hinted.inline_keyboard) == 3  # no hint button
+    labels = [button.text for row in hinted.inline_keyboard for button in row]
+    assert labels[0] == CROSS and labels[4] == ZERO
+    assert set(labels) - {CROSS, ZERO} <= set(HINT_LABELS.values())
+    assert [b.callback_data for b in hinted.inline_keyboard[2]] == ["20", "21", "22"]
+
+    wrong = [["O", ".", "."], ["."] * 3, ["."] * 3]  # not cached, no hints
+    assert board_keyboard(wrong, hints=True) is not board_keyboard(wrong, hints=True)
@@ -0,0 +1,80 @@
+"""Tests for logging through a queue"""
+import io
+import json
+import logging
+import threading
+
+import pytest
+from tic_tac_toe.logs import log_event, parse_sampling, set_sampling, setup_logging
+
+
+@pytest.fixture
+def stream():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    stream = io.StringIO()
+    yield stream
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    set_sampling({})
+
+
+def test_parse_sampling():
+    assert parse_sampling("") == {}
+    assert parse_sampling("move=0.1, callback=1") == {"move": 0.1, "callback": 1.0}
+    with pytest.raises(ValueError):
+        parse_sampling("move")
+    with pytest.raises(ValueError):
+        parse_sampling("move=2")
+
+
+def test_structured_events(stream):
+    listener = setup_logging(handler=logging.StreamHandler(stream))
+    logger = logging.getLogger("tic_tac_toe.test")
+    log_event(logger, "move", game=7, move=(1, 1))
+    logger.info("plain %s", "message")
+    listener.stop()
+    lines = stream.getvalue().splitlines()
+    assert lines[0].endswith("INFO - move game=7 move=(1, 1)")
+    assert lines[1].endswith("plain message")
+
+
+def test_written_by_listener_thread(stream):
+    threads = []
+
+    class Handler(logging.StreamHandler):
+        def emit(self, record):
+            threads.append(threading.current_thread())
+            super().emit(record)
+
+    listener = setup_logging(handler=Handler(stream), as_json=True)
+    logger = logging.getLogger("tic_tac_toe.test")
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logger.exception("failed")
+    log_event(logger, "move", chat=1)
+    listener.stop()
+    assert threads and threading.main_thread() not in threads
+    first, second = map(json.loads, stream.getvalue().splitlines())
+    assert first["message"] == "failed" and "boom" in first["exception"]
+    assert second["chat"] == 1
+
+
+def test_sampling(stream):
+    listener = setup_logging(
+        handler=logging.StreamHandler(stream), sampling={"move": 0.1, "quiet": 0}
+    )
+    logger = logging.getLogger("tic_tac_toe.test")
+    for _ in range(2000):
+        log_event(logger, "move")
+        log_event(logger, "quiet")
+    log_event(logger, "end")
+    listener.stop()
+    lines = stream.getvalue().splitlines()
+    assert 100 < len(lines) - 1 < 400
+    assert not any(line.endswith("quiet") for line in lines)
+    assert lines[-1].endswith("end")
@@ -0,0 +1,53 @@
+"""Tests for the monitor of the event loop"""
+import asyncio
+import time
+
+import pytest
+from tic_tac_toe.loop_monitor import LoopMonitor, callback_owner
+from tic_tac_toe.metrics import REGISTRY
+
+
+def test_callback_owner():
+    description = "<Task pending name='game_singleplayer' coro=<router() running>>"
+    assert callback_owner(description) == "game_singleplayer"
+    assert callback_owner("<Handle sleep()>") == "other"
+    with pytest.raises(ValueError):
+        LoopMonitor(interval=0)
+
+
+@pytest.mark.asyncio
+async def test_stall_is_detected(caplog):
+    monitor = LoopMonitor(interval=0.01, threshold=0.05)
+    stalls = REGISTRY.counter("loop_stalls").value
+    monitor.start()
+    await asyncio.sleep(0.02)
+
+    async def blocking_handler():
+        with monitor.track("blocking_handler"):
+            assert monitor.in_flight == {"blocking_handler": 1}
+            assert asyncio.current_task().get_name() == "blocking_handler"
+            time.sleep(0.2)  # a synchronous call in the loop thread
+            await asyncio.sleep(0.05)
+
+    await asyncio.create_task(blocking_handler())
+    await monitor.stop()
+    assert monitor.in_flight == {"blocking_handler": 0}
+    assert REGISTRY.gauge("handlers_in_flight", handler="blocking_handler").value == 0
+    assert REGISTRY.counter("loop_stalls").value > stalls
+    assert 0.15 < monitor.max_lag <= REGISTRY.gauge("loop_lag_max_seconds").value
+    assert "handlers in flight {'blocking_handler': 1}" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_slow_callbacks():
+    monitor = LoopMonitor(interval=1, threshold=0.05, slow_callbacks=True)
+    monitor.start()
+
+    async def slow_handler():
+        with monitor.track("slow_handler"):
+            time.sleep(0.1)
+
+    await asyncio.create_task(slow_handler())
+    await monitor.stop()
+    assert REGISTRY.counter("slow_callbacks", handler="slow_handler").value == 1
+    assert not asyncio.get_running_loop().get_debug()
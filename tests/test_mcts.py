@@ -0,0 +1,77 @@
+"""Tests for Monte Carlo tree search"""
+import pytest
+from tic_tac_toe.analysis import is_finished, play, reachable_positions, solve, to_grid
+from tic_tac_toe.engines import get_strategy
+from tic_tac_toe.exceptions import GameRulesError
+from tic_tac_toe.game import CROSS, ZERO, GameConductor, TTTBoard
+from tic_tac_toe.mcts import MCTS, MCTSRust, grid_to_position
+
+TREE_CLASSES = [MCTS, pytest.param(MCTSRust, marks=pytest.mark.rust)]
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+def test_win_and_block(tree_class):
+    tree = tree_class(seed=1)
+    grid = TTTBoard([["X", "X", "."], ["O", "O", "."], [".", ".", "."]]).grid
+    result = tree.search(grid, CROSS)
+    assert result.move == (0, 2)
+    assert result.value == 1.0  # proven
+    assert tree.search(grid, ZERO).move == (1, 2)
+
+    grid = TTTBoard([["X", "X", "."], ["O", ".", "."], [".", ".", "."]]).grid
+    assert tree.search(grid, ZERO).move == (0, 2)
+    with pytest.raises(GameRulesError):
+        tree.search([["X"] * 3, ["O", "O", "."], ["."] * 3], ZERO)
+
+
+@pytest.mark.parametrize("tree_class", TREE_CLASSES)
+def test_small_budgets(tree_class):
+    grid = TTTBoard([["X", "X", "."], ["O", "O", "."], [".", ".", "."]]).grid
+    for tree in (tree_class(max_nodes=1, seed=3), tree_class(playouts=0)):
+        result = tree.search(grid, CROSS)  # the root is expanded anyway
+        assert result.move == (0, 2)
+    with pytest.raises(ValueError):
+        tree_class(time_limit=float("nan"))
+
+
+def test_tree_reuse():
+    tree = MCTS(seed=2)
+    grid = TTTBoard().grid
+    first = tree.search(grid, CROSS)
+    assert first.reused == 0
+    assert first.playouts == 3_000
+
+    r, c = first.move
+    grid[r][c] = CROSS
+    grid[0][0 if first.move != (0, 0) else 1] = ZERO
+    second = tree.search(grid, CROSS)
+    assert 0 < second.reused < first.playouts
+    assert tree.root_position == grid_to_position(grid)
+
+    # unrelated position starts a new tree
+    third = tree.search(TTTBoard().grid, ZERO)
+    assert third.reused == 0
+
+
+def test_never_loses():
+    """Default budget doesn't lose from any (sampled) reachable position"""
+    positions = [p for p in reachable_positions() if not is_finished(p)]
+    for position in positions[::5]:
+        grid, mark = to_grid(position)
+        r, c = MCTS(seed=3).search(grid, mark).move
+        value = solve(position)
+        assert min(value, 0) <= -solve(play(position, 3 * r + c)), grid
+
+
+def test_mcts_vs_minimax():
+    mcts, minimax = get_strategy("mcts"), get_strategy("minimax")
+    for mcts_mark in (CROSS, ZERO):
+        gc = GameConductor()
+        handle = gc.get_handle(mcts_mark)
+        opponent = gc.get_handle(what_is_left=True)
+        while not gc.is_game_over:
+            player, strategy = (
+                (handle, mcts) if handle.is_my_turn() else (opponent, minimax)
+            )
+            player(strategy(gc.game_board.grid, player.mark))
+        assert gc.result is None  # draw
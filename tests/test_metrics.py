@@ -0,0 +1,27 @@
+"""Tests for in-process metrics"""
+import pytest
+from tic_tac_toe.metrics import MetricsRegistry, metric_key
+
+
+def test_registry():
+    registry = MetricsRegistry()
+    registry.counter("reaped_games", kind="singleplayer").inc()
+    registry.counter("reaped_games", kind="singleplayer").inc(2)
+    gauge = registry.gauge("players_waiting")
+    gauge.set(5)
+    gauge.dec()
+    registry.gauge("live_games", lambda: 7)
+
+    assert registry.snapshot() == {
+        "live_games": 7,
+        "players_waiting": 4,
+        'reaped_games{kind="singleplayer"}': 3,
+    }
+    assert registry.render().splitlines()[0] == "live_games 7"
+    with pytest.raises(TypeError):
+        registry.counter("players_waiting")
+
+
+def test_metric_key():
+    assert metric_key("lag") == "lag"
+    assert metric_key("in_flight", handler="a", b="c") == 'in_flight{b="c",handler="a"}'
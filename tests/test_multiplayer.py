@@ -1,6 +1,8 @@
 """Tests for multiplayer helpers"""
 import pytest
-from tic_tac_toe.exceptions import NotEnoughPlayersError
+from tic_tac_toe.exceptions import CurrentGameError, NotEnoughPlayersError
+from tic_tac_toe.game import CROSS, ZERO
+from tic_tac_toe.matchmaking import Matchmaker
 from tic_tac_toe.multiplayer import Game, GamePersonalized, Multiplayer, PlayersQueue
 
 
@@ -60,3 +62,99 @@ def test_startup_multiplayer():
     multiplayer.remove_game(1)
     assert len(multiplayer.games) == 0
     assert len(multiplayer.players_queue) == 0
+
+
+def test_rematch():
+    """Finished game is played again by the same pair with swapped marks"""
+    multiplayer = Multiplayer()
+    multiplayer.register_player(chat_id=1, message_id=3, user_name="1")
+    multiplayer.register_player(chat_id=2, message_id=4, user_name="2")
+    game = multiplayer.register_pair()
+    with pytest.raises(CurrentGameError):
+        multiplayer.request_rematch(1, message_id=5)
+
+    handle1, handle2 = game.myself.handle, game.opponent.handle
+    for move1, move2 in [((0, 0), (1, 0)), ((0, 1), (1, 1))]:
+        handle1(move1)
+        handle2(move2)
+    handle1((0, 2))
+    assert multiplayer.is_game_over(1)
+
+    assert multiplayer.request_rematch(2, message_id=6) is None
+    assert multiplayer.get_rematch_request(2) == 6
+    rematch = multiplayer.request_rematch(1, message_id=5)
+    assert rematch.myself.chat_id == 2 and rematch.myself.mark == CROSS
+    assert rematch.opponent.mark == ZERO and rematch.opponent.message_id == 5
+    assert rematch.game_id == game.game_id
+    assert rematch.game_conductor is game.game_conductor
+    assert multiplayer.games[1] is multiplayer.games[2]
+    assert multiplayer.get_rematch_request(2) is None
+    assert not multiplayer.is_game_over(1)
+    assert handle2.is_my_turn() and handle2.mark == CROSS
+    handle2((1, 1))
+
+    multiplayer.remove_game(2)
+    assert len(multiplayer.games) == 0
+    assert len(multiplayer.conductors) == 1
+    assert not handle1.is_my_turn()  # conductor was reset in the pool
+    multiplayer.register_player(chat_id=1, message_id=7, user_name="1")
+    multiplayer.register_player(chat_id=3, message_id=8, user_name="3")
+    assert multiplayer.register_pair().game_conductor is game.game_conductor
+    assert len(multiplayer.conductors) == 0
+
+
+def test_queue_stale_players():
+    """Only players who joined before the deadline are evicted, oldest first"""
+    queue = PlayersQueue()
+    for elem in range(10):
+        queue.enqueue({"chat_id": elem, "message_id": elem}, joined_at=float(elem))
+
+    assert queue.waiting_since(3) == 3.0
+    queue.remove(1)
+    stale = queue.dequeue_stale(older_than=5.0)
+    assert [player["chat_id"] for player in stale] == [0, 2, 3, 4]
+    assert len(queue) == 5
+    assert queue.dequeue()["chat_id"] == 5
+    assert queue.dequeue_stale(older_than=0.0) == []
+
+
+def test_register_pairs_in_batches():
+    """Pairs are made from the earliest players, the odd one keeps waiting"""
+    multiplayer = Multiplayer()
+    for chat_id in range(1, 8):
+        multiplayer.register_player(chat_id=chat_id, message_id=0, user_name="")
+
+    games = multiplayer.register_pairs(max_pairs=2)
+    assert [(g.myself.chat_id, g.opponent.chat_id) for g in games] == [(1, 2), (3, 4)]
+    assert games[0].myself.mark == CROSS
+    assert len(multiplayer.players_queue) == 3
+
+    games = multiplayer.register_pairs()
+    assert len(games) == 1
+    assert multiplayer.is_player_waiting
+    assert multiplayer.is_this_player_in_queue(7)
+    assert len(multiplayer.games) == 6
+
+
+@pytest.mark.asyncio
+async def test_matchmaker_round():
+    """Matchmaker notifies new pairs and evicted players"""
+    multiplayer = Multiplayer()
+    paired, evicted = [], []
+
+    async def on_pair(game):
+        paired.append((game.myself.chat_id, game.opponent.chat_id))
+
+    async def on_evict(player):
+        evicted.append(player["chat_id"])
+
+    matchmaker = Matchmaker(multiplayer, on_pair, on_evict, wait_timeout=60)
+    for chat_id in range(1, 4):
+        multiplayer.register_player(chat_id=chat_id, message_id=0, user_name="")
+    assert await matchmaker.run_once() == (1, 0)
+    assert paired == [(1, 2)]
+
+    matchmaker.wait_timeout = 0
+    assert await matchmaker.run_once() == (0, 1)
+    assert evicted == [3]
+    assert not multiplayer.is_player_waiting
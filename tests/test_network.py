@@ -0,0 +1,95 @@
+"""Tests for settings of the HTTP layer and the fake Bot API"""
+import asyncio
+
+import pytest
+from telegram import Bot
+from tic_tac_toe.fake_api import FakeBotApi
+from tic_tac_toe.network import (
+    NetworkSettings,
+    application_builder,
+    load_settings,
+    make_request,
+)
+
+
+def test_load_settings(tmp_path):
+    assert load_settings({}) == NetworkSettings()
+    config = tmp_path / "network.toml"
+    config.write_text("[network]\npool_size = 32\nread_timeout = 3\n")
+    environ = {
+        "TIC_TAC_TOE_NETWORK_CONFIG": str(config),
+        "TIC_TAC_TOE_POOL_SIZE": "8",  # environment overrides the file
+        "TIC_TAC_TOE_KEEPALIVE_EXPIRY": "2.5",
+    }
+    settings = load_settings(environ)
+    assert settings.pool_size == 8
+    assert settings.read_timeout == 3.0
+    assert settings.keepalive_expiry == 2.5
+
+    with pytest.raises(ValueError):
+        load_settings({"TIC_TAC_TOE_POOL_SIZE": "0"})
+    with pytest.raises(ValueError):
+        load_settings({"TIC_TAC_TOE_CONCURRENT_UPDATES": "many"})
+    config.write_text("[network]\npool = 32\n")
+    with pytest.raises(ValueError):
+        load_settings(environ)
+
+
+async def send_messages(api: FakeBotApi, settings: NetworkSettings, n: int) -> None:
+    bot = Bot(api.token, base_url=api.base_url, request=make_request(settings))
+    async with bot:
+        messages = await asyncio.gather(
+            *(bot.send_message(chat_id=i, text=f"hi {i}") for i in range(n))
+        )
+    assert [message.chat_id for message in messages] == list(range(n))
+
+
+@pytest.mark.asyncio
+async def test_pool_and_keepalive():
+    api = FakeBotApi(latency=0.01)
+    await api.start()
+    try:
+        settings = NetworkSettings(pool_size=4)
+        await send_messages(api, settings, 20)
+        assert api.calls == {"getMe": 1, "sendMessage": 20}
+        assert api.connections <= 4  # connections are reused
+        assert {"chat_id": 19, "text": "hi 19"} in [call.params for call in api.log]
+
+        connections = api.connections
+        await send_messages(api, settings._replace(keepalive_connections=0), 5)
+        assert api.connections - connections == 6  # one per call
+    finally:
+        await api.stop()
+
+
+@pytest.mark.asyncio
+async def test_application_uses_settings():
+    api = FakeBotApi()
+    await api.start()
+    settings = NetworkSettings(concurrent_updates=16, base_url=api.base_url)
+    application = application_builder(api.token, settings).build()
+    try:
+        async with application:
+            assert application.concurrent_updates == 16
+            await application.bot.send_message(chat_id=1, text="hi")
+        assert api.calls == {"getMe": 1, "sendMessage": 1}
+    finally:
+        await api.stop()
+
+
+@pytest.mark.asyncio
+async def test_long_polling():
+    api = FakeBotApi()
+    await api.start()
+    bot = Bot(api.token, base_url=api.base_url)
+    try:
+        async with bot:
+            assert await bot.get_updates(timeout=0.05) == ()
+            poll = asyncio.create_task(bot.get_updates(offset=1, timeout=5))
+            await asyncio.sleep(0.05)
+            api.put_update({"update_id": 1})
+            updates = await asyncio.wait_for(poll, 1)
+            assert [update.update_id for update in updates] == [1]
+            assert await bot.get_updates(offset=2, timeout=0) == ()
+    finally:
+        await api.stop()
@@ -0,0 +1,89 @@
+"""Tests for the database of solved positions"""
+import pytest
+from tic_tac_toe.analysis import play, reachable_positions, solve, to_grid
+from tic_tac_toe.exceptions import PositionDbError
+from tic_tac_toe.game import CROSS, ZERO
+from tic_tac_toe.position_db import (
+    DRAW,
+    HEADER_SIZE,
+    ILLEGAL,
+    LOSS,
+    WIN,
+    PositionDB,
+    Variant,
+    build,
+)
+
+RESULTS = {1: WIN, 0: DRAW, -1: LOSS}
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    with build(tmp_path_factory.mktemp("db") / "3x3.bin") as db:
+        yield db
+
+
+def test_solved_3x3(db):
+    assert db.variant == Variant(3, 3, 3)
+    for position in reachable_positions():
+        grid, mark = to_grid(position)
+        assert db.lookup(grid)[0] == RESULTS[solve(position)]
+        if solve(position) == 1:
+            r, c = db.best_move(grid, mark)
+            assert solve(play(position, 3 * r + c)) == -1
+
+    assert db.lookup([["X", "X", "."], ["O", "O", "."], [".", ".", "."]]) == (WIN, 1)
+    assert db.lookup([["X", "X", "X"], ["O", "O", "."], [".", ".", "."]]) == (LOSS, 0)
+    assert db.lookup([["X", "X", "X"], ["O", "O", "O"], [".", ".", "."]])[0] == ILLEGAL
+    assert db.lookup([["O", "O", "."], [".", ".", "."], [".", ".", "."]])[0] == ILLEGAL
+
+
+def test_best_move(db):
+    # X wins at once, not in 3 moves
+    grid = [["X", ".", "X"], ["O", "O", "."], ["X", ".", "O"]]
+    assert db.best_move(grid, CROSS) == (0, 1)
+    # a draw, and it is X to move
+    grid = [["X", ".", "."], [".", "O", "."], [".", ".", "."]]
+    assert db.lookup(grid) == (DRAW, 0)
+    with pytest.raises(PositionDbError):
+        db.best_move(grid, ZERO)  # not O's move
+
+
+@pytest.mark.rust
+def test_rust_reader(db):
+    reader = db.rust_reader()
+    assert (reader.rows, reader.cols, reader.k) == db.variant
+    for position in reachable_positions()[::50]:
+        grid, mark = to_grid(position)
+        assert reader.lookup(grid) == db.lookup(grid)
+        if db.lookup(grid)[1]:
+            assert reader.best_move(grid, mark) == db.best_move(grid, mark)
+    del reader
+
+
+def test_parallel_build(tmp_path):
+    variant = Variant(rows=3, cols=4, k=3)
+    with build(tmp_path / "serial.bin", variant) as serial:
+        with build(tmp_path / "parallel.bin", variant, 2, chunk_size=1000) as parallel:
+            assert serial.checksum == parallel.checksum
+            assert (serial.table == parallel.table).all()
+            empty = [["."] * 4 for _ in range(3)]
+            assert serial.lookup(empty) == (WIN, 7)
+
+
+def test_corrupted(tmp_path, db):
+    data = bytearray(db.path.read_bytes())
+    path = tmp_path / "db.bin"
+
+    data[HEADER_SIZE + 100] ^= 0xFF
+    path.write_bytes(data)
+    with pytest.raises(PositionDbError, match="checksum"):
+        PositionDB(path)
+    PositionDB(path, verify=False).close()
+
+    path.write_bytes(b"NOTADB" + data[6:])
+    with pytest.raises(PositionDbError):
+        PositionDB(path)
+    path.write_bytes(data[:-1])
+    with pytest.raises(PositionDbError):
+        PositionDB(path)
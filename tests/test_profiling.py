@@ -0,0 +1,53 @@
+"""Tests for on-demand profiler"""
+import asyncio
+import pstats
+import time
+
+import pytest
+from tic_tac_toe.exceptions import ProfilingError
+from tic_tac_toe.profiling import Profiler
+
+
+def busy_handler(seconds: float) -> None:
+    """Blocks the loop, like a synchronous search"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def busy_search(seconds: float) -> None:
+    """Engine in a worker thread"""
+    busy_handler(seconds)
+
+
+async def handler_task():
+    for _ in range(5):
+        busy_handler(0.02)
+        await asyncio.sleep(0)
+    await asyncio.to_thread(busy_search, 0.05)
+
+
+@pytest.mark.asyncio
+async def test_profiling_session(tmp_path):
+    profiler = Profiler(tmp_path, sample_interval=0.001)
+    assert not profiler.is_active
+
+    session = asyncio.create_task(profiler.profile(0.2))
+    await asyncio.sleep(0)
+    assert profiler.is_active
+    with pytest.raises(ProfilingError):
+        await profiler.profile(0.1)
+    await handler_task()
+    result = await session
+    assert not profiler.is_active
+
+    stats = pstats.Stats(str(result.pstats))
+    assert any(func[2] == "busy_handler" for func in stats.stats)  # type: ignore
+    collapsed = result.collapsed.read_text()
+    assert result.n_samples > 0
+    assert "test_profiling:busy_handler" in collapsed
+    assert "test_profiling:busy_search" in collapsed  # from a worker thread
+    assert result.tracemalloc.exists()
+
+    second = await profiler.profile(0.01)  # within the same second
+    assert second.pstats != result.pstats
@@ -0,0 +1,83 @@
+"""Tests for dense ranks of positions"""
+import itertools
+
+import numpy as np
+import pytest
+from tic_tac_toe import HAS_RUST
+from tic_tac_toe.analysis import reachable_positions, to_grid
+from tic_tac_toe.bot_helpers import render_board
+from tic_tac_toe.game import TTTBoard
+from tic_tac_toe.ranking import (
+    N_RANKS,
+    canonical_rank,
+    canonical_rank_array,
+    grids_to_array,
+    rank,
+    rank_array,
+    unrank,
+)
+
+if HAS_RUST:
+    from tic_tac_toe import canonical_rank_rs, rank_rs, unrank_rs
+
+
+def legal_grids():
+    for codes in itertools.product(".XO", repeat=9):
+        if 0 <= codes.count("X") - codes.count("O") <= 1:
+            yield [list(codes[r * 3 : r * 3 + 3]) for r in range(3)]
+
+
+def test_rank_is_dense():
+    ranks = [rank(grid) for grid in legal_grids()]
+    assert N_RANKS == 6046
+    assert sorted(ranks) == list(range(N_RANKS))
+    assert rank(TTTBoard().grid) == 0
+    for r in range(N_RANKS):
+        assert rank(unrank(r)) == r
+
+
+def test_illegal():
+    with pytest.raises(ValueError):
+        rank([["O", ".", "."], [".", ".", "."], [".", ".", "."]])
+    with pytest.raises(ValueError):
+        rank([["X", "X", "."], [".", ".", "."], [".", ".", "."]])
+    with pytest.raises(ValueError):
+        unrank(N_RANKS)
+    with pytest.raises(ValueError):
+        rank_array(np.array([[2, 0, 0, 0, 0, 0, 0, 0, 0]]))
+    # illegal boards are still rendered, without caching
+    assert render_board(TTTBoard([["O"] * 3] * 3))[1] == "O"
+
+
+def test_canonical_rank():
+    corners = [
+        [["X", ".", "."], [".", ".", "."], [".", ".", "."]],
+        [[".", ".", "X"], [".", ".", "."], [".", ".", "."]],
+        [[".", ".", "."], [".", ".", "."], ["X", ".", "."]],
+        [[".", ".", "."], [".", ".", "."], [".", ".", "X"]],
+    ]
+    assert len({canonical_rank(grid) for grid in corners}) == 1
+    assert len({rank(grid) for grid in corners}) == 4
+    # legal positions up to rotations and reflections
+    n_classes = {canonical_rank(grid) for grid in legal_grids()}
+    assert len(n_classes) == 850
+
+
+def test_numpy_ranks():
+    grids = list(legal_grids())
+    cells = grids_to_array(grids)
+    assert rank_array(cells).tolist() == [rank(grid) for grid in grids]
+    assert rank_array(cells.reshape(-1, 3, 3)).tolist() == rank_array(cells).tolist()
+    canonical = canonical_rank_array(cells[::7])
+    assert canonical.tolist() == [canonical_rank(grid) for grid in grids[::7]]
+
+
+@pytest.mark.rust
+def test_rust_ranks():
+    for position in reachable_positions():
+        grid, _ = to_grid(position)
+        assert rank_rs(grid) == rank(grid)
+        assert canonical_rank_rs(grid) == canonical_rank(grid)
+        assert unrank_rs(rank(grid)) == grid
+    with pytest.raises(ValueError):
+        unrank_rs(N_RANKS)
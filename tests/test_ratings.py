@@ -0,0 +1,148 @@
+"""Tests for ratings, leaderboard and rating-aware pairing"""
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+from tic_tac_toe.bot_helpers import render_leaderboard
+from tic_tac_toe.game import CROSS, ZERO
+from tic_tac_toe.multiplayer import Multiplayer
+from tic_tac_toe.ratings import (
+    INITIAL_RATING,
+    RatingIndex,
+    Ratings,
+    elo_update,
+    game_score,
+)
+
+
+def test_elo():
+    assert elo_update(1500, 1500, 1) == (1516, 1484)
+    assert elo_update(1500, 1500, 0.5) == (1500, 1500)
+    win, _ = elo_update(1200, 1800, 1)
+    assert win - 1200 > 30  # upset
+    assert game_score(None, CROSS) == 0.5
+    assert game_score(CROSS, CROSS) == 1 and game_score(ZERO, CROSS) == 0
+
+
+def test_index_matches_sorting():
+    rng = random.Random(1)
+    index = RatingIndex()
+    ratings = {}
+    for _ in range(3000):
+        player = rng.randrange(300)
+        ratings[player] = rng.uniform(-100, 4200)
+        index.update(player, ratings[player])
+        if rng.random() < 0.05:
+            removed = rng.choice(list(ratings))
+            index.remove(removed)
+            del ratings[removed]
+
+    buckets = {player: index.bucket(rating) for player, rating in ratings.items()}
+    assert len(index) == len(ratings)
+    for player, bucket in buckets.items():
+        assert index.rank(player) == 1 + sum(b > bucket for b in buckets.values())
+    top = index.top(20)
+    best = sorted(buckets.values(), reverse=True)[:20]
+    assert [buckets[player] for player in top] == best
+    assert len(index.top(10_000)) == len(ratings)
+
+
+def test_ratings_and_persistence(tmp_path):
+    path = str(tmp_path / "ratings.sqlite3")
+    ratings = Ratings(path)
+    assert ratings.rating(1) == INITIAL_RATING and ratings.rank(1) is None
+    ratings.record_game(1, 2, 1, names=("Ann", "Bob"))
+    ratings.record_game(3, 2, 0.5)
+    ratings.record_bot_game(4, "random", 0, name="Eve")
+    with pytest.raises(ValueError):
+        ratings.record_game(1, 1, 1)
+    assert [player for player, _ in ratings.top(2)] == [1, 3]
+    assert ratings.rank(4) == 4
+    assert ratings.players[2].games == 2
+    assert ratings.flush() == 4
+    assert ratings.flush() == 0  # nothing has changed
+
+    ratings.record_game(1, 3, 0)
+    assert ratings.flush() == 2
+    loaded = Ratings(path)
+    assert loaded.load() == 4
+    assert loaded.players == ratings.players
+    assert loaded.rank(1) == ratings.rank(1)
+
+
+@pytest.mark.asyncio
+async def test_flush_in_background(tmp_path):
+    path = str(tmp_path / "ratings.sqlite3")
+    ratings = Ratings(path, flush_interval=0.01)
+    ratings.start()
+    ratings.record_game(1, 2, 1)
+    assert await ratings.flush_async() == 2
+    ratings.record_game(1, 2, 1)
+    await ratings.stop()  # writes the rest
+    loaded = Ratings(path)
+    loaded.load()
+    assert loaded.players[1].games == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_write(tmp_path):
+    path = str(tmp_path / "ratings.sqlite3")
+    ratings = Ratings(path, flush_interval=0)
+    write, started = ratings._write, threading.Event()
+
+    def slow_write(rows):
+        started.set()
+        time.sleep(0.2)
+        write(rows)
+
+    ratings._write = slow_write  # type: ignore
+    ratings.record_game(1, 2, 1)
+    ratings.start()
+    await asyncio.to_thread(started.wait)
+    ratings.record_game(1, 3, 1)
+    await ratings.stop()  # the final flush waits for the periodic one
+    assert Ratings(path).load() == 3
+
+
+def test_pairing_by_rating():
+    rating = {1: 1500, 2: 2100, 3: 1450, 4: 1900, 5: 1600, 6: 1600}
+    multiplayer = Multiplayer(rating_of=rating.__getitem__)
+    for chat_id in rating:
+        multiplayer.register_player(chat_id=chat_id, message_id=0, user_name="")
+    multiplayer.remove_player_from_queue(6)
+    games = multiplayer.register_pairs()
+    pairs = [{game.myself.chat_id, game.opponent.chat_id} for game in games]
+    # the earliest player gets the closest opponent
+    assert pairs == [{1, 3}, {2, 4}]
+    assert len(multiplayer.players_queue) == 1
+    assert multiplayer.get_game(1).myself.mark == CROSS  # the earliest is first
+
+    rating[7] = 100
+    multiplayer.register_player(chat_id=7, message_id=0, user_name="")
+    (game,) = multiplayer.register_pairs()
+    assert {game.myself.chat_id, game.opponent.chat_id} == {5, 7}
+
+
+def test_players_are_rated_by_user_id():
+    rating = {101: 1500, 102: 2000, 103: 1550}
+    multiplayer = Multiplayer(rating_of=rating.__getitem__)
+    for chat_id, user_id in ((1, 101), (2, 102), (3, 103)):
+        multiplayer.register_player(
+            chat_id=chat_id, message_id=0, user_name="", user_id=user_id
+        )
+    (game,) = multiplayer.register_pairs()
+    assert {game.myself.player_id, game.opponent.player_id} == {101, 103}
+    assert multiplayer.get_game(1).opponent.chat_id == 3
+
+
+def test_leaderboard():
+    ratings = Ratings()
+    assert "Nobody" in render_leaderboard([], None, None, 0)
+    ratings.record_game(1, 2, 1, names=("Ann", "Bob"))
+    text = render_leaderboard(ratings.top(), ratings.players[2], ratings.rank(2), 2)
+    assert text == (
+        "1. Ann: 1516 (1 games)\n2. Bob: 1484 (1 games)\n\n"
+        "Your rating: 1484, place 2 of 2"
+    )
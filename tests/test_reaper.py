@@ -0,0 +1,65 @@
+"""Tests for timer wheel and reaper of idle games"""
+import asyncio
+
+import pytest
+from tic_tac_toe.reaper import IdleReaper, TimerWheel
+
+
+def test_timer_wheel():
+    """Keys expire at their tick, even after several revolutions"""
+    wheel = TimerWheel(tick=1.0, n_slots=8)
+    wheel.schedule("a", 3.0)
+    wheel.schedule("b", 20.5)  # more than 2 revolutions
+    wheel.schedule("c", 5.0)
+    wheel.cancel("c")
+    assert len(wheel) == 2
+
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert wheel.advance(20.0) == []
+    assert "b" in wheel
+    assert wheel.advance(21.0) == ["b"]
+    assert len(wheel) == 0
+
+    wheel.schedule("late", 0.0)  # deadline in the past expires on the next tick
+    assert wheel.advance(22.0) == ["late"]
+
+
+def test_timer_wheel_many_keys():
+    wheel = TimerWheel(tick=0.5, n_slots=16)
+    for key in range(10_000):
+        wheel.schedule(key, key / 100)
+    expired = wheel.advance(50.0)
+    assert expired == list(range(5001))
+    assert len(wheel) == 10_000 - 5001
+
+
+def test_reaper_collects_idle_games():
+    """Activity postpones expiration, forgotten games are never reaped"""
+    reaper = IdleReaper(timeout=10.0, tick=1.0)
+    start = reaper._wheel._start
+    reaper.touch("idle", now=start)
+    reaper.touch("active", now=start)
+    reaper.touch("finished", now=start)
+    reaper.forget("finished")
+    assert len(reaper) == 2
+
+    reaper.touch("active", now=start + 5)
+    assert reaper.collect(now=start + 10) == ["idle"]
+    assert reaper.collect(now=start + 14) == []
+    assert reaper.collect(now=start + 15) == ["active"]
+    assert len(reaper) == 0
+
+
+@pytest.mark.asyncio
+async def test_reaper_run_once():
+    reaped = []
+
+    async def on_reap(keys):
+        reaped.extend(keys)
+
+    reaper = IdleReaper(timeout=0.0, on_reap=on_reap, tick=0.001)
+    reaper.touch(("singleplayer", 1), now=reaper._wheel._start - 1)
+    await asyncio.sleep(0.01)  # at least one tick
+    assert await reaper.run_once() == 1
+    assert reaped == [("singleplayer", 1)]
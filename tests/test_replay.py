@@ -0,0 +1,129 @@
+"""Tests for recording and replay of updates"""
+import asyncio
+
+import pytest
+from telegram.ext import CommandHandler
+from tic_tac_toe.fake_api import FakeBotApi, callback_update, message_update
+from tic_tac_toe.network import NetworkSettings, application_builder
+from tic_tac_toe.replay import (
+    ANONYMOUS_NAME,
+    Record,
+    ReplayApplication,
+    UpdateRecorder,
+    anonymize,
+    read_records,
+    replay,
+    replay_into_bot,
+)
+
+KEY = b"k" * 16
+
+
+def test_anonymize():
+    update = message_update(1, 42, "my secret")
+    update["message"]["from"]["username"] = "nickname"
+    anonymous = anonymize(update, KEY)
+    message = anonymous["message"]
+    assert message["text"] == ""
+    assert message["from"] == {"id": message["chat"]["id"], "is_bot": False} | {
+        "first_name": ANONYMOUS_NAME
+    }
+    assert message["from"]["id"] != 42
+    assert anonymize(update, KEY) == anonymous  # the same pseudonyms
+    assert anonymize(update, b"x" * 16) != anonymous
+    assert update["message"]["text"] == "my secret"  # a copy is changed
+
+    command = anonymize(message_update(2, 42, "/start"), KEY)["message"]
+    assert command["text"] == "/start"
+    assert command["entities"][0]["type"] == "bot_command"
+    query = anonymize(callback_update(3, 42, "11", message_id=7), KEY)
+    assert query["callback_query"]["data"] == "11"
+    assert query["callback_query"]["message"]["message_id"] == 7
+    assert query["callback_query"]["from"]["id"] == message["from"]["id"]
+
+
+@pytest.mark.asyncio
+async def test_recorder_appends(tmp_path):
+    path = str(tmp_path / "updates.jsonl.gz")
+    updates = [message_update(update_id, 42, "/start") for update_id in (1, 2, 3)]
+    for batch in (updates[:2], updates[2:]):
+        recorder = UpdateRecorder(path, flush_interval=0.01, key=KEY)
+        recorder.start()
+        for update in batch:
+            recorder.record(update)
+        await asyncio.sleep(0.05)
+        await recorder.stop()
+    with open(path, "ab") as file:
+        file.write(b"\x1f\x8b\x08cut by a crash")
+
+    records = list(read_records(path))
+    assert [record.update["update_id"] for record in records] == [1, 2, 3]
+    assert records[0].time <= records[-1].time
+    assert records[0].update == anonymize(updates[0], KEY)
+
+
+@pytest.mark.asyncio
+async def test_replay_measures_handlers():
+    api = FakeBotApi()
+    await api.start()
+    application = (
+        application_builder(api.token, NetworkSettings(base_url=api.base_url))
+        .application_class(ReplayApplication)
+        .build()
+    )
+
+    async def slow(update, context):
+        await asyncio.sleep(0.1)
+        await update.message.reply_text("done")
+
+    async def broken(update, context):
+        raise RuntimeError("bug")
+
+    application.add_handler(CommandHandler("slow", slow, block=False))
+    application.add_handler(CommandHandler("broken", broken, block=False))
+    records = [
+        Record(100.0, message_update(1, 1, "/slow")),
+        Record(100.1, message_update(2, 2, "/broken")),
+        Record(100.2, message_update(3, 3, "/slow")),
+        Record(100.3, message_update(4, 4, "hello")),  # no handler
+    ]
+    try:
+        async with application:
+            await application.start()
+            report = await replay(records, application, api, speed=2)
+            await application.stop()
+    finally:
+        await api.stop()
+    assert report.updates == 4
+    assert report.failed == 1
+    assert report.seconds >= 0.15  # 0.3 s of traffic at 2x
+    assert len(report.latencies) == 4
+    assert 0.1 <= report.percentile(100) < 1
+    assert report.calls == {"getMe": 1, "sendMessage": 2}
+    assert "failed 1 (25.0%)" in report.render()
+
+
+@pytest.mark.asyncio
+async def test_replay_into_bot(tmp_path):
+    path = str(tmp_path / "updates.jsonl.gz")
+    recorder = UpdateRecorder(path)
+    steps = [
+        (message_update, "/start"),
+        (callback_update, "1"),  # singleplayer
+        (callback_update, "1"),  # X
+        (callback_update, "11"),
+        (message_update, "/start"),  # drops the game
+    ]
+    for i, (make_update, text) in enumerate(steps):
+        for user_id in (1, 2):
+            update_id = 10 * user_id + i
+            recorder.record(make_update(update_id, user_id, text), received=6 * i)
+    recorder.flush()
+
+    report = await replay_into_bot(path, speed=10, latency=0.001)
+    assert report.updates == 10
+    assert report.failed == 0
+    assert len(report.latencies) == 10
+    assert report.seconds >= 2.4
+    # a move and a move of the bot, then the game is abandoned, for both users
+    assert report.calls["editMessageText"] == 2 * 5
@@ -0,0 +1,92 @@
+"""Tests for spectators of multiplayer games"""
+import asyncio
+import time
+
+import pytest
+from tic_tac_toe.bot_helpers import render_spectator_message
+from tic_tac_toe.game import CROSS, ZERO, TTTBoard
+from tic_tac_toe.multiplayer import Multiplayer
+from tic_tac_toe.spectators import Spectators, TokenBucket
+
+
+def test_watchers():
+    spectators = Spectators()
+    spectators.watch(1, chat_id=10, message_id=100)
+    spectators.watch(1, chat_id=11, message_id=101)
+    spectators.watch(2, chat_id=10, message_id=102)  # switch to another game
+    assert spectators.watchers(1) == {11: 101}
+    assert spectators.watching(10) == 2
+    assert spectators.unwatch(11) == 1
+    assert spectators.unwatch(11) is None
+    assert spectators.watchers(1) == {}
+
+    spectators.drop_game(2)
+    assert spectators.watching(10) is None
+    assert spectators.publish(2, "board") == 0
+
+
+def test_spectator_message():
+    board = TTTBoard([["X", "O", "."], [".", "X", "."], [".", ".", "."]])
+    names = {CROSS: "Ann", ZERO: "Bob"}
+    assert render_spectator_message(board, names, ZERO) == (
+        "Ann (X) vs Bob (O)\nXO_\n_X_\n___\nNext move: Bob (O)"
+    )
+    board.make_move((2, 2), CROSS)
+    assert render_spectator_message(board, names, ZERO).endswith("Winner: Ann (X)")
+
+
+def test_games_by_id():
+    multiplayer = Multiplayer()
+    for chat_id in range(4):
+        multiplayer.register_player(chat_id=chat_id, message_id=0, user_name="")
+    game1, game2 = multiplayer.register_pairs()
+    assert multiplayer.get_game_by_id(game1.game_id) is multiplayer.games[0]
+    assert [game.game_id for game in multiplayer.live_games(limit=1)] == [game1.game_id]
+    multiplayer.remove_game(0)
+    assert multiplayer.get_game_by_id(game1.game_id) is None
+    assert [game.game_id for game in multiplayer.live_games()] == [game2.game_id]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    bucket = TokenBucket(rate=100, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    # 2 tokens at once, then 4 tokens at 100 per second
+    assert 0.03 < time.monotonic() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_publish_latest_only():
+    """Slow spectators get only the latest board, nobody blocks publish"""
+    sent: list[tuple[int, int, str]] = []
+
+    async def send_edit(chat_id, message_id, text):
+        await asyncio.sleep(0.02 if chat_id == 1 else 0)  # slow spectator
+        if chat_id == 3:
+            raise RuntimeError("message was deleted")
+        sent.append((chat_id, message_id, text))
+
+    spectators = Spectators(send_edit, rate=1000, n_workers=2)
+    for chat_id in (1, 2, 3):
+        spectators.watch(7, chat_id, message_id=chat_id * 10)
+    spectators.start()
+
+    for move in range(5):
+        assert spectators.publish(7, f"board {move}") == 3
+        await asyncio.sleep(0.005)
+    spectators.drop_game(7)  # already published boards are still delivered
+    for _ in range(100):
+        if not len(spectators):
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    await spectators.stop()
+
+    slow = [text for chat_id, _, text in sent if chat_id == 1]
+    fast = [text for chat_id, _, text in sent if chat_id == 2]
+    assert slow[-1] == fast[-1] == "board 4"
+    assert len(slow) < 5  # intermediate boards were skipped
+    assert fast == sorted(fast)
+    assert all(chat_id != 3 for chat_id, _, _ in sent)
@@ -0,0 +1,69 @@
+"""Tests for statistics of players"""
+import random
+
+import pytest
+from tic_tac_toe.bot_helpers import render_stats
+from tic_tac_toe.stats import StatsTable, UserStats
+
+
+def test_counters_match_dict():
+    rng = random.Random(0)
+    table = StatsTable(capacity=8)
+    expected: dict[int, list[int]] = {}
+    for _ in range(20_000):
+        user_id = rng.choice(
+            [rng.randrange(1000), rng.randrange(-(10**12), 10**12)]
+        )
+        score, moves = rng.choice([0, 0.5, 1]), rng.randrange(5, 10)
+        assert table.record(user_id, score, moves)
+        counters = expected.setdefault(user_id, [0, 0, 0, 0])
+        counters[{1: 0, 0.5: 1, 0: 2}[score]] += 1
+        counters[3] += moves
+
+    assert len(table) == len(expected)
+    assert len(table) <= table.capacity // 2
+    for user_id, counters in expected.items():
+        assert table.get(user_id) == UserStats(*counters)
+    assert table.get(10**13) is None
+
+
+def test_bounded():
+    table = StatsTable(capacity=4, max_users=3)
+    for user_id in range(5):
+        table.record(user_id, 1, 5)
+    assert len(table) == 3
+    assert table.get(4) is None
+    assert table.record(0, 0, 7)  # known users are still counted
+    assert table.get(0) == UserStats(1, 0, 1, 12)
+
+
+def test_snapshot(tmp_path):
+    path = str(tmp_path / "stats.npz")
+    table = StatsTable(path=path)
+    for user_id in range(3000):
+        table.record(user_id, 0.5, user_id % 9)
+    assert table.save() == 3000
+
+    loaded = StatsTable(capacity=2)
+    assert loaded.load(path) == 3000
+    assert loaded.get(2999) == UserStats(0, 1, 0, 2999 % 9)
+    assert StatsTable().load(str(tmp_path / "missing.npz")) == 0
+
+
+@pytest.mark.asyncio
+async def test_snapshot_on_stop(tmp_path):
+    path = str(tmp_path / "stats.npz")
+    table = StatsTable(path=path, snapshot_interval=60)
+    table.start()
+    table.record(1, 1, 5)
+    await table.stop()
+    loaded = StatsTable(path=path)
+    loaded.load()
+    assert loaded.get(1) == UserStats(1, 0, 0, 5)
+
+
+def test_render_stats():
+    assert render_stats(None) == "You haven't finished any game yet"
+    assert render_stats(UserStats(2, 1, 1, 30)) == (
+        "Games: 4\nWins: 2, draws: 1, losses: 1\nAverage length: 7.5 moves"
+    )
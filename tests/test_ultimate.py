@@ -0,0 +1,124 @@
+"""Tests for Ultimate tic tac toe"""
+import random
+
+import pytest
+from tic_tac_toe.exceptions import GameRulesError, InvalidMoveError
+from tic_tac_toe.game import CROSS, FREE_SPACE, ZERO, GameConductor
+from tic_tac_toe.ultimate import (
+    WIN_SCORE,
+    UltimateBoard,
+    search_ultimate,
+    search_ultimate_with_rust,
+)
+
+
+def random_board(n_moves: int, seed: int) -> UltimateBoard:
+    rng = random.Random(seed)
+    board = UltimateBoard()
+    for _ in range(n_moves):
+        if board.is_game_over():
+            break
+        board.play(*rng.choice(board.legal_moves()), board.side_to_move)
+    return board
+
+
+def test_next_board():
+    board = UltimateBoard()
+    assert len(board.legal_moves()) == 81
+    board.make_move((4, 2), CROSS)
+    assert board.next_board == 2
+    assert board.legal_moves() == [(2, cell) for cell in range(9)]
+    with pytest.raises(InvalidMoveError):
+        board.make_move((4, 0), ZERO)
+    board.make_move((2, 4), ZERO)
+    with pytest.raises(InvalidMoveError):
+        board.make_move((4, 2), CROSS)  # taken
+    assert board.select_cell((2, 4)) == ZERO
+    assert board.select_cell((2, 5)) == FREE_SPACE
+
+
+def test_closed_board_gives_free_choice():
+    board = UltimateBoard()
+    board.cells[0][0] = 0b000_000_011  # X has two in a row in board 0
+    board.next_board = 0
+    board.play(0, 2, side=0)
+    assert board.board_state(0) == CROSS
+    assert board.next_board == 2
+    board.play(2, 0, side=1)  # O sends X to the closed board 0
+    assert board.next_board is None
+    assert {sub for sub, _ in board.legal_moves()} == set(range(1, 9))
+    with pytest.raises(InvalidMoveError):
+        board.make_move((0, 5), CROSS)
+    board.make_move((7, 5), CROSS)
+    assert board.next_board == 5
+
+
+def test_meta_win_and_undo():
+    board = UltimateBoard()
+    # crosses in cells 0, 4, 8 of sub-boards 0, 1, 2, zeros fill other boards
+    board.cells[0][:3] = [0b100_010_001] * 3
+    board.cells[1][3] = 0b000_000_111
+    board.won = [0b000_000_011, 0b000_001_000]
+    board.closed = 0b000_001_011
+    board.next_board = None
+    assert board.get_winner() is None
+    board.cells[0][2] = 0b000_010_001
+    result = search_ultimate(board, time_limit=5, max_depth=2)
+    assert result.move == (2, 8)
+    assert result.score > WIN_SCORE - 100
+    assert board.cells[0][2] == 0b000_010_001  # restored after search
+
+    board.make_move((2, 8), CROSS)
+    assert board.get_winner() == CROSS
+    assert board.is_game_over()
+    with pytest.raises(GameRulesError):
+        board.make_move((5, 5), ZERO)
+    board.undo()
+    assert board.get_winner() is None
+    assert board.board_state(2) is None
+
+
+def test_conductor():
+    gc = GameConductor(UltimateBoard)
+    cross, zero = gc.get_handle(CROSS), gc.get_handle(ZERO)
+    cross((4, 4))
+    with pytest.raises(InvalidMoveError):
+        cross((4, 0))  # not your turn
+    zero((4, 0))
+    gc.reset()
+    assert gc.game_board.n_moves == 0
+    assert len(gc.game_board.legal_moves()) == 81
+
+
+def test_random_games_and_undo():
+    empty = str(UltimateBoard())
+    for seed in range(20):
+        board = random_board(81, seed)
+        assert board.is_game_over()
+        assert not board.legal_moves()
+        while board.n_moves:
+            board.undo()
+        assert str(board) == empty
+        assert board.won == [0, 0] and board.closed == 0
+
+
+def test_rust_agrees_with_python():
+    for seed in range(5):
+        board = random_board(n_moves=10 + 5 * seed, seed=seed)
+        if board.is_game_over():
+            continue
+        expected = search_ultimate(board, time_limit=60, max_depth=3)
+        result = search_ultimate_with_rust(board, time_limit=60, max_depth=3)
+        assert (result.move, result.score, result.depth, result.nodes) == (
+            expected.move,
+            expected.score,
+            expected.depth,
+            expected.nodes,
+        )
+
+
+@pytest.mark.rust
+@pytest.mark.parametrize("time_limit", [-1.0, float("nan"), float("inf"), 1e300])
+def test_rust_rejects_bad_time_limit(time_limit):
+    with pytest.raises(ValueError):
+        search_ultimate_with_rust(UltimateBoard(), time_limit=time_limit)